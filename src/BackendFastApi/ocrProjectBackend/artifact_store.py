@@ -0,0 +1,163 @@
+"""
+导出文件存储
+
+识别结果导出的文件统一保存在这里，按保留时间（TTL）和总容量淘汰，
+后台清理任务定期删除过期文件，保证磁盘占用在持续负载下保持稳定。
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# 存储配置（可通过环境变量覆盖）
+OCR_ARTIFACT_TTL = int(os.getenv("OCR_ARTIFACT_TTL", 3600))  # 文件保留的秒数
+OCR_ARTIFACT_MAX_MB = int(os.getenv("OCR_ARTIFACT_MAX_MB", 1024))
+OCR_ARTIFACT_MAX_FILES = int(os.getenv("OCR_ARTIFACT_MAX_FILES", 10000))
+OCR_SWEEP_INTERVAL = int(os.getenv("OCR_SWEEP_INTERVAL", 60))  # 后台清理间隔（秒）
+
+
+class ArtifactStore:
+    """
+    有容量上限的导出文件目录
+    写入时超过容量立即淘汰最旧的文件，过期文件由sweep()删除
+    :param root_dir: 存储目录
+    :param ttl: 文件保留的秒数
+    :param max_bytes: 总字节数上限
+    :param max_files: 文件数上限
+    """
+
+    def __init__(self, root_dir, ttl=OCR_ARTIFACT_TTL, max_bytes=OCR_ARTIFACT_MAX_MB * 1024 * 1024,
+                 max_files=OCR_ARTIFACT_MAX_FILES):
+        self.root_dir = root_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_files = max(1, max_files)
+        # 文件名 -> (创建时间, 字节数)，按创建时间排序
+        self._files = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._expired = 0
+        self._evicted = 0
+        self._last_sweep = None
+        os.makedirs(self.root_dir, exist_ok=True)
+        self._adopt_existing()
+
+    def path(self, name):
+        return os.path.join(self.root_dir, os.path.basename(name))
+
+    def _adopt_existing(self):
+        """
+        接管上次运行留下的文件，按修改时间计入容量和过期判断
+        """
+        entries = []
+        with os.scandir(self.root_dir) as it:
+            for entry in it:
+                if entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name, stat.st_size))
+        entries.sort()
+        with self._lock:
+            for mtime, name, size in entries:
+                self._files[name] = (mtime, size)
+                self._bytes += size
+        if entries:
+            logger.info(f"Adopted {len(entries)} existing artifacts in {self.root_dir}")
+
+    def save(self, name, writer, *args):
+        """
+        写入一个导出文件并登记，超过容量时淘汰最旧的文件
+        :param name: 文件名
+        :param writer: 写文件的函数，参数为 (*args, 文件路径)，返回文件路径
+        :return: 文件路径
+        """
+        path = writer(*args, self.path(name))
+        self.add(path)
+        return path
+
+    def add(self, path):
+        """
+        登记已经写入存储目录的文件
+        """
+        name = os.path.basename(path)
+        size = os.path.getsize(path)
+        with self._lock:
+            old = self._files.pop(name, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._files[name] = (time.time(), size)
+            self._bytes += size
+            victims = self._pop_over_capacity()
+        self._remove(victims)
+
+    def _pop_over_capacity(self):
+        victims = []
+        while self._files and (self._bytes > self.max_bytes or len(self._files) > self.max_files):
+            name, (_, size) = self._files.popitem(last=False)
+            self._bytes -= size
+            victims.append(name)
+        self._evicted += len(victims)
+        return victims
+
+    def _remove(self, names):
+        for name in names:
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Failed to remove artifact {name}: {e}")
+
+    def sweep(self):
+        """
+        删除过期文件
+        :return: 删除的文件数
+        """
+        deadline = time.time() - self.ttl
+        expired = []
+        with self._lock:
+            # 按创建时间排序，遇到第一个未过期的文件即可停止
+            while self._files:
+                name, (created_at, size) = next(iter(self._files.items()))
+                if created_at >= deadline:
+                    break
+                self._files.popitem(last=False)
+                self._bytes -= size
+                expired.append(name)
+            self._expired += len(expired)
+            self._last_sweep = time.time()
+        self._remove(expired)
+        if expired:
+            logger.info(f"Removed {len(expired)} expired artifacts")
+        return len(expired)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "files": len(self._files),
+                "bytes": self._bytes,
+                "max_files": self.max_files,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "expired_total": self._expired,
+                "evicted_total": self._evicted,
+                "last_sweep": self._last_sweep,
+            }
+
+
+async def run_sweeper(interval, *sweeps):
+    """
+    后台定期执行清理函数，直到任务被取消
+    :param interval: 清理间隔（秒）
+    :param sweeps: 同步的清理函数，在线程中执行
+    """
+    while True:
+        for sweep in sweeps:
+            try:
+                await asyncio.to_thread(sweep)
+            except Exception as e:
+                logger.error(f"Cleanup task failed: {e}")
+        await asyncio.sleep(interval)
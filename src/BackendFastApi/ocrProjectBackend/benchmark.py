@@ -0,0 +1,441 @@
+"""
+性能基准测试
+
+在本地生成合成测试图片（多种语言、尺寸和噪声强度），在进程内以指定并发度调用
+transform.py 或 FastAPI 应用，统计吞吐量（页/秒）、p50/p95/p99延迟和峰值内存。
+语料由随机种子确定，相同参数每次生成的图片完全相同；结果保存为JSON，可以与之前的结果对比。
+
+用法:
+    python benchmark.py --target transform --concurrency 4
+    python benchmark.py --target api --concurrency 8 --output result.json --compare baseline.json
+"""
+import argparse
+import asyncio
+import difflib
+import hashlib
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# 基准测试默认不使用结果缓存，否则重复运行测得的是缓存命中
+if '--use-cache' not in sys.argv:
+    # 直接覆盖，继承的环境变量不能让冷启动测试命中缓存
+    os.environ["OCR_CACHE_SIZE"] = "0"
+    os.environ["OCR_CACHE_DIR"] = ""
+    os.environ["OCR_CACHE_DB"] = ""
+
+import transform
+from exporters import PDF_FONT_CANDIDATES
+from preprocess import parse_stages
+
+# 各语言的样例文本
+SAMPLE_TEXTS = {
+    'eng': [
+        "The quick brown fox jumps over the lazy dog.",
+        "Optical character recognition converts images of text into machine-encoded text.",
+        "Invoice number 20431 was paid on 12 March 2024.",
+        "Please keep this receipt for your records.",
+    ],
+    'chi_sim': [
+        "光学字符识别是将图片中的文字转换为可编辑文本的技术。",
+        "今天天气很好，我们去公园散步吧。",
+        "发票号码二零四三一已于三月十二日付款。",
+        "请妥善保管本收据以备查询。",
+    ],
+    'rus': [
+        "Съешь же ещё этих мягких французских булок, да выпей чаю.",
+        "Оптическое распознавание символов преобразует изображения в текст.",
+        "Счёт номер 20431 оплачен двенадцатого марта.",
+    ],
+    'deu': [
+        "Zwölf Boxkämpfer jagen Viktor quer über den großen Sylter Deich.",
+        "Die Rechnung Nummer 20431 wurde am 12. März bezahlt.",
+    ],
+}
+
+# 页面尺寸：(宽英寸, 高英寸, DPI)
+PAGE_SIZES = {
+    'receipt': (3.0, 6.0, 200),
+    'a5_150': (5.8, 8.3, 150),
+    'a4_300': (8.27, 11.69, 300),
+}
+
+# 正文字号（磅）
+FONT_POINTS = 11
+PAGE_MARGIN_INCH = 0.5
+
+
+@dataclass
+class Document:
+    """一张合成测试图片"""
+    name: str
+    lang: str
+    size: str
+    noise: float
+    data: bytes
+    text: str
+
+
+def _load_font(lang, pixel_size):
+    """
+    查找能显示该语言文字的字体，中日韩文字需要CJK字体
+    """
+    for path in PDF_FONT_CANDIDATES:
+        if not path or not os.path.exists(path):
+            continue
+        if lang in ('chi_sim', 'jpn', 'kor') and 'DejaVu' in path:
+            continue
+        try:
+            return ImageFont.truetype(path, pixel_size)
+        except OSError:
+            continue
+    return None
+
+
+def _wrap(draw, text, font, max_width):
+    lines = []
+    for paragraph in text.split('\n'):
+        # 中文没有空格，按字符换行
+        tokens = paragraph.split(' ') if ' ' in paragraph else list(paragraph)
+        separator = ' ' if ' ' in paragraph else ''
+        line = ''
+        for token in tokens:
+            candidate = f"{line}{separator}{token}" if line else token
+            if line and draw.textlength(candidate, font=font) > max_width:
+                lines.append(line)
+                line = token
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+
+def render_page(lang, size, noise, rng):
+    """
+    渲染一页合成文档
+    :param noise: 高斯噪声标准差（相对于255的比例）
+    :return: tuple (PNG字节, 页面上的文本)
+    """
+    width_inch, height_inch, dpi = PAGE_SIZES[size]
+    width, height = int(width_inch * dpi), int(height_inch * dpi)
+    font = _load_font(lang, max(8, int(FONT_POINTS * dpi / 72)))
+
+    image = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    margin = int(PAGE_MARGIN_INCH * dpi)
+    line_height = int(font.size * 1.6)
+    max_lines = max(1, (height - 2 * margin) // line_height)
+
+    sentences = SAMPLE_TEXTS[lang]
+    lines = []
+    while len(lines) < max_lines:
+        paragraph = ' '.join(rng.choice(sentences) for _ in range(3)) if lang != 'chi_sim' else ''.join(
+            rng.choice(sentences) for _ in range(3))
+        lines.extend(_wrap(draw, paragraph, font, width - 2 * margin))
+        lines.append('')
+    lines = lines[:max_lines]
+    for i, line in enumerate(lines):
+        draw.text((margin, margin + i * line_height), line, fill=0, font=font)
+
+    if noise > 0:
+        pixels = np.asarray(image, dtype=np.float32)
+        noise_rng = np.random.default_rng(rng.randrange(2 ** 32))
+        pixels = pixels + noise_rng.normal(0.0, noise * 255, pixels.shape)
+        image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), mode='L')
+
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', dpi=(dpi, dpi))
+    return buffer.getvalue(), '\n'.join(line for line in lines if line)
+
+
+def generate_corpus(seed, languages, sizes, noise_levels, per_combination):
+    """
+    按参数组合生成测试语料，相同参数的结果完全相同
+    :return: Document列表
+    """
+    rng = random.Random(seed)
+    documents = []
+    for lang in languages:
+        if _load_font(lang, FONT_POINTS) is None:
+            print(f"Skipping {lang}: no font available for this language", file=sys.stderr)
+            continue
+        for size in sizes:
+            for noise in noise_levels:
+                for index in range(per_combination):
+                    data, text = render_page(lang, size, noise, rng)
+                    documents.append(Document(f"{lang}-{size}-n{noise:g}-{index}.png", lang, size, noise, data, text))
+    return documents
+
+
+def corpus_digest(documents):
+    digest = hashlib.sha256()
+    for document in documents:
+        digest.update(document.name.encode('utf-8'))
+        digest.update(document.data)
+    return digest.hexdigest()[:16]
+
+
+def percentile(values, q):
+    """
+    线性插值的分位数
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def similarity(expected, actual):
+    """
+    识别结果与原文的字符相似度（忽略空白）
+    """
+    expected = ''.join(expected.split())
+    actual = ''.join((actual or '').split())
+    if not expected:
+        return 1.0 if not actual else 0.0
+    return difflib.SequenceMatcher(None, expected, actual, autojunk=False).ratio()
+
+
+def peak_rss_mb():
+    """
+    :return: tuple (本进程峰值RSS, 子进程峰值RSS)，单位MB
+    """
+    # Linux上ru_maxrss的单位是KB，macOS上是字节
+    unit = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit
+    return round(own, 1), round(children, 1)
+
+
+def _ocr_document(data, lang, stages):
+    start_time = time.perf_counter()
+    if lang == 'auto':
+        text, _ = transform.auto_detect_and_ocr(data, preprocess=stages)
+    else:
+        text, _ = transform.extract_text_with_tesseract(data, lang, preprocess=stages)
+    # 这两个函数出错时返回None而不抛出异常，必须计为错误，否则失败的页面会被算进吞吐量
+    if text is None:
+        raise RuntimeError("OCR failed")
+    return text, time.perf_counter() - start_time
+
+
+def run_transform(documents, concurrency, pool_kind, stages, lang_override):
+    """
+    直接调用transform的识别函数，识别出错的文档计为错误
+    :return: [(文档, 识别文本, 延迟秒数, 错误信息)]
+    """
+    executor_class = ProcessPoolExecutor if pool_kind == 'process' else ThreadPoolExecutor
+    with executor_class(max_workers=concurrency) as executor:
+        futures = [
+            (document, executor.submit(_ocr_document, document.data, lang_override or document.lang, stages))
+            for document in documents
+        ]
+        results = []
+        for document, future in futures:
+            try:
+                text, latency = future.result()
+                results.append((document, text, latency, None))
+            except Exception as e:
+                results.append((document, '', 0.0, str(e)))
+    return results
+
+
+async def run_api(documents, concurrency, preprocess, lang_override, output_format):
+    """
+    通过httpx的ASGI传输在进程内调用 /api/ocr，包括上传解析、工作池和响应生成的完整路径
+    """
+    import httpx
+    import main
+
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+
+            async def send(document):
+                form = {"lang": lang_override or document.lang, "output_format": output_format}
+                if preprocess:
+                    form["preprocess"] = preprocess
+                async with semaphore:
+                    start_time = time.perf_counter()
+                    response = await client.post(
+                        "/api/ocr", data=form, files={"file": (document.name, document.data, "image/png")})
+                    latency = time.perf_counter() - start_time
+                if response.status_code != 200:
+                    return document, '', latency, f"HTTP {response.status_code}"
+                text = response.json().get("text", '') if output_format == 'text' else ''
+                return document, text, latency, None
+
+            results = await asyncio.gather(*(send(document) for document in documents))
+    return list(results)
+
+
+def summarize(results, wall_time, measure_accuracy):
+    latencies = [latency for _, _, latency, error in results if error is None]
+    ok = len(latencies)
+    summary = {
+        "requests": len(results),
+        "errors": len(results) - ok,
+        "wall_time": round(wall_time, 3),
+        "pages_per_sec": round(ok / wall_time, 3) if wall_time > 0 else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / ok * 1000, 1) if ok else 0.0,
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+            "max": round(max(latencies) * 1000, 1) if ok else 0.0,
+        },
+    }
+    own_rss, children_rss = peak_rss_mb()
+    summary["peak_rss_mb"] = own_rss
+    summary["peak_rss_children_mb"] = children_rss
+    if measure_accuracy:
+        scores = [similarity(document.text, text) for document, text, _, error in results if error is None]
+        summary["accuracy"] = round(sum(scores) / len(scores), 4) if scores else 0.0
+    errors = sorted({error for _, _, _, error in results if error})
+    if errors:
+        summary["error_samples"] = errors[:5]
+    return summary
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    from ocr_engine import OCR_ENGINE
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "tesseract_version": transform.get_tesseract_version(),
+        "ocr_engine": OCR_ENGINE,
+        "git_commit": commit,
+    }
+
+
+def compare(report, baseline):
+    """
+    打印与基线结果的对比
+    """
+    if baseline.get("corpus", {}).get("digest") != report["corpus"]["digest"]:
+        print("WARNING: corpus differs from baseline, results are not directly comparable")
+    current, previous = report["results"], baseline.get("results", {})
+    rows = [
+        ("pages/sec", current["pages_per_sec"], previous.get("pages_per_sec")),
+        ("p50 ms", current["latency_ms"]["p50"], previous.get("latency_ms", {}).get("p50")),
+        ("p95 ms", current["latency_ms"]["p95"], previous.get("latency_ms", {}).get("p95")),
+        ("p99 ms", current["latency_ms"]["p99"], previous.get("latency_ms", {}).get("p99")),
+        ("peak RSS MB", current["peak_rss_mb"], previous.get("peak_rss_mb")),
+    ]
+    print(f"{'metric':<14}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, value, base in rows:
+        change = f"{(value - base) / base * 100:+.1f}%" if base else "n/a"
+        print(f"{name:<14}{base if base is not None else '-':>12}{value:>12}{change:>10}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="OCR performance benchmark")
+    parser.add_argument("--target", choices=("transform", "api"), default="transform",
+                        help="transform: call the transform OCR functions directly; api: drive the FastAPI app in-process")
+    parser.add_argument("--concurrency", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--pool", choices=("thread", "process"), default="thread",
+                        help="executor used by --target transform")
+    parser.add_argument("--languages", default="eng,chi_sim,rus", help="comma-separated: " + ",".join(SAMPLE_TEXTS))
+    parser.add_argument("--sizes", default="receipt,a5_150", help="comma-separated: " + ",".join(PAGE_SIZES))
+    parser.add_argument("--noise", default="0,0.08", help="comma-separated gaussian noise levels (fraction of 255)")
+    parser.add_argument("--per-combination", type=int, default=2, help="documents per language/size/noise")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--repeat", type=int, default=1, help="run the corpus this many times")
+    parser.add_argument("--warmup", type=int, default=2, help="documents processed before measuring")
+    parser.add_argument("--lang", default=None, help="override the language sent with every document (e.g. auto)")
+    parser.add_argument("--preprocess", default="", help="preprocessing stages or preset")
+    parser.add_argument("--output-format", default="text", help="output_format for --target api")
+    parser.add_argument("--use-cache", action="store_true", help="keep the OCR result cache enabled")
+    parser.add_argument("--corpus-dir", default=None, help="also write the generated images here")
+    parser.add_argument("--output", default=None, help="write the JSON report to this file")
+    parser.add_argument("--compare", default=None, help="baseline JSON report to compare against")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    languages = [lang.strip() for lang in args.languages.split(',') if lang.strip()]
+    unknown = [lang for lang in languages if lang not in SAMPLE_TEXTS]
+    if unknown:
+        raise SystemExit(f"Unknown languages: {', '.join(unknown)}")
+    sizes = [size.strip() for size in args.sizes.split(',') if size.strip()]
+    unknown = [size for size in sizes if size not in PAGE_SIZES]
+    if unknown:
+        raise SystemExit(f"Unknown sizes: {', '.join(unknown)}")
+    noise_levels = [float(level) for level in args.noise.split(',') if level.strip()]
+    stages = parse_stages(args.preprocess)
+    if args.target == 'api':
+        try:
+            import httpx
+        except ImportError:
+            raise SystemExit("--target api requires httpx (pip install httpx)")
+    # 没有Tesseract时每页都会失败，测得的只是出错的速度
+    if transform.get_tesseract_version() is None:
+        raise SystemExit("Tesseract is not available, install tesseract-ocr before benchmarking")
+
+    documents = generate_corpus(args.seed, languages, sizes, noise_levels, args.per_combination)
+    if not documents:
+        raise SystemExit("No documents generated")
+    if args.corpus_dir:
+        os.makedirs(args.corpus_dir, exist_ok=True)
+        for document in documents:
+            with open(os.path.join(args.corpus_dir, document.name), 'wb') as f:
+                f.write(document.data)
+    print(f"Corpus: {len(documents)} documents, digest {corpus_digest(documents)}")
+
+    def run(batch):
+        if args.target == 'api':
+            return asyncio.run(run_api(batch, args.concurrency, args.preprocess, args.lang, args.output_format))
+        return run_transform(batch, args.concurrency, args.pool, stages, args.lang)
+
+    if args.warmup:
+        run(documents[:args.warmup])
+
+    workload = documents * max(1, args.repeat)
+    start_time = time.perf_counter()
+    results = run(workload)
+    wall_time = time.perf_counter() - start_time
+
+    report = {
+        "environment": environment(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "corpus_dir")},
+        "corpus": {"documents": len(documents), "pages": len(workload), "digest": corpus_digest(documents)},
+        "results": summarize(results, wall_time, measure_accuracy=args.target == 'transform' or args.output_format == 'text'),
+    }
+    print(json.dumps(report["results"], indent=2, ensure_ascii=False))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(report, json.load(f))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""
+离线批量识别
+
+不经过Web服务，直接用进程池调用transform.py识别整个目录或文件列表，适合回填大量历史扫描件。
+- 结果写在输入文件旁边，或按相对路径写入指定目录（文件名为原文件名加扩展名，如 scan.jpg.txt）
+- 每处理完一个文件在清单（JSONL）中追加一行，中断后重新运行会跳过已完成且未修改的文件
+- 定期打印进度和吞吐量（文件/秒、页/秒）
+
+用法:
+    python bulk_ocr.py /data/scans --output-dir /data/ocr --formats text,pdf --lang auto
+    python bulk_ocr.py --file-list files.txt --workers 8
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# 每个工作进程只用一个Tesseract线程，并行度由进程数决定
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+import transform
+from preprocess import parse_stages
+
+logger = logging.getLogger(__name__)
+
+# 支持的输入文件类型，与Web服务一致
+INPUT_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.pdf')
+# 输出格式 -> (文件扩展名, 写文件的函数)
+OUTPUT_WRITERS = {
+    'text': ('txt', transform.save_to_text),
+    'word': ('docx', transform.save_to_word),
+    'pdf': ('pdf', transform.save_to_pdf),
+}
+MANIFEST_NAME = 'ocr_manifest.jsonl'
+
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+def is_output_file(path):
+    """
+    是否为本工具生成的文件：输出文件（如 scan.jpg.pdf）或写了一半的临时文件
+    输出默认写在输入旁边，重新运行时不能把它们当作新的输入
+    """
+    stem, extension = os.path.splitext(path)
+    if extension.lower() == '.part':
+        return True
+    output_extensions = {f".{ext}" for ext, _ in OUTPUT_WRITERS.values()}
+    return extension.lower() in output_extensions and os.path.splitext(stem)[1].lower() in INPUT_EXTENSIONS
+
+
+def iter_inputs(paths, file_list=None, exclude=()):
+    """
+    展开输入：目录递归查找支持的文件（按路径排序），文件直接使用；跳过本工具的输出文件
+    :param paths: 文件或目录路径
+    :param file_list: 每行一个路径的文本文件，'-'表示标准输入
+    :param exclude: 需要跳过的文件绝对路径（如清单文件）
+    :return: 生成 tuple (文件绝对路径, 计算输出相对路径用的根目录)
+    """
+    listed = []
+    if file_list:
+        f = sys.stdin if file_list == '-' else open(file_list, 'r', encoding='utf-8')
+        try:
+            listed = [line.strip() for line in f if line.strip()]
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+    def skipped(file_path):
+        return file_path in exclude or is_output_file(file_path)
+
+    for path in list(paths) + listed:
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    file_path = os.path.join(root, name)
+                    if os.path.splitext(name)[1].lower() in INPUT_EXTENSIONS and not skipped(file_path):
+                        yield file_path, path
+        elif os.path.isfile(path):
+            if not skipped(path):
+                yield path, os.path.dirname(path)
+        else:
+            logger.warning(f"Input not found: {path}")
+
+
+def output_paths(path, root, output_dir, formats):
+    """
+    计算各输出格式的文件路径
+    :return: {格式: 输出路径}
+    """
+    base = os.path.join(output_dir, os.path.relpath(path, root)) if output_dir else path
+    return {fmt: f"{base}.{OUTPUT_WRITERS[fmt][0]}" for fmt in formats}
+
+
+class Manifest:
+    """
+    追加写入的JSONL进度清单，同一文件以最后一条记录为准
+    文件大小或修改时间变化、请求的输出（格式或目录）不同或输出文件被删除后，需要重新识别
+    :param path: 清单文件路径
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        torn = False
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    torn = not line.endswith("\n")
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 中断时可能留下写了一半的最后一行
+                        continue
+                    self.entries[entry["path"]] = entry
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+        if torn:
+            # 结束写了一半的行，新记录从下一行开始
+            self._file.write("\n")
+
+    def is_done(self, path, outputs):
+        """
+        :param outputs: 本次运行请求的输出 {格式: 输出路径}
+        """
+        entry = self.entries.get(path)
+        if entry is None or entry["status"] != STATUS_DONE:
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime:
+            return False
+        recorded = entry.get("outputs") or {}
+        return all(recorded.get(fmt) == output_path and os.path.exists(output_path)
+                   for fmt, output_path in outputs.items())
+
+    def record(self, entry):
+        self.entries[entry["path"]] = entry
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def _init_worker():
+    # Ctrl+C只由主进程处理：停止提交新文件，等待正在识别的文件完成
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def process_file(path, outputs, lang, preprocess):
+    """
+    在工作进程中识别一个文件并写出结果，先写临时文件再改名，中断时不会留下不完整的输出
+    :param outputs: {格式: 输出路径}
+    :return: 清单记录
+    """
+    start_time = time.time()
+    stat = os.stat(path)
+    entry = {"path": path, "size": stat.st_size, "mtime": stat.st_mtime, "lang": lang}
+    try:
+        pages = transform.count_pages(path)
+        if pages > 1:
+            text, used_lang = transform.ocr_document(path, lang, preprocess=preprocess)
+        elif lang == 'auto':
+            text, used_lang = transform.auto_detect_and_ocr(path, preprocess=preprocess)
+        else:
+            used_lang = transform.get_tesseract_lang(lang)
+            text, _ = transform.extract_text_with_tesseract(path, used_lang, preprocess=preprocess)
+        # None表示识别出错；空白页得到空文本，同样写出结果并记为完成
+        if text is None:
+            raise RuntimeError("OCR failed")
+
+        for fmt, output_path in outputs.items():
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            partial_path = f"{output_path}.part"
+            OUTPUT_WRITERS[fmt][1](text, partial_path)
+            os.replace(partial_path, output_path)
+        entry.update(status=STATUS_DONE, pages=pages, detected_lang=used_lang, chars=len(text), outputs=outputs)
+    except Exception as e:
+        entry.update(status=STATUS_FAILED, error=f"{type(e).__name__}: {e}")
+    entry["seconds"] = round(time.time() - start_time, 3)
+    entry["finished_at"] = time.time()
+    return entry
+
+
+class Progress:
+    """
+    统计并定期打印进度和吞吐量
+    :param total: 需要处理的文件数
+    :param interval: 打印间隔（秒）
+    """
+
+    def __init__(self, total, interval):
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self.pages = 0
+        self.interrupted = False
+        self.start_time = time.time()
+        self._last_report = self.start_time
+
+    def update(self, entry):
+        if entry["status"] == STATUS_DONE:
+            self.done += 1
+            self.pages += entry.get("pages", 1)
+        else:
+            self.failed += 1
+            logger.warning(f"Failed: {entry['path']}: {entry.get('error')}")
+
+    def line(self):
+        elapsed = max(time.time() - self.start_time, 1e-6)
+        finished = self.done + self.failed
+        rate = finished / elapsed
+        eta = (self.total - finished) / rate if rate > 0 else 0.0
+        return (f"{finished}/{self.total} files ({self.failed} failed), {self.pages} pages, "
+                f"{rate:.2f} files/s, {self.pages / elapsed:.2f} pages/s, "
+                f"elapsed {elapsed:.0f}s, ETA {eta:.0f}s")
+
+    def maybe_report(self):
+        now = time.time()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            print(self.line(), flush=True)
+
+
+def run(todo, args, manifest):
+    """
+    用进程池处理文件，提交数量限制在工作者数量的几倍，文件列表再长内存占用也不变
+    :return: Progress
+    """
+    progress = Progress(len(todo), args.progress_interval)
+    window = args.workers * 4
+    items = iter(todo)
+    pending = set()
+
+    def collect(futures):
+        for future in futures:
+            if future.cancelled():
+                continue
+            try:
+                entry = future.result()
+            except Exception as e:
+                # 工作进程异常退出（如内存不足被结束）
+                path = future_paths[future]
+                entry = {"path": path, "status": STATUS_FAILED, "error": f"{type(e).__name__}: {e}"}
+            manifest.record(entry)
+            progress.update(entry)
+
+    future_paths = {}
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as executor:
+        try:
+            while True:
+                while len(pending) < window:
+                    item = next(items, None)
+                    if item is None:
+                        break
+                    path, outputs = item
+                    future = executor.submit(process_file, path, outputs, args.lang, args.stages)
+                    future_paths[future] = path
+                    pending.add(future)
+                if not pending:
+                    break
+                done, pending = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+                collect(done)
+                for future in done:
+                    future_paths.pop(future, None)
+                progress.maybe_report()
+        except KeyboardInterrupt:
+            print("Interrupted, waiting for files in progress (rerun to resume)...", flush=True)
+            progress.interrupted = True
+            for future in pending:
+                future.cancel()
+            collect(wait(pending)[0])
+    return progress
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk OCR of directories or file lists without the web service")
+    parser.add_argument("inputs", nargs="*", help="files or directories (searched recursively)")
+    parser.add_argument("--file-list", default=None, help="text file with one input path per line ('-' for stdin)")
+    parser.add_argument("--output-dir", default=None,
+                        help="write outputs here, mirroring the input tree (default: next to each input)")
+    parser.add_argument("--formats", default="text", help="comma-separated: " + ",".join(OUTPUT_WRITERS))
+    parser.add_argument("--lang", default="eng", help="recognition language, or 'auto' to detect per document")
+    parser.add_argument("--preprocess", default=None, help="preprocessing stages or preset (default: OCR_PREPROCESS)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="number of OCR processes")
+    parser.add_argument("--manifest", default=None,
+                        help=f"progress manifest (default: {MANIFEST_NAME} in the output directory or current directory)")
+    parser.add_argument("--progress-interval", type=float, default=10.0, help="seconds between progress lines")
+    parser.add_argument("--verbose", action="store_true", help="show per-file OCR logs")
+    args = parser.parse_args(argv)
+    if not args.inputs and not args.file_list:
+        parser.error("no inputs given")
+    args.formats = [fmt.strip() for fmt in args.formats.split(',') if fmt.strip()]
+    unknown = [fmt for fmt in args.formats if fmt not in OUTPUT_WRITERS]
+    if unknown or not args.formats:
+        parser.error(f"unknown output formats: {', '.join(unknown) or '(none)'}")
+    try:
+        args.stages = parse_stages(args.preprocess)
+    except ValueError as e:
+        parser.error(str(e))
+    args.workers = max(1, args.workers)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # transform.py导入时已按INFO级别配置日志，这里覆盖为命令行指定的级别
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, force=True)
+    manifest = Manifest(args.manifest or os.path.join(args.output_dir or '.', MANIFEST_NAME))
+
+    inputs = [(path, output_paths(path, root, args.output_dir, args.formats))
+              for path, root in iter_inputs(args.inputs, args.file_list, exclude={os.path.abspath(manifest.path)})]
+    todo = [(path, outputs) for path, outputs in inputs if not manifest.is_done(path, outputs)]
+    print(f"{len(inputs)} files found, {len(inputs) - len(todo)} already done, {len(todo)} to process "
+          f"with {args.workers} workers", flush=True)
+
+    try:
+        progress = run(todo, args, manifest)
+    finally:
+        manifest.close()
+    print(progress.line(), flush=True)
+    if progress.interrupted:
+        return 130
+    return 1 if progress.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,390 @@
+"""
+Word / PDF 导出
+
+字体和docx模板只加载一次，之后每次导出都直接渲染到内存缓冲区，不需要临时文件。
+PDF按实际字形宽度换行，每个字符只测量一次宽度，长文本也是线性时间。
+可搜索PDF在原始页面图片上叠加不可见的文字层，按页生成并逐页输出。
+reportlab和python-docx在第一次导出时才导入，不影响服务启动速度。
+"""
+import io
+import logging
+import os
+import re
+import threading
+import zlib
+from functools import lru_cache
+
+from ocr_engine import is_wide_gray, to_gray, to_rgb
+
+logger = logging.getLogger(__name__)
+
+WORD_MEDIA_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+PDF_MEDIA_TYPE = 'application/pdf'
+
+# PDF正文字体候选（优先支持中日韩文字的字体），可通过 OCR_PDF_FONT 指定
+PDF_FONT_CANDIDATES = [
+    os.getenv("OCR_PDF_FONT", ""),
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+]
+PDF_FALLBACK_FONT = 'Helvetica'
+PDF_TITLE_FONT = 'Helvetica-Bold'
+PDF_FONT_SIZE = 12
+PDF_TITLE_SIZE = 16
+PDF_MARGIN = 50
+PDF_LINE_HEIGHT = 20
+
+DOCX_TITLE = 'OCR识别结果'
+PDF_TITLE = 'OCR Recognition Result'
+
+# 按空白切分成“单词+后续空白”的片段，超宽的片段（如无空格的中文）再按字符切分
+_TOKEN_PATTERN = re.compile(r'\S+\s*|\s+')
+
+_init_lock = threading.Lock()
+_pdf_font = None
+_docx_template = None
+
+
+def get_pdf_font():
+    """
+    注册PDF正文字体，只在第一次调用时查找和加载字体文件
+    :return: 已注册的字体名称
+    """
+    global _pdf_font
+    if _pdf_font is not None:
+        return _pdf_font
+    with _init_lock:
+        if _pdf_font is not None:
+            return _pdf_font
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+
+        font_name = PDF_FALLBACK_FONT
+        for path in PDF_FONT_CANDIDATES:
+            if not path or not os.path.exists(path):
+                continue
+            try:
+                pdfmetrics.registerFont(TTFont('OCRBody', path))
+                font_name = 'OCRBody'
+                logger.info(f"PDF font loaded: {path}")
+                break
+            except Exception as e:
+                logger.warning(f"Failed to load PDF font {path}: {e}")
+        _pdf_font = font_name
+        return _pdf_font
+
+
+def get_docx_template():
+    """
+    生成带标题样式的docx模板，只生成一次，之后每次导出从内存加载
+    :return: 模板的字节数据
+    """
+    global _docx_template
+    if _docx_template is not None:
+        return _docx_template
+    with _init_lock:
+        if _docx_template is None:
+            from docx import Document
+
+            buffer = io.BytesIO()
+            Document().save(buffer)
+            _docx_template = buffer.getvalue()
+        return _docx_template
+
+
+def preload():
+    """
+    启动时预先加载字体和模板，避免第一次导出的请求承担加载开销
+    """
+    get_pdf_font()
+    get_docx_template()
+
+
+@lru_cache(maxsize=8192)
+def _char_width(char, font_name, font_size):
+    from reportlab.pdfbase import pdfmetrics
+
+    return pdfmetrics.stringWidth(char, font_name, font_size)
+
+
+def wrap_line(line, font_name, font_size, max_width):
+    """
+    按字形宽度把一行文本折成多行
+    :return: 折行后的字符串列表
+    """
+    if not line:
+        return ['']
+
+    def char_width(char):
+        return _char_width(char, font_name, font_size)
+
+    lines = []
+    current = []
+    current_width = 0.0
+    for token in _TOKEN_PATTERN.findall(line):
+        token_width = sum(char_width(char) for char in token)
+        if current_width + token_width <= max_width:
+            current.append(token)
+            current_width += token_width
+            continue
+        stripped = token.rstrip()
+        if current and current_width + sum(char_width(char) for char in stripped) <= max_width:
+            # 只有末尾空白超出宽度，单词本身放得下
+            current.append(stripped)
+            lines.append(''.join(current))
+            current, current_width = [], 0.0
+            continue
+        if current and token_width <= max_width:
+            lines.append(''.join(current).rstrip())
+            current, current_width = [token], token_width
+            continue
+        # 片段本身超过一行宽度，按字符切分
+        for char in token:
+            width = char_width(char)
+            if current and current_width + width > max_width:
+                lines.append(''.join(current).rstrip())
+                current, current_width = [], 0.0
+            current.append(char)
+            current_width += width
+    if current:
+        lines.append(''.join(current).rstrip())
+    return lines
+
+
+def render_pdf(text, output):
+    """
+    把文本排版为A4 PDF并写入output
+    :param output: 文件路径或可写的二进制文件对象
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    font_name = get_pdf_font()
+    width, height = A4
+    max_width = width - 2 * PDF_MARGIN
+
+    c = canvas.Canvas(output, pagesize=A4)
+    c.setFont(PDF_TITLE_FONT, PDF_TITLE_SIZE)
+    c.drawString(PDF_MARGIN, height - PDF_MARGIN, PDF_TITLE)
+    c.setFont(font_name, PDF_FONT_SIZE)
+
+    y_position = height - 100
+    for line in (text or '').split('\n'):
+        for wrapped in wrap_line(line, font_name, PDF_FONT_SIZE, max_width):
+            if y_position < PDF_MARGIN:  # 如果页面空间不够，创建新页面
+                c.showPage()
+                c.setFont(font_name, PDF_FONT_SIZE)
+                y_position = height - PDF_MARGIN
+            c.drawString(PDF_MARGIN, y_position, wrapped)
+            y_position -= PDF_LINE_HEIGHT
+    c.save()
+
+
+def render_docx(text, output):
+    """
+    把文本写入Word文档
+    :param output: 文件路径或可写的二进制文件对象
+    """
+    from docx import Document
+
+    doc = Document(io.BytesIO(get_docx_template()))
+    doc.add_heading(DOCX_TITLE, 0)
+    doc.add_paragraph(text or '')
+    doc.save(output)
+
+
+def text_to_pdf_bytes(text):
+    """
+    :return: PDF文档的字节数据
+    """
+    buffer = io.BytesIO()
+    render_pdf(text, buffer)
+    return buffer.getvalue()
+
+
+def text_to_docx_bytes(text):
+    """
+    :return: Word文档的字节数据
+    """
+    buffer = io.BytesIO()
+    render_docx(text, buffer)
+    return buffer.getvalue()
+
+
+# ---------------------------------------------------------------------------
+# 可搜索PDF：原始页面图片 + 不可见文字层
+#
+# reportlab在save()时才输出整个文档，无法逐页输出，所以这里直接按PDF格式写对象。
+# 文字使用不嵌入字形的Identity-H字体（与Tesseract自带的PDF输出相同的做法），
+# 以文字渲染模式3（不可见）绘制，只用于选择、复制和搜索。
+# ---------------------------------------------------------------------------
+
+SEARCHABLE_PDF_JPEG_QUALITY = int(os.getenv("OCR_PDF_JPEG_QUALITY", 85))
+# 字体中每个字形的宽度（千分之一em），绘制时用水平缩放对齐单词宽度
+_GLYPH_WIDTH = 500
+
+_CATALOG_OBJ = 1
+_PAGES_OBJ = 2
+_FONT_OBJ = 3
+_CID_FONT_OBJ = 4
+_FONT_DESCRIPTOR_OBJ = 5
+_TO_UNICODE_OBJ = 6
+_FIRST_PAGE_OBJ = 7
+# 每页占用的对象数：图片、内容流、页面
+_OBJECTS_PER_PAGE = 3
+
+
+def _page_object_ids(page_number):
+    base = _FIRST_PAGE_OBJ + page_number * _OBJECTS_PER_PAGE
+    return base, base + 1, base + 2
+
+
+def _pdf_object(obj_id, body, stream=None):
+    if stream is None:
+        return obj_id, b'%d 0 obj\n%s\nendobj\n' % (obj_id, body)
+    return obj_id, b'%d 0 obj\n%s\nstream\n%s\nendstream\nendobj\n' % (obj_id, body, stream)
+
+
+def _to_unicode_cmap():
+    # CID即UTF-16编码，按高字节分成256段映射回Unicode
+    ranges = [b'<%02X00> <%02XFF> <%02X00>' % (high, high, high) for high in range(256)]
+    blocks = []
+    for start in range(0, len(ranges), 100):
+        chunk = ranges[start:start + 100]
+        blocks.append(b'%d beginbfrange\n%s\nendbfrange' % (len(chunk), b'\n'.join(chunk)))
+    return b'\n'.join([
+        b'/CIDInit /ProcSet findresource begin',
+        b'12 dict begin',
+        b'begincmap',
+        b'/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def',
+        b'/CMapName /Adobe-Identity-UCS def',
+        b'/CMapType 2 def',
+        b'1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange',
+        *blocks,
+        b'endcmap',
+        b'CMapName currentdict /CMap defineresource pop',
+        b'end',
+        b'end',
+    ])
+
+
+def _font_objects():
+    cmap = _to_unicode_cmap()
+    return [
+        _pdf_object(_FONT_OBJ, b'<< /Type /Font /Subtype /Type0 /BaseFont /GlyphLessFont /Encoding /Identity-H '
+                               b'/DescendantFonts [%d 0 R] /ToUnicode %d 0 R >>' % (_CID_FONT_OBJ, _TO_UNICODE_OBJ)),
+        _pdf_object(_CID_FONT_OBJ, b'<< /Type /Font /Subtype /CIDFontType2 /BaseFont /GlyphLessFont '
+                                   b'/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> '
+                                   b'/FontDescriptor %d 0 R /DW %d >>' % (_FONT_DESCRIPTOR_OBJ, _GLYPH_WIDTH)),
+        _pdf_object(_FONT_DESCRIPTOR_OBJ, b'<< /Type /FontDescriptor /FontName /GlyphLessFont /Flags 5 '
+                                          b'/FontBBox [0 0 %d 1000] /ItalicAngle 0 /Ascent 1000 /Descent 0 '
+                                          b'/CapHeight 1000 /StemV 80 >>' % _GLYPH_WIDTH),
+        _pdf_object(_TO_UNICODE_OBJ, b'<< /Length %d >>' % len(cmap), cmap),
+    ]
+
+
+def _text_layer(words, scale, page_height):
+    """
+    生成不可见文字层的内容流指令，坐标从图片像素换算为PDF点
+    """
+    commands = [b'BT', b'3 Tr']
+    for text, left, top, width, height in zip(words['text'], words['left'], words['top'],
+                                              words['width'], words['height']):
+        if not text or width <= 0 or height <= 0:
+            continue
+        font_size = height * scale
+        # 按字形宽度水平缩放，使单词宽度与图片中的文字一致
+        horizontal_scale = 100.0 * width * scale / (len(text) * font_size * _GLYPH_WIDTH / 1000)
+        x = left * scale
+        y = page_height - (top + height) * scale
+        commands.append(b'/F1 %.2f Tf %.2f Tz 1 0 0 1 %.2f %.2f Tm <%s> Tj' % (
+            font_size, horizontal_scale, x, y, text.encode('utf-16-be').hex().upper().encode('ascii')))
+    commands.append(b'ET')
+    return b'\n'.join(commands)
+
+
+def render_searchable_page(page_number, image, words, dpi):
+    """
+    生成一页可搜索PDF的全部对象，只依赖页码，可以在工作进程中并行执行
+    :param page_number: 从0开始的页码，决定对象编号
+    :param image: 原始页面PIL图片
+    :param words: 单词数据（ocr_engine.WORD_FIELDS），坐标为图片像素
+    :param dpi: 图片分辨率，用于计算页面尺寸
+    :return: [(对象编号, 对象字节), ...]，交给SearchablePDFWriter.add_page
+    """
+    image_id, content_id, page_id = _page_object_ids(page_number)
+    # 调色板图片按RGB保存，避免彩色扫描件丢失颜色
+    if image.mode in ('1', 'L', 'LA', 'La') or is_wide_gray(image):
+        page_image, color_space = to_gray(image), b'/DeviceGray'
+    else:
+        page_image, color_space = to_rgb(image), b'/DeviceRGB'
+    jpeg = io.BytesIO()
+    page_image.save(jpeg, format='JPEG', quality=SEARCHABLE_PDF_JPEG_QUALITY)
+    jpeg = jpeg.getvalue()
+
+    scale = 72.0 / dpi
+    page_width = image.width * scale
+    page_height = image.height * scale
+    content = b'q %.2f 0 0 %.2f 0 0 cm /Im0 Do Q\n%s' % (page_width, page_height, _text_layer(words, scale, page_height))
+    content = zlib.compress(content)
+
+    return [
+        _pdf_object(image_id, b'<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s '
+                              b'/BitsPerComponent 8 /Filter /DCTDecode /Length %d >>' % (
+                                  image.width, image.height, color_space, len(jpeg)), jpeg),
+        _pdf_object(content_id, b'<< /Filter /FlateDecode /Length %d >>' % len(content), content),
+        _pdf_object(page_id, b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.2f %.2f] /Contents %d 0 R '
+                             b'/Resources << /XObject << /Im0 %d 0 R >> /Font << /F1 %d 0 R >> >> >>' % (
+                                 _PAGES_OBJ, page_width, page_height, content_id, image_id, _FONT_OBJ)),
+    ]
+
+
+class SearchablePDFWriter:
+    """
+    按页顺序拼接可搜索PDF，每个方法返回应写出的字节，写入器只保存各对象的偏移量
+    用法：begin() -> 逐页 add_page(render_searchable_page(...)) -> finish()
+    """
+
+    def __init__(self):
+        self.page_count = 0
+        self._offsets = {}
+        self._position = 0
+
+    def _emit(self, objects):
+        chunks = []
+        for obj_id, data in objects:
+            self._offsets[obj_id] = self._position
+            self._position += len(data)
+            chunks.append(data)
+        return b''.join(chunks)
+
+    def begin(self):
+        header = b'%PDF-1.5\n%\xe2\xe3\xcf\xd3\n'
+        self._position = len(header)
+        return header + self._emit(_font_objects())
+
+    def add_page(self, objects):
+        """
+        :param objects: render_searchable_page的返回值，必须按页码顺序添加
+        """
+        expected = _page_object_ids(self.page_count)[-1]
+        if objects[-1][0] != expected:
+            raise ValueError(f"Searchable PDF pages must be added in order (expected page {self.page_count})")
+        self.page_count += 1
+        return self._emit(objects)
+
+    def finish(self):
+        kids = b' '.join(b'%d 0 R' % _page_object_ids(i)[-1] for i in range(self.page_count))
+        tail = self._emit([
+            _pdf_object(_PAGES_OBJ, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, self.page_count)),
+            _pdf_object(_CATALOG_OBJ, b'<< /Type /Catalog /Pages %d 0 R >>' % _PAGES_OBJ),
+        ])
+        object_count = max(self._offsets) + 1
+        xref = [b'xref', b'0 %d' % object_count, b'0000000000 65535 f ']
+        for obj_id in range(1, object_count):
+            xref.append(b'%010d 00000 n ' % self._offsets[obj_id])
+        trailer = b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (
+            object_count, _CATALOG_OBJ, self._position)
+        return tail + b'\n'.join(xref) + b'\n' + trailer
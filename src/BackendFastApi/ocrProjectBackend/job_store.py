@@ -0,0 +1,414 @@
+"""
+异步OCR任务
+
+提交任务后立即返回任务ID，由后台执行者依次处理；客户端轮询状态并在完成后获取结果。
+任务记录默认保存在内存中；设置 OCR_JOB_DB 后保存在SQLite文件中，多个服务进程共享，
+任意进程都能查询任务状态，并领取其他进程留下的排队任务。
+输入文件和导出的结果文件保存在任务目录下，过期后一并删除。
+"""
+import asyncio
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from sqlite_store import SQLiteDatabase
+
+logger = logging.getLogger(__name__)
+
+# 任务配置（可通过环境变量覆盖）
+OCR_JOB_TTL = int(os.getenv("OCR_JOB_TTL", 3600))  # 完成后保留的秒数
+OCR_MAX_PENDING_JOBS = int(os.getenv("OCR_MAX_PENDING_JOBS", 1000))
+OCR_JOB_DB = os.getenv("OCR_JOB_DB", "")  # SQLite文件路径，留空则只保存在内存中
+OCR_JOB_POLL_INTERVAL = float(os.getenv("OCR_JOB_POLL_INTERVAL", 2))  # 空闲时检查共享排队任务的间隔（秒）
+OCR_JOB_STALE_TIMEOUT = int(os.getenv("OCR_JOB_STALE_TIMEOUT", 900))  # 执行中的任务超过该秒数没有进度视为失败
+OCR_DRAIN_TIMEOUT = int(os.getenv("OCR_DRAIN_TIMEOUT", 60))  # 停止时等待执行中任务的最长秒数
+
+# 任务状态
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+
+class JobStore:
+    """
+    线程安全的任务记录存储
+    :param root_dir: 任务目录的根目录
+    :param ttl: 任务结束后保留的秒数
+    """
+
+    def __init__(self, root_dir, ttl=OCR_JOB_TTL):
+        self.root_dir = root_dir
+        self.ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._disk_bytes = 0
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def job_dir(self, job_id):
+        return os.path.join(self.root_dir, job_id)
+
+    def new_id(self):
+        """
+        生成任务ID并创建任务目录，输入文件写好后再调用create登记
+        """
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.job_dir(job_id), exist_ok=True)
+        return job_id
+
+    def _new_record(self, job_id, fields):
+        now = time.time()
+        job = {
+            "id": job_id or uuid.uuid4().hex,
+            "status": JOB_QUEUED,
+            "progress": 0.0,
+            "created_at": now,
+            "updated_at": now,
+            "error": None,
+        }
+        job.update(fields)
+        os.makedirs(self.job_dir(job["id"]), exist_ok=True)
+        return job
+
+    def create(self, job_id=None, **fields):
+        """
+        创建排队中的任务记录和任务目录
+        :param job_id: new_id()生成的ID，为空时自动生成
+        :return: 任务记录副本
+        """
+        job = self._new_record(job_id, fields)
+        with self._lock:
+            self._jobs[job["id"]] = job
+        return dict(job)
+
+    def get(self, job_id):
+        """
+        获取任务记录副本，不存在时返回None
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def update(self, job_id, **fields):
+        """
+        更新任务字段，可以在工作线程中调用（例如上报进度）
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields)
+            job["updated_at"] = time.time()
+
+    def claim(self, job_id=None):
+        """
+        领取一个排队中的任务并标记为执行中，同一任务只会被领取一次
+        :param job_id: 要领取的任务，为空时领取最早的排队任务
+        :return: 任务记录副本，没有可领取的任务时返回None
+        """
+        with self._lock:
+            if job_id is None:
+                queued = [job for job in self._jobs.values() if job["status"] == JOB_QUEUED]
+                job = min(queued, key=lambda job: job["created_at"]) if queued else None
+            else:
+                job = self._jobs.get(job_id)
+            if job is None or job["status"] != JOB_QUEUED:
+                return None
+            now = time.time()
+            job.update(status=JOB_RUNNING, started_at=now, updated_at=now)
+            return dict(job)
+
+    def _delete_record(self, job_id):
+        with self._lock:
+            return self._jobs.pop(job_id, None) is not None
+
+    def delete(self, job_id):
+        """
+        删除任务记录及其目录
+        :return: 任务是否存在
+        """
+        existed = self._delete_record(job_id)
+        shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+        return existed
+
+    def exists(self, job_id):
+        with self._lock:
+            return job_id in self._jobs
+
+    def _job_ids(self):
+        with self._lock:
+            return set(self._jobs)
+
+    def pending_count(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job["status"] in (JOB_QUEUED, JOB_RUNNING))
+
+    def _expired_ids(self, deadline):
+        with self._lock:
+            return [
+                job_id for job_id, job in self._jobs.items()
+                if job["status"] in (JOB_DONE, JOB_FAILED) and job["updated_at"] < deadline
+            ]
+
+    def _stale_ids(self, deadline):
+        with self._lock:
+            return [
+                job_id for job_id, job in self._jobs.items()
+                if job["status"] == JOB_RUNNING and job["updated_at"] < deadline
+            ]
+
+    def purge_expired(self):
+        """
+        删除已结束且超过保留时间的任务，以及没有任务记录的过期目录（如重启前留下的）；
+        长时间没有进度的执行中任务（如所在进程被强制结束）标记为失败
+        同时统计任务目录占用的字节数
+        :return: 删除的任务数
+        """
+        now = time.time()
+        for job_id in self._stale_ids(now - OCR_JOB_STALE_TIMEOUT):
+            logger.warning(f"OCR job {job_id} made no progress for {OCR_JOB_STALE_TIMEOUT}s, marking as failed")
+            self.update(job_id, status=JOB_FAILED, error="Job was interrupted.")
+
+        deadline = now - self.ttl
+        expired = self._expired_ids(deadline)
+        for job_id in expired:
+            self.delete(job_id)
+
+        # 一次取出所有任务ID，不按目录逐个查询
+        job_ids = self._job_ids()
+        disk_bytes = 0
+        with os.scandir(self.root_dir) as it:
+            for entry in it:
+                if not entry.is_dir():
+                    continue
+                if entry.stat().st_mtime < deadline and entry.name not in job_ids:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    continue
+                disk_bytes += _dir_size(entry.path)
+        with self._lock:
+            self._disk_bytes = disk_bytes
+        return len(expired)
+
+    def _status_counts(self):
+        counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_DONE: 0, JOB_FAILED: 0}
+        with self._lock:
+            for job in self._jobs.values():
+                counts[job["status"]] += 1
+        return counts
+
+    def stats(self):
+        counts = self._status_counts()
+        with self._lock:
+            counts["disk_bytes"] = self._disk_bytes
+        return counts
+
+
+_JOB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created_at ON jobs (status, created_at);
+"""
+
+
+class SQLiteJobStore(JobStore):
+    """
+    任务记录保存在SQLite文件中的JobStore，多个进程可以同时使用
+    :param root_dir: 任务目录的根目录，所有进程必须相同
+    :param db_path: SQLite文件路径
+    :param ttl: 任务结束后保留的秒数
+    """
+
+    def __init__(self, root_dir, db_path, ttl=OCR_JOB_TTL):
+        super().__init__(root_dir, ttl)
+        self.db = SQLiteDatabase(db_path, _JOB_SCHEMA)
+
+    @staticmethod
+    def _load(row):
+        return json.loads(row["data"]) if row is not None else None
+
+    def _write(self, conn, job):
+        conn.execute(
+            "UPDATE jobs SET status = ?, updated_at = ?, data = ? WHERE id = ?",
+            (job["status"], job["updated_at"], json.dumps(job, ensure_ascii=False), job["id"]),
+        )
+
+    def create(self, job_id=None, **fields):
+        job = self._new_record(job_id, fields)
+        self.db.execute(
+            "INSERT INTO jobs (id, status, created_at, updated_at, data) VALUES (?, ?, ?, ?, ?)",
+            (job["id"], job["status"], job["created_at"], job["updated_at"], json.dumps(job, ensure_ascii=False)),
+        )
+        return job
+
+    def get(self, job_id):
+        return self._load(self.db.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def update(self, job_id, **fields):
+        with self.db.transaction() as conn:
+            job = self._load(conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone())
+            if job is None:
+                return
+            job.update(fields)
+            job["updated_at"] = time.time()
+            self._write(conn, job)
+
+    def claim(self, job_id=None):
+        with self.db.transaction() as conn:
+            if job_id is None:
+                row = conn.execute(
+                    "SELECT data FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (JOB_QUEUED,)).fetchone()
+            else:
+                row = conn.execute(
+                    "SELECT data FROM jobs WHERE id = ? AND status = ?", (job_id, JOB_QUEUED)).fetchone()
+            job = self._load(row)
+            if job is None:
+                return None
+            now = time.time()
+            job.update(status=JOB_RUNNING, started_at=now, updated_at=now)
+            self._write(conn, job)
+            return job
+
+    def _delete_record(self, job_id):
+        return self.db.execute("DELETE FROM jobs WHERE id = ?", (job_id,)).rowcount > 0
+
+    def exists(self, job_id):
+        return self.db.execute("SELECT 1 FROM jobs WHERE id = ?", (job_id,)).fetchone() is not None
+
+    def _job_ids(self):
+        return {row["id"] for row in self.db.execute("SELECT id FROM jobs")}
+
+    def pending_count(self):
+        return self.db.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (JOB_QUEUED, JOB_RUNNING)).fetchone()[0]
+
+    def _expired_ids(self, deadline):
+        rows = self.db.execute(
+            "SELECT id FROM jobs WHERE status IN (?, ?) AND updated_at < ?", (JOB_DONE, JOB_FAILED, deadline))
+        return [row["id"] for row in rows]
+
+    def _stale_ids(self, deadline):
+        rows = self.db.execute("SELECT id FROM jobs WHERE status = ? AND updated_at < ?", (JOB_RUNNING, deadline))
+        return [row["id"] for row in rows]
+
+    def _status_counts(self):
+        counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_DONE: 0, JOB_FAILED: 0}
+        for row in self.db.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status"):
+            counts[row["status"]] = row["count"]
+        return counts
+
+
+def open_job_store(root_dir, db_path=OCR_JOB_DB):
+    """
+    按配置创建任务存储：设置了db_path时使用SQLite，否则保存在内存中
+    """
+    if db_path:
+        return SQLiteJobStore(root_dir, db_path)
+    return JobStore(root_dir)
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
+
+
+class JobRunner:
+    """
+    后台执行者：处理本进程提交的任务，空闲时从存储中领取其他进程留下的排队任务
+    :param store: JobStore
+    :param handler: async函数，参数为任务记录
+    :param concurrency: 同时处理的任务数
+    :param poll_interval: 空闲时检查排队任务的间隔（秒）
+    """
+
+    def __init__(self, store, handler, concurrency, poll_interval=OCR_JOB_POLL_INTERVAL):
+        self.store = store
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self._queue = None
+        self._tasks = []
+        # 正在执行任务的协程
+        self._busy = set()
+        self._stopping = False
+
+    def start(self):
+        self._stopping = False
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def stop(self, timeout=OCR_DRAIN_TIMEOUT):
+        """
+        停止领取新任务，等待执行中的任务完成，最多等待timeout秒
+        超时被中断的任务重新标记为排队，由其他进程或下次启动继续执行
+        """
+        self._stopping = True
+        busy = [task for task in self._tasks if task in self._busy]
+        for task in self._tasks:
+            if task not in self._busy:
+                task.cancel()
+        if busy:
+            logger.info(f"Waiting up to {timeout}s for {len(busy)} running OCR jobs")
+            _, pending = await asyncio.wait(busy, timeout=timeout)
+            for task in pending:
+                task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, job_id):
+        self._queue.put_nowait(job_id)
+
+    async def _next_job(self):
+        try:
+            job_id = await asyncio.wait_for(self._queue.get(), self.poll_interval)
+        except asyncio.TimeoutError:
+            job_id = None
+        else:
+            self._queue.task_done()
+        return await self._claim(job_id)
+
+    async def _claim(self, job_id):
+        """
+        在线程中领取任务（SQLite存储可能等待写锁）；领取过程中被取消时把已领取的任务退回队列
+        """
+        claim = asyncio.ensure_future(asyncio.to_thread(self.store.claim, job_id))
+        try:
+            return await asyncio.shield(claim)
+        except asyncio.CancelledError:
+            job = await claim
+            if job is not None:
+                await asyncio.to_thread(self.store.update, job["id"], status=JOB_QUEUED)
+            raise
+
+    async def _work(self):
+        task = asyncio.current_task()
+        while not self._stopping:
+            job = await self._next_job()
+            if job is None:
+                continue
+            self._busy.add(task)
+            try:
+                await self.handler(job)
+            except asyncio.CancelledError:
+                await asyncio.to_thread(self.store.update, job["id"], status=JOB_QUEUED, progress=0.0)
+                logger.info(f"OCR job {job['id']} interrupted, returned to the queue")
+                raise
+            except Exception as e:
+                logger.error(f"OCR job {job['id']} failed: {e}")
+                await asyncio.to_thread(self.store.update, job["id"], status=JOB_FAILED, error=str(e))
+            finally:
+                self._busy.discard(task)
@@ -0,0 +1,122 @@
+"""
+文本语言检测
+
+先按Unicode文字范围判断（中日韩、阿拉伯、泰、西里尔文字可以直接确定语言），
+只有拉丁字母等无法区分的文本才交给langdetect做统计检测。
+langdetect只加载需要的语言模型，随机种子固定，同一段文本在任何进程中的结果都相同。
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 检测配置（可通过环境变量覆盖）
+OCR_LANGDETECT_SEED = int(os.getenv("OCR_LANGDETECT_SEED", 0))
+OCR_LANGDETECT_MAX_CHARS = int(os.getenv("OCR_LANGDETECT_MAX_CHARS", 500))
+
+# 按顺序匹配：(语言, 文字范围, 占全部字母的最小比例)
+# 日文中汉字往往多于假名，所以假名只要占一小部分就判定为日文，并且要在汉字之前判断
+SCRIPT_RULES = (
+    ('jpn', re.compile('[぀-ヿㇰ-ㇿ]'), 0.05),
+    ('kor', re.compile('[가-힯ᄀ-ᇿ㄰-㆏]'), 0.3),
+    ('chi_sim', re.compile('[一-鿿㐀-䶿豈-﫿]'), 0.3),
+    ('ara', re.compile('[؀-ۿݐ-ݿﭐ-﷿ﹰ-﻿]'), 0.3),
+    ('tha', re.compile('[฀-๿]'), 0.3),
+    ('rus', re.compile('[Ѐ-ӿ]'), 0.3),
+)
+_LETTER_PATTERN = re.compile(r'[^\W\d_]')
+
+
+def detect_script(text):
+    """
+    根据Unicode文字范围判断语言
+    :return: Tesseract语言代码，无法判断（如拉丁字母）时返回None
+    """
+    letters = len(_LETTER_PATTERN.findall(text))
+    if letters == 0:
+        return None
+    for lang, pattern, min_ratio in SCRIPT_RULES:
+        count = len(pattern.findall(text))
+        if count and count / letters >= min_ratio:
+            return lang
+    return None
+
+
+def sample_text(text, max_chars=OCR_LANGDETECT_MAX_CHARS):
+    """
+    截取用于检测的文本，在空白处截断，避免切断单词
+    """
+    # 先粗略截取再合并空白，长文本也不需要处理全文
+    text = ' '.join(text[:max_chars * 2].split())
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(' ', 0, max_chars)
+    return text[:cut if cut > max_chars // 2 else max_chars]
+
+
+class LanguageDetector:
+    """
+    只加载指定语言模型的langdetect检测器
+    :param lang_map: langdetect语言代码 -> Tesseract语言代码，决定加载哪些模型
+    :param seed: 随机种子，固定后结果可复现
+    :param max_chars: 参与检测的最大字符数
+    """
+
+    def __init__(self, lang_map, seed=OCR_LANGDETECT_SEED, max_chars=OCR_LANGDETECT_MAX_CHARS):
+        self.lang_map = dict(lang_map)
+        self.seed = seed
+        self.max_chars = max_chars
+        self._factory = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        加载语言模型，只在第一次调用时执行
+        :return: langdetect的DetectorFactory
+        """
+        if self._factory is not None:
+            return self._factory
+        with self._lock:
+            if self._factory is not None:
+                return self._factory
+            from langdetect.detector_factory import DetectorFactory, PROFILES_DIRECTORY
+            from langdetect.utils.lang_profile import LangProfile
+
+            start_time = time.time()
+            names = sorted(name for name in self.lang_map
+                           if os.path.isfile(os.path.join(PROFILES_DIRECTORY, name)))
+            factory = DetectorFactory()
+            for index, name in enumerate(names):
+                with open(os.path.join(PROFILES_DIRECTORY, name), 'r', encoding='utf-8') as f:
+                    factory.add_profile(LangProfile(**json.load(f)), index, len(names))
+            factory.set_seed(self.seed)
+            self._factory = factory
+            logger.info(f"Loaded {len(names)} language profiles in {(time.time() - start_time) * 1000:.0f}ms: {', '.join(names)}")
+            return self._factory
+
+    def detect(self, text, default='eng'):
+        """
+        检测文本语言
+        :return: Tesseract语言代码，无法检测时返回default
+        """
+        text = sample_text(text or '', self.max_chars)
+        if len(text) < 3:
+            return default
+
+        lang = detect_script(text)
+        if lang is not None:
+            return lang
+
+        from langdetect.lang_detect_exception import LangDetectException
+
+        detector = self.load().create()
+        detector.set_max_text_length(self.max_chars)
+        detector.append(text)
+        try:
+            return self.lang_map.get(detector.detect(), default)
+        except LangDetectException:
+            return default
@@ -0,0 +1,201 @@
+"""
+版面分析
+
+在缩略图上用投影法（递归XY切分）找出有文字的区域，只识别这些区域，
+空白多的页面（表单、稀疏文档）不再为整页付出识别开销。
+全部使用NumPy的向量化操作，300DPI的A4页面分析约需几十毫秒，远小于一次整页识别。
+"""
+import logging
+import os
+import time
+from dataclasses import dataclass
+
+import numpy as np
+from PIL import Image
+
+from metrics import record_stage, STAGE_LAYOUT
+
+logger = logging.getLogger(__name__)
+
+# 版面分析配置（可通过环境变量覆盖）
+OCR_LAYOUT_MAX_SIDE = int(os.getenv("OCR_LAYOUT_MAX_SIDE", 1000))  # 分析用缩略图的最长边
+OCR_LAYOUT_MAX_COVERAGE = float(os.getenv("OCR_LAYOUT_MAX_COVERAGE", 0.6))  # 区域面积超过页面的该比例时整页识别
+OCR_LAYOUT_MAX_REGIONS = int(os.getenv("OCR_LAYOUT_MAX_REGIONS", 200))  # 区域过多（如表格）时整页识别
+
+# Tesseract页面分割模式
+PSM_BLOCK = 6  # 一个文本块
+PSM_LINE = 7  # 单行文本
+
+# 段落间距至少为行高的倍数，小于它的空白不切分
+BLOCK_GAP_RATIO = 1.2
+# 栏间距至少为行高的倍数，避免在词间空白处切分
+COLUMN_GAP_RATIO = 1.5
+# 区域四周保留的留白，为行高的倍数
+REGION_PADDING_RATIO = 0.4
+# 宽高都小于行高该倍数的区域视为噪点
+MIN_REGION_RATIO = 0.3
+# 文字与背景的平均亮度至少相差该值，否则视为空白页
+MIN_INK_CONTRAST = 40
+
+
+@dataclass
+class TextRegion:
+    """页面中的一个文字区域，坐标对应原始图片"""
+    left: int
+    top: int
+    right: int
+    bottom: int
+    psm: int = PSM_BLOCK
+
+    @property
+    def box(self):
+        return self.left, self.top, self.right, self.bottom
+
+    @property
+    def area(self):
+        return (self.right - self.left) * (self.bottom - self.top)
+
+    def to_dict(self):
+        return {
+            "left": self.left,
+            "top": self.top,
+            "width": self.right - self.left,
+            "height": self.bottom - self.top,
+            "psm": self.psm,
+        }
+
+
+def _ink_mask(image, max_side):
+    """
+    生成缩略图的墨迹掩码（Otsu阈值），并去掉孤立的噪点
+    :return: tuple (布尔数组, 缩放比例)
+    """
+    gray = image if image.mode == 'L' else image.convert('L')
+    scale = 1.0
+    if max(gray.size) > max_side:
+        scale = max_side / max(gray.size)
+        gray = gray.resize((max(1, round(gray.width * scale)), max(1, round(gray.height * scale))),
+                           Image.BILINEAR, reducing_gap=2.0)
+    arr = np.asarray(gray, dtype=np.uint8)
+
+    # Otsu：使类间方差最大的阈值
+    hist = np.bincount(arr.ravel(), minlength=256).astype(np.float64)
+    weight = np.cumsum(hist)
+    mean = np.cumsum(hist * np.arange(256))
+    total_weight, total_mean = weight[-1], mean[-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = (total_mean * weight - mean * total_weight) ** 2 / (weight * (total_weight - weight))
+    threshold = int(np.nanargmax(variance)) if np.isfinite(variance).any() else 127
+    ink = arr <= threshold
+    # 两类亮度相差不大（空白页上的噪声），或前景占大多数，视为没有文字
+    ink_weight = weight[threshold]
+    if 0 < ink_weight < total_weight:
+        contrast = (total_mean - mean[threshold]) / (total_weight - ink_weight) - mean[threshold] / ink_weight
+    else:
+        contrast = 0.0
+    if contrast < MIN_INK_CONTRAST or ink.mean() > 0.5:
+        return np.zeros_like(ink), scale
+
+    # 8邻域内没有其他墨迹的像素视为噪点
+    padded = np.pad(ink, 1)
+    neighbors = np.zeros(ink.shape, dtype=np.uint8)
+    for dy in (0, 1, 2):
+        for dx in (0, 1, 2):
+            if dy != 1 or dx != 1:
+                neighbors += padded[dy:dy + ink.shape[0], dx:dx + ink.shape[1]]
+    return ink & (neighbors > 0), scale
+
+
+def _runs(profile, min_gap):
+    """
+    投影中连续有墨迹的区间，间隔不超过min_gap的空白不切分
+    :return: [(起点, 终点)]，终点不包含
+    """
+    inked = np.flatnonzero(profile)
+    if len(inked) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(inked) > min_gap + 1)
+    starts = np.concatenate(([inked[0]], inked[breaks + 1]))
+    ends = np.concatenate((inked[breaks], [inked[-1]])) + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def _line_height(mask):
+    """
+    用行投影估计文字行高（缩略图像素）
+    """
+    heights = [end - start for start, end in _runs(mask.any(axis=1), 0)]
+    return float(np.median(heights)) if heights else 0.0
+
+
+def _xy_cut(mask, top, bottom, left, right, gaps, regions):
+    """
+    递归XY切分：先按段落间的横向空白切分，不能再切时按栏间的纵向空白切分
+    叶子区域按阅读顺序（从上到下、从左到右）加入regions
+    """
+    stack = [(top, bottom, left, right)]
+    while stack:
+        top, bottom, left, right = stack.pop()
+        block = mask[top:bottom, left:right]
+        rows = block.any(axis=1)
+        cols = block.any(axis=0)
+        inked_rows = np.flatnonzero(rows)
+        if len(inked_rows) == 0:
+            continue
+        inked_cols = np.flatnonzero(cols)
+        # 收缩到墨迹外接框
+        top, bottom = top + int(inked_rows[0]), top + int(inked_rows[-1]) + 1
+        left, right = left + int(inked_cols[0]), left + int(inked_cols[-1]) + 1
+        rows = rows[inked_rows[0]:inked_rows[-1] + 1]
+        cols = cols[inked_cols[0]:inked_cols[-1] + 1]
+
+        row_runs = _runs(rows, gaps[0])
+        if len(row_runs) > 1:
+            # 栈后进先出，倒序压入保证从上到下处理
+            stack.extend((top + start, top + end, left, right) for start, end in reversed(row_runs))
+            continue
+        col_runs = _runs(cols, gaps[1])
+        if len(col_runs) > 1:
+            stack.extend((top, bottom, left + start, left + end) for start, end in reversed(col_runs))
+            continue
+        lines = len(_runs(rows, 0))
+        regions.append((top, bottom, left, right, lines))
+
+
+def find_text_regions(image, max_side=OCR_LAYOUT_MAX_SIDE):
+    """
+    找出页面中的文字区域
+    :param image: PIL图片
+    :param max_side: 分析用缩略图的最长边
+    :return: 按阅读顺序排列的TextRegion列表；区域覆盖了页面大部分时返回整页一个区域，空白页返回空列表
+    """
+    start_time = time.time()
+    mask, scale = _ink_mask(image, max_side)
+    line_height = _line_height(mask)
+    leaves = []
+    if line_height > 0:
+        gaps = (max(2, round(line_height * BLOCK_GAP_RATIO)), max(3, round(line_height * COLUMN_GAP_RATIO)))
+        _xy_cut(mask, 0, mask.shape[0], 0, mask.shape[1], gaps, leaves)
+
+    min_size = line_height * MIN_REGION_RATIO
+    padding = line_height * REGION_PADDING_RATIO
+    regions = []
+    for top, bottom, left, right, lines in leaves:
+        if bottom - top < min_size and right - left < min_size:
+            continue
+        regions.append(TextRegion(
+            left=max(0, int((left - padding) / scale)),
+            top=max(0, int((top - padding) / scale)),
+            right=min(image.width, int(np.ceil((right + padding) / scale))),
+            bottom=min(image.height, int(np.ceil((bottom + padding) / scale))),
+            psm=PSM_LINE if lines == 1 else PSM_BLOCK,
+        ))
+
+    coverage = sum(region.area for region in regions) / float(image.width * image.height)
+    if coverage > OCR_LAYOUT_MAX_COVERAGE or len(regions) > OCR_LAYOUT_MAX_REGIONS:
+        logger.info(f"Layout: {len(regions)} regions cover {coverage:.0%} of the page, using the full page")
+        regions = [TextRegion(0, 0, image.width, image.height)]
+    else:
+        logger.info(f"Layout: {len(regions)} regions cover {coverage:.0%} of the page")
+    record_stage(STAGE_LAYOUT, time.time() - start_time)
+    return regions
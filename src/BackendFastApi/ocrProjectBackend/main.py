@@ -1,21 +1,71 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, APIRouter
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, APIRouter, Request
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, Response
+from contextlib import asynccontextmanager
+from fastapi.datastructures import Headers
 from PIL import Image
 import io
+import asyncio
+import contextvars
+import hashlib
+import json
+import zipfile
+import itertools
 import transform
 import os
 from fastapi.middleware.cors import CORSMiddleware
 import logging
-from transform import ocr_image, save_to_text, save_to_word, save_to_pdf, detect_language, get_tesseract_path, find_tesseract_path, get_installed_languages
+from transform import ocr_image, auto_detect_and_ocr, save_to_text, save_to_word, save_to_pdf, detect_language, get_tesseract_path, get_installed_languages, get_language_name, get_tesseract_version, refresh_tesseract_info
+from transform import count_pages, iter_pages, detect_image_language, extract_text_with_tesseract, get_tesseract_lang, PAGE_SEPARATOR, open_image, split_into_bands, searchable_pdf_page, decode_image, layout_page, prepare_layout, recognize_region, assemble_layout, structured_page, ImageTooLarge, OCRFailed, estimate_cost
+from ocr_pool import OCRWorkerPool, PoolSaturated, TaskTiming, set_task_context, lane_for_cost, LANE_BULK, DEFAULT_TASK_COST
+from ocr_engine import OCR_ENGINE, TESSERACT_CONFIG, WORD_FIELDS, available_engines
+from ocr_cache import OCRResultCache
+from preprocess import parse_stages, preprocess_image
+import exporters
+from exporters import WORD_MEDIA_TYPE, PDF_MEDIA_TYPE, text_to_docx_bytes, text_to_pdf_bytes, SearchablePDFWriter
+from job_store import open_job_store, JobRunner, JOB_DONE, JOB_FAILED, OCR_MAX_PENDING_JOBS
+from artifact_store import ArtifactStore, run_sweeper, OCR_SWEEP_INTERVAL
+import metrics
+from metrics import Counter, Histogram, CallbackMetric, observe_stage, set_request_labels, STAGE_UPLOAD, STAGE_EXPORT
+import shutil
 import uuid
 import time
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
+
+# OCR工作池，阻塞的识别调用都在这里执行，不占用事件循环
+ocr_pool = OCRWorkerPool()
+
+# OCR结果缓存，引擎、参数或Tesseract版本变化时旧结果自动失效
+# Tesseract版本在第一次识别时才查询，不拖慢启动
+def _cache_namespace():
+    version = get_tesseract_version()
+    # 查不到版本时（tesseract还不可用）不固定命名空间，下次重新查询
+    return f"{OCR_ENGINE}|{TESSERACT_CONFIG}|{version}" if version else None
+
+ocr_cache = OCRResultCache(namespace=_cache_namespace)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    ocr_pool.start()
+    job_runner.start()
+    # 在后台预热导出用的字体、模板和语言检测模型，不阻塞启动
+    preload = asyncio.gather(
+        asyncio.to_thread(exporters.preload),
+        asyncio.to_thread(transform.language_detector.load),
+    )
+    # 定期清理过期的导出文件和任务
+    sweeper = asyncio.create_task(run_sweeper(OCR_SWEEP_INTERVAL, artifact_store.sweep, job_store.purge_expired))
+    yield
+    sweeper.cancel()
+    await asyncio.gather(sweeper, preload, return_exceptions=True)
+    await job_runner.stop()
+    ocr_pool.shutdown(wait=True)
 
 # 初始化FastAPI应用
 app = FastAPI(
     title="OCR Web Service",
     description="A modern web-based OCR system with multi-language support.",
     version="1.1.0",
+    lifespan=lifespan,
 )
 
 # 创建一个带/api前缀的路由器
@@ -23,6 +73,65 @@ api_router = APIRouter(prefix="/api")
 
 # 文件大小限制 (50MB)
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB in bytes
+# 分块读取上传文件的块大小
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# 支持的图片格式（TIFF和PDF可以包含多页）
+IMAGE_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.pdf']
+# 单次批量识别的最大文件数（包括zip内的图片）
+MAX_BATCH_FILES = int(os.getenv("OCR_MAX_BATCH_FILES", 200))
+# 工作池繁忙时批量任务单个文件的最大重试次数
+BATCH_MAX_RETRIES = 3
+# /api/ocr 和 /api/ocr/auto 支持的输出格式
+OUTPUT_FORMATS = ('text', 'word', 'pdf', 'searchable_pdf', 'structured')
+# 区分客户端的请求头（如API Key），没有时按来源IP，同一客户端的OCR任务在工作池中公平排队
+CLIENT_ID_HEADER = os.getenv("OCR_CLIENT_ID_HEADER", "X-API-Key")
+# 部署在反向代理之后时设为1，按X-Forwarded-For中的第一个地址区分客户端
+TRUST_FORWARDED_FOR = os.getenv("OCR_TRUST_FORWARDED_FOR", "0") == "1"
+# 请求体大小上限：单文件接口为文件上限加上表单字段的余量，批量接口可以包含多个文件
+MAX_REQUEST_SIZE = MAX_FILE_SIZE + 1024 * 1024
+MAX_BATCH_REQUEST_SIZE = int(os.getenv("OCR_MAX_BATCH_REQUEST_MB", 1024)) * 1024 * 1024
+
+class RequestSizeLimit:
+    """
+    接收请求体时限制大小的ASGI中间件，不等整个请求体写入临时文件后才检查
+    Content-Length超过上限时直接返回413；分块传输时边接收边计数，超过上限立即停止读取
+    :param app: ASGI应用
+    :param limit: 默认的请求体上限（字节）
+    :param path_limits: 按路径单独设置的上限
+    """
+
+    def __init__(self, app, limit, path_limits=None):
+        self.app = app
+        self.limit = limit
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        limit = self.path_limits.get(scope["path"], self.limit)
+        detail = f"请求过大。最大允许大小: {limit // (1024*1024)}MB"
+        content_length = Headers(scope=scope).get("content-length", "")
+        if content_length.isdigit() and int(content_length) > limit:
+            await JSONResponse(status_code=413, content={"detail": detail})(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # 在解析表单时抛出，由FastAPI转换为413响应
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+app.add_middleware(RequestSizeLimit, limit=MAX_REQUEST_SIZE,
+                   path_limits={"/api/ocr/batch": MAX_BATCH_REQUEST_SIZE})
 
 # 配置CORS中间件
 origins = [
@@ -46,30 +155,435 @@ logger = logging.getLogger(__name__)
 TEMP_DIR = "temp_files"
 os.makedirs(TEMP_DIR, exist_ok=True)
 
-# 智能查找Tesseract路径
-try:
-    tesseract_path = find_tesseract_path()
-    if tesseract_path:
-        get_tesseract_path(tesseract_path)
-        logger.info(f"✅ Tesseract path configured: {tesseract_path}")
-    else:
-        logger.warning("⚠️ Tesseract command not found. Please install Tesseract or check your PATH.")
-except Exception as e:
-    logger.error(f"❌ Error finding Tesseract: {e}")
+# 异步任务的记录和文件，设置OCR_JOB_DB时记录保存在多个进程共享的SQLite文件中
+job_store = open_job_store(os.path.join(TEMP_DIR, "jobs"))
+# 识别结果导出的文件，按TTL和容量上限自动清理
+artifact_store = ArtifactStore(os.path.join(TEMP_DIR, "outputs"))
+
+def _scan_upload(fileobj):
+    """
+    分块读取已接收的上传文件，计算内容哈希，超过大小限制时停止
+    :return: tuple (SHA-256十六进制字符串或None, 已读取的字节数)
+    """
+    digest = hashlib.sha256()
+    file_size = 0
+    for chunk in iter(lambda: fileobj.read(UPLOAD_CHUNK_SIZE), b''):
+        file_size += len(chunk)
+        if file_size > MAX_FILE_SIZE:
+            return None, file_size
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest(), file_size
 
 async def validate_file_size(file: UploadFile):
-    """验证文件大小"""
-    contents = await file.read()
-    file_size = len(contents)
+    """
+    验证单个上传文件的大小并计算内容哈希，分块读取，不在内存中缓冲整个文件
+    （此时请求体已经接收完毕，接收过程中的大小限制由RequestSizeLimit负责）
+    """
+    read_start = time.time()
+    content_digest, file_size = await asyncio.to_thread(_scan_upload, file.file)
+    observe_stage(STAGE_UPLOAD, time.time() - read_start)
     
-    if file_size > MAX_FILE_SIZE:
+    if content_digest is None:
         raise HTTPException(
             status_code=413,
-            detail=f"文件过大。最大允许大小: {MAX_FILE_SIZE // (1024*1024)}MB，当前文件大小: {file_size // (1024*1024)}MB"
+            detail=f"文件过大。最大允许大小: {MAX_FILE_SIZE // (1024*1024)}MB，当前文件大小超过: {file_size // (1024*1024)}MB"
         )
     
-    await file.seek(0)
-    return contents
+    return content_digest
+
+def client_id(request):
+    """
+    请求所属的客户端：有API Key时按Key（只保留哈希），否则按来源IP
+    """
+    key = request.headers.get(CLIENT_ID_HEADER)
+    if key:
+        return "key:" + hashlib.sha256(key.encode()).hexdigest()[:16]
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("X-Forwarded-For", "").split(",")[0].strip()
+        if forwarded:
+            return "ip:" + forwarded
+    return "ip:" + (request.client.host if request.client else "unknown")
+
+async def schedule_request(source, lane=None):
+    """
+    按文件头中的图片尺寸估算请求的识别开销，确定之后提交的OCR任务的调度通道
+    :param lane: 指定通道（批量接口和后台任务使用批量通道），为None时按开销选择
+    :return: 估算的开销（百万像素）
+    """
+    try:
+        cost = await asyncio.to_thread(estimate_cost, source)
+    except ImageTooLarge:
+        raise
+    except Exception as e:
+        # 无法解析时由识别流程报告错误
+        logger.warning(f"Failed to estimate OCR cost: {e}")
+        cost = DEFAULT_TASK_COST
+    set_task_context(cost=cost, lane=lane or lane_for_cost(cost))
+    return cost
+
+async def upload_source(file: UploadFile):
+    """
+    获取交给OCR的图片来源，同时估算识别开销，决定请求的调度通道
+    线程池直接使用上传的临时文件对象；进程池无法传递文件对象，读取为字节
+    """
+    source = file.file if ocr_pool.kind == 'thread' else await file.read()
+    await schedule_request(source)
+    return source
+
+def parse_preprocess(spec):
+    """
+    解析请求中的预处理参数，未知步骤返回400
+    """
+    try:
+        return parse_stages(spec)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def metric_lang(lang):
+    """
+    指标中使用的语言标签，统一为Tesseract语言代码，避免任意输入产生大量标签
+    """
+    return 'auto' if lang == 'auto' else get_tesseract_lang(lang)
+
+async def export_response(text, output_format, filename, headers=None):
+    """
+    在内存中生成Word/PDF文档并直接返回给客户端，不写临时文件
+    """
+    headers = dict(headers or {})
+    export_start = time.time()
+    if output_format == 'word':
+        content = await asyncio.to_thread(text_to_docx_bytes, text)
+        media_type, extension = WORD_MEDIA_TYPE, 'docx'
+    else:
+        content = await asyncio.to_thread(text_to_pdf_bytes, text)
+        media_type, extension = PDF_MEDIA_TYPE, 'pdf'
+    observe_stage(STAGE_EXPORT, time.time() - export_start)
+    headers["Content-Disposition"] = f'attachment; filename="{filename}.{extension}"'
+    return Response(content=content, media_type=media_type, headers=headers)
+
+def timing_headers(timing):
+    """
+    生成识别耗时相关的响应头，timing为None表示缓存命中
+    """
+    if timing is None:
+        return {"Server-Timing": "cache;desc=hit", "X-Cache": "HIT"}
+    return {"Server-Timing": timing.server_timing(), "X-Cache": "MISS"}
+
+# 当前HTTP请求是否已有OCR任务被工作池接受，由中间件为每个请求创建，请求内的子任务共享同一个字典；
+# 后台任务不在请求中，值为None
+_request_admission = contextvars.ContextVar('ocr_request_admission', default=None)
+
+async def run_in_pool_patiently(fn, *args, max_retries=None, **kwargs):
+    """
+    在工作池中执行fn，队列满时按Retry-After等待后重试，而不是立即失败
+    用于已经被接受的请求（批量、后台任务、多页文档中第一页之后的任务），这些场景不应再被拒绝
+    :param max_retries: 最大重试次数，None表示一直重试
+    """
+    attempt = 0
+    while True:
+        try:
+            return await ocr_pool.run(fn, *args, **kwargs)
+        except PoolSaturated as e:
+            if max_retries is not None and attempt >= max_retries:
+                raise
+            attempt += 1
+            await asyncio.sleep(e.retry_after)
+
+async def run_in_pool(fn, *args, **kwargs):
+    """
+    在工作池中执行fn
+    HTTP请求的第一个任务队列满时直接抛出PoolSaturated（返回503 + Retry-After），请求不会无限排队；
+    请求被接受之后的任务和后台任务队列满时等待重试
+    """
+    admission = _request_admission.get()
+    if admission is None or admission["accepted"]:
+        return await run_in_pool_patiently(fn, *args, **kwargs)
+    # 准入检查在ocr_pool.run的第一个await之前完成，之后同时提交的任务看到的已经是接受状态
+    admission["accepted"] = True
+    try:
+        return await ocr_pool.run(fn, *args, **kwargs)
+    except PoolSaturated:
+        admission["accepted"] = False
+        raise
+
+def _detect_page_language(page):
+    return detect_image_language(page)[0]
+
+async def resolve_language(image, lang):
+    """
+    确定整个文档使用的语言，'auto'时用给定页面检测
+    :return: tuple (Tesseract语言代码, 检测耗时)
+    """
+    if lang == 'auto':
+        doc_lang, timing = await run_in_pool(_detect_page_language, image)
+        return doc_lang, timing.exec_time
+    return get_tesseract_lang(lang), 0.0
+
+async def iter_recognized_units(units, unit_count, doc_lang, preprocess=(), worker=None):
+    """
+    把逐个解码的识别单元（页面或文本块）并行交给工作池识别，按完成顺序产出结果
+    同时在处理中的单元数不超过工作者数量，内存占用与文档长度无关
+    :param units: 生成PIL图片的同步迭代器，在线程中推进
+    :param unit_count: 单元总数
+    :param worker: 可选的识别函数，参数为 (图片, 序号, 语言, 预处理步骤)，为None时只识别文本
+    :return: 异步生成器，产出 tuple (序号, 文本或worker的返回值, TaskTiming)
+    """
+    window = ocr_pool.workers
+    pending = set()
+    next_index = 0
+
+    async def run_unit(index, unit):
+        if worker is not None:
+            result, timing = await run_in_pool(worker, unit, index, doc_lang, preprocess)
+            return index, result, timing
+        (text, _), timing = await run_in_pool(extract_text_with_tesseract, unit, doc_lang, None, preprocess)
+        if text is None:
+            raise OCRFailed("OCR failed")
+        return index, text, timing
+
+    try:
+        unit = await asyncio.to_thread(next, units, None)
+        while True:
+            while unit is not None and len(pending) < window:
+                pending.add(asyncio.create_task(run_unit(next_index, unit)))
+                next_index += 1
+                unit = None
+                if next_index < unit_count:
+                    unit = await asyncio.to_thread(next, units, None)
+            if not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def start_recognized_units(units, unit_count, doc_lang, preprocess=(), worker=None):
+    """
+    开始识别并等待第一个结果后再返回，流式响应在开始发送之前调用，工作池已满时仍能返回503
+    参数同iter_recognized_units
+    :return: 异步生成器，产出内容同iter_recognized_units（包括已经得到的第一个结果）
+    """
+    results = iter_recognized_units(units, unit_count, doc_lang, preprocess, worker)
+    first = await anext(results, None)
+
+    async def resume():
+        try:
+            if first is None:
+                return
+            yield first
+            async for result in results:
+                yield result
+        finally:
+            await results.aclose()
+
+    return resume()
+
+async def recognize_pages(source, lang, page_count, progress=None, preprocess=()):
+    """
+    多页文档逐页解码，并行交给工作池识别后按页码顺序拼接
+    :param progress: 可选的async回调，参数为 (已完成页数, 总页数)
+    :return: tuple (识别的文本, 语言代码, 各页耗时之和的TaskTiming)
+    """
+    pages = iter_pages(source)
+    texts = [''] * page_count
+    total = TaskTiming(queue_wait=0.0, exec_time=0.0)
+    completed = 0
+
+    try:
+        first_page = await asyncio.to_thread(next, pages, None)
+        if first_page is None:
+            return '', get_tesseract_lang(lang), total
+        # 用第一页确定整个文档的语言
+        doc_lang, detect_time = await resolve_language(first_page, lang)
+        total.exec_time += detect_time
+
+        units = itertools.chain([first_page], pages)
+        async for index, text, timing in iter_recognized_units(units, page_count, doc_lang, preprocess):
+            texts[index] = text
+            total.queue_wait += timing.queue_wait
+            total.exec_time += timing.exec_time
+            completed += 1
+            if progress is not None:
+                await progress(completed, page_count)
+    finally:
+        pages.close()
+
+    logger.info(f"Recognized {page_count} pages with lang='{doc_lang}'")
+    return PAGE_SEPARATOR.join(texts), doc_lang, total
+
+async def recognize(source, content_digest, lang, progress=None, preprocess=()):
+    """
+    带缓存的OCR识别，未命中时在工作池中执行；多页文档逐页并行识别
+    :param source: 图片来源（文件对象、字节数据或文件路径）
+    :param content_digest: 图片内容的SHA-256
+    :param lang: 语言代码，'auto'表示自动检测
+    :param progress: 可选的async进度回调，参数为 (已完成页数, 总页数)
+    :param preprocess: 预处理步骤（preprocess.parse_stages的返回值）
+    :return: tuple (识别的文本, 语言代码, TaskTiming（缓存命中时为None）)
+    """
+    cache_key = ocr_cache.make_key(content_digest, lang, ",".join(preprocess))
+    cached = await ocr_cache.aget(cache_key)
+    if cached is not None:
+        logger.info(f"OCR cache hit with lang='{lang}'")
+        return cached["text"], cached.get("lang", lang), None
+
+    try:
+        page_count = await asyncio.to_thread(count_pages, source)
+    except ImageTooLarge:
+        raise
+    except Exception as e:
+        # 无法解析时按单页处理，由识别流程报告错误
+        logger.warning(f"Failed to count pages: {e}")
+        page_count = 1
+
+    if page_count > 1:
+        text, detected_lang, timing = await recognize_pages(source, lang, page_count, progress, preprocess)
+    elif lang == 'auto':
+        # 先检测语言再做一次完整识别
+        (text, detected_lang), timing = await run_in_pool(auto_detect_and_ocr, source, preprocess=preprocess)
+        if text is None:
+            raise OCRFailed("OCR failed")
+    else:
+        text, timing = await run_in_pool(ocr_image, source, lang=lang, preprocess=preprocess)
+        detected_lang = lang
+    logger.info(f"OCR queue wait: {timing.queue_wait:.2f}s, execution time: {timing.exec_time:.2f}s")
+
+    # 没有识别出文字时不缓存
+    if text:
+        await ocr_cache.aset(cache_key, {"text": text, "lang": detected_lang})
+    return text, detected_lang or 'eng', timing
+
+async def searchable_pdf_response(source, lang, preprocess, filename):
+    """
+    生成可搜索PDF：每页只识别一次，同时得到文本和单词位置，叠加在原图上
+    各页并行识别，按页码顺序逐页写出，不需要在内存中保留整个文档
+    """
+    page_count = await asyncio.to_thread(count_pages, source)
+    pages = iter_pages(source)
+    try:
+        first_page = await asyncio.to_thread(next, pages, None)
+        if first_page is None:
+            raise HTTPException(status_code=400, detail="The document has no pages.")
+        doc_lang, _ = await resolve_language(first_page, lang)
+        units = itertools.chain([first_page], pages)
+        results = await start_recognized_units(units, page_count, doc_lang, preprocess, searchable_pdf_page)
+    except BaseException:
+        pages.close()
+        raise
+
+    async def stream_pdf():
+        start_time = time.time()
+        writer = SearchablePDFWriter()
+        finished = {}
+        try:
+            yield writer.begin()
+            async for index, (_, objects), _ in results:
+                finished[index] = objects
+                # 并行识别的页面可能乱序完成，按页码顺序写出
+                while writer.page_count in finished:
+                    yield writer.add_page(finished.pop(writer.page_count))
+            yield writer.finish()
+            logger.info(f"Searchable PDF with {page_count} pages generated in {time.time() - start_time:.2f}s")
+        except Exception as e:
+            logger.error(f"Searchable PDF generation failed: {e}")
+            raise
+        finally:
+            pages.close()
+
+    return StreamingResponse(
+        stream_pdf(),
+        media_type=PDF_MEDIA_TYPE,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}.pdf"',
+            "X-Detected-Lang": doc_lang,
+        },
+    )
+
+async def recognize_page_results(source, content_digest, lang, preprocess, worker, variant, single_page=None):
+    """
+    逐页识别并返回每页的结构化结果（如区域或单词位置），各页并行识别，结果带缓存
+    :param worker: 单页识别函数，参数为 (图片, 序号, 语言, 预处理步骤)，返回带text字段的字典
+    :param variant: 结果类型名称，用于区分缓存
+    :param single_page: 可选的async函数，只有一页时代替worker（如把一页拆成多个任务并行识别），
+                        参数为 (图片, 语言, 预处理步骤)，返回 tuple (与worker相同的结果, TaskTiming)
+    :return: tuple (识别的文本, 语言代码, 各页结果列表, TaskTiming（缓存命中时为None）)
+    """
+    cache_key = ocr_cache.make_key(content_digest, lang, ",".join(preprocess), variant)
+    cached = await ocr_cache.aget(cache_key)
+    if cached is not None:
+        logger.info(f"OCR cache hit with lang='{lang}' ({variant})")
+        return cached["text"], cached["lang"], cached["pages"], None
+
+    page_count = await asyncio.to_thread(count_pages, source)
+    pages = iter_pages(source)
+    results = [None] * page_count
+    total = TaskTiming(queue_wait=0.0, exec_time=0.0)
+    try:
+        first_page = await asyncio.to_thread(next, pages, None)
+        if first_page is None:
+            raise HTTPException(status_code=400, detail="The document has no pages.")
+        doc_lang, detect_time = await resolve_language(first_page, lang)
+        total.exec_time += detect_time
+
+        if page_count == 1 and single_page is not None:
+            results[0], timing = await single_page(first_page, doc_lang, preprocess)
+            total.queue_wait += timing.queue_wait
+            total.exec_time += timing.exec_time
+        else:
+            units = itertools.chain([first_page], pages)
+            async for index, result, timing in iter_recognized_units(units, page_count, doc_lang, preprocess, worker):
+                results[index] = result
+                total.queue_wait += timing.queue_wait
+                total.exec_time += timing.exec_time
+    finally:
+        pages.close()
+
+    text = PAGE_SEPARATOR.join(result["text"] for result in results)
+    if text:
+        await ocr_cache.aset(cache_key, {"text": text, "lang": doc_lang, "pages": results})
+    return text, doc_lang, results, total
+
+async def layout_single_page(page, lang, preprocess):
+    """
+    单页版面分析：先找出文字区域，再把各区域作为单独的任务交给工作池并行识别，按阅读顺序拼接
+    :return: tuple (页面结果字典（同transform.layout_page）, 版面分析和各区域耗时之和的TaskTiming)
+    """
+    (image_size, ocr_size, regions, crops), total = await run_in_pool(prepare_layout, page, preprocess)
+    texts = [''] * len(crops)
+    async for index, text, timing in iter_recognized_units(iter(crops), len(crops), lang, (), recognize_region):
+        texts[index] = text
+        total.queue_wait += timing.queue_wait
+        total.exec_time += timing.exec_time
+    text, items = assemble_layout(image_size, ocr_size, regions, texts)
+    logger.info(f"Layout OCR: {len(items)}/{len(regions)} regions with text")
+    return {"page": 1, "width": image_size[0], "height": image_size[1], "text": text, "regions": items}, total
+
+async def structured_response(source, content_digest, lang, preprocess):
+    """
+    结构化输出：一次识别同时得到文本、单词位置和置信度
+    单词数据按列存储（每个字段一个数组），比逐个单词的对象小得多，客户端可以按置信度过滤
+    """
+    text, detected_lang, pages, timing = await recognize_page_results(
+        source, content_digest, lang, preprocess, structured_page, "structured")
+    content = {"text": text, "detected_lang": get_language_name(detected_lang), "fields": list(WORD_FIELDS), "pages": pages}
+    return JSONResponse(content=content, headers=timing_headers(timing))
+
+@app.exception_handler(PoolSaturated)
+async def pool_saturated_handler(request, exc: PoolSaturated):
+    """OCR队列已满时快速拒绝，提示客户端稍后重试"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "OCR服务繁忙，请稍后重试"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(ImageTooLarge)
+async def image_too_large_handler(request, exc: ImageTooLarge):
+    """图片尺寸超过上限（可能是解压炸弹），在解码之前拒绝"""
+    return JSONResponse(status_code=413, content={"detail": str(exc)})
 
 @api_router.get("/", tags=["General"])
 async def read_root():
@@ -86,131 +600,658 @@ async def health_check():
     return JSONResponse(content={"status": "ok"})
 
 @api_router.get("/config", tags=["General"])
-async def get_config() -> Dict[str, Any]:
+async def get_config(refresh: bool = False) -> Dict[str, Any]:
     """
     Get server configuration and capabilities.
+    Tesseract discovery and the installed language list are cached after the first call.
+    - **refresh**: Re-discover Tesseract and re-read installed languages.
     """
+    if refresh:
+        await asyncio.to_thread(refresh_tesseract_info)
+    tesseract_path = await asyncio.to_thread(get_tesseract_path, None)
+    languages = await asyncio.to_thread(get_installed_languages, refresh)
     return {
-        "tesseract_version": get_tesseract_path(None) or "Not Found",
-        "supported_languages": get_installed_languages(),
-        "max_file_size_mb": 50
+        "tesseract_version": tesseract_path or "Not Found",
+        "supported_languages": languages,
+        "max_file_size_mb": 50,
+        "ocr_pool": ocr_pool.stats(),
+        "ocr_engine": OCR_ENGINE,
+        "available_engines": available_engines(),
+        "ocr_cache": ocr_cache.stats(),
+        "jobs": await asyncio.to_thread(job_store.stats),
+        "artifacts": artifact_store.stats(),
     }
 
-@api_router.post("/ocr", tags=["OCR"])
+@api_router.post("/ocr", tags=["OCR"], response_model=None)
 async def perform_ocr(
     file: UploadFile = File(...), 
     lang: str = Form("eng"),
-    output_format: str = Form("text")
-) -> FileResponse | JSONResponse:
+    output_format: str = Form("text"),
+    preprocess: Optional[str] = Form(None)
+) -> Response:
     """
     Perform OCR on an uploaded image.
     - **file**: Image file to process.
     - **lang**: Recognition language (e.g., 'eng', 'chi_sim').
-    - **output_format**: 'text', 'word', or 'pdf'.
+    - **output_format**: 'text', 'word', 'pdf', 'searchable_pdf' (original page images with an invisible text layer),
+      or 'structured' (per-page word boxes and confidences as columnar arrays).
+    - **preprocess**: 'none', 'default', or comma-separated stages (grayscale, resize, deskew, threshold, crop).
     """
     start_time = time.time()
+    stages = parse_preprocess(preprocess)
+    if output_format not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid output format specified.")
+    set_request_labels(format=output_format, lang=metric_lang(lang))
     
     # 检查文件大小
     if file.size and file.size > 50 * 1024 * 1024:
         raise HTTPException(status_code=413, detail="File size exceeds 50MB limit.")
         
     file_extension = os.path.splitext(file.filename)[1].lower()
-    if file_extension not in ['.png', '.jpg', '.jpeg', '.bmp', '.tiff']:
-        raise HTTPException(status_code=400, detail="Invalid file type. Please upload an image.")
+    if file_extension not in IMAGE_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Invalid file type. Please upload an image or PDF.")
 
-    file_path = os.path.join(TEMP_DIR, f"{uuid.uuid4()}{file_extension}")
-    
     try:
-        with open(file_path, "wb") as buffer:
-            buffer.write(await file.read())
-        
+        content_digest = await validate_file_size(file)
         logger.info(f"Performing OCR with lang='{lang}' and format='{output_format}'")
-        text_result = ocr_image(file_path, lang=lang)
+        if output_format == 'searchable_pdf':
+            # 需要单词位置，不经过只保存文本的结果缓存
+            return await searchable_pdf_response(await upload_source(file), lang, stages, f"{uuid.uuid4()}")
+        if output_format == 'structured':
+            return await structured_response(await upload_source(file), content_digest, lang, stages)
+        text_result, _, timing = await recognize(await upload_source(file), content_digest, lang, preprocess=stages)
+        headers = timing_headers(timing)
         
         output_filename = f"{uuid.uuid4()}"
         
         if output_format == 'text':
-            output_path = save_to_text(text_result, os.path.join(TEMP_DIR, f"{output_filename}.txt"))
-            return JSONResponse(content={"text": text_result, "filename": os.path.basename(output_path)})
+            output_path = await asyncio.to_thread(artifact_store.save, f"{output_filename}.txt", save_to_text, text_result)
+            return JSONResponse(content={"text": text_result, "filename": os.path.basename(output_path)}, headers=headers)
         
-        elif output_format == 'word':
-            output_path = save_to_word(text_result, os.path.join(TEMP_DIR, f"{output_filename}.docx"))
-            return FileResponse(output_path, media_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document', filename=f"{output_filename}.docx")
-            
-        elif output_format == 'pdf':
-            output_path = save_to_pdf(text_result, os.path.join(TEMP_DIR, f"{output_filename}.pdf"))
-            return FileResponse(output_path, media_type='application/pdf', filename=f"{output_filename}.pdf")
+        elif output_format in ('word', 'pdf'):
+            return await export_response(text_result, output_format, output_filename, headers)
             
         else:
             raise HTTPException(status_code=400, detail="Invalid output format specified.")
 
+    except (HTTPException, PoolSaturated, ImageTooLarge):
+        raise
     except Exception as e:
         logger.error(f"OCR processing failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
         
     finally:
-        if os.path.exists(file_path):
-            os.remove(file_path)
         logger.info(f"Processing time: {time.time() - start_time:.2f}s")
 
-@api_router.post("/ocr/auto", tags=["OCR"])
+@api_router.post("/ocr/auto", tags=["OCR"], response_model=None)
 async def perform_ocr_auto_detect(
     file: UploadFile = File(...),
-    output_format: str = Form("text")
-) -> FileResponse | JSONResponse:
+    output_format: str = Form("text"),
+    preprocess: Optional[str] = Form(None)
+) -> Response:
     """
     Perform OCR with automatic language detection.
     - **file**: Image file to process.
-    - **output_format**: 'text', 'word', or 'pdf'.
+    - **output_format**: 'text', 'word', 'pdf', 'searchable_pdf' (original page images with an invisible text layer),
+      or 'structured' (per-page word boxes and confidences as columnar arrays).
+    - **preprocess**: 'none', 'default', or comma-separated preprocessing stages.
     """
     start_time = time.time()
+    stages = parse_preprocess(preprocess)
+    if output_format not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid output format specified.")
+    set_request_labels(format=output_format, lang='auto')
     
     if file.size and file.size > 50 * 1024 * 1024:
         raise HTTPException(status_code=413, detail="File size exceeds 50MB limit.")
         
     file_extension = os.path.splitext(file.filename)[1].lower()
-    if file_extension not in ['.png', '.jpg', '.jpeg', '.bmp', '.tiff']:
-        raise HTTPException(status_code=400, detail="Invalid file type. Please upload an image.")
-
-    file_path = os.path.join(TEMP_DIR, f"{uuid.uuid4()}{file_extension}")
+    if file_extension not in IMAGE_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Invalid file type. Please upload an image or PDF.")
 
     try:
-        with open(file_path, "wb") as buffer:
-            buffer.write(await file.read())
-            
-        # 初始识别以检测语言
-        initial_text = ocr_image(file_path, lang='eng') # Use English for initial pass
-        detected_lang_code, detected_lang_name = detect_language(initial_text)
+        content_digest = await validate_file_size(file)
+        if output_format == 'searchable_pdf':
+            # 需要单词位置，不经过只保存文本的结果缓存
+            return await searchable_pdf_response(await upload_source(file), 'auto', stages, f"{uuid.uuid4()}")
+        if output_format == 'structured':
+            return await structured_response(await upload_source(file), content_digest, 'auto', stages)
+        final_text, detected_lang_code, timing = await recognize(await upload_source(file), content_digest, 'auto', preprocess=stages)
+        headers = timing_headers(timing)
+        detected_lang_name = get_language_name(detected_lang_code)
         logger.info(f"Language detected: {detected_lang_name} ({detected_lang_code})")
-        
-        # 使用检测到的语言进行完整OCR
-        final_text = ocr_image(file_path, lang=detected_lang_code)
 
         output_filename = f"{uuid.uuid4()}"
 
         if output_format == 'text':
-            output_path = save_to_text(final_text, os.path.join(TEMP_DIR, f"{output_filename}.txt"))
-            return JSONResponse(content={"text": final_text, "detected_lang": detected_lang_name, "filename": os.path.basename(output_path)})
-            
-        elif output_format == 'word':
-            output_path = save_to_word(final_text, os.path.join(TEMP_DIR, f"{output_filename}.docx"))
-            return FileResponse(output_path, media_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document', filename=f"{output_filename}.docx")
+            output_path = await asyncio.to_thread(artifact_store.save, f"{output_filename}.txt", save_to_text, final_text)
+            return JSONResponse(content={"text": final_text, "detected_lang": detected_lang_name, "filename": os.path.basename(output_path)}, headers=headers)
             
-        elif output_format == 'pdf':
-            output_path = save_to_pdf(final_text, os.path.join(TEMP_DIR, f"{output_filename}.pdf"))
-            return FileResponse(output_path, media_type='application/pdf', filename=f"{output_filename}.pdf")
+        elif output_format in ('word', 'pdf'):
+            return await export_response(final_text, output_format, output_filename, headers)
             
         else:
             raise HTTPException(status_code=400, detail="Invalid output format specified.")
 
+    except (HTTPException, PoolSaturated, ImageTooLarge):
+        raise
     except Exception as e:
         logger.error(f"Auto-detect OCR failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
         
     finally:
-        if os.path.exists(file_path):
-            os.remove(file_path)
         logger.info(f"Processing time: {time.time() - start_time:.2f}s")
 
+@api_router.post("/ocr/layout", tags=["OCR"])
+async def perform_ocr_layout(
+    file: UploadFile = File(...),
+    lang: str = Form("eng"),
+    preprocess: Optional[str] = Form(None)
+) -> JSONResponse:
+    """
+    Perform OCR only on the text regions found by a layout pass, skipping blank areas.
+    Faster on sparse pages such as forms and receipts; returns per-region text with
+    coordinates in the original page image.
+    - **file**: Image file to process.
+    - **lang**: Recognition language ('auto' for detection).
+    - **preprocess**: 'none', 'default', or comma-separated preprocessing stages (deskew and crop are ignored so coordinates match the original).
+    """
+    start_time = time.time()
+    stages = parse_preprocess(preprocess)
+    set_request_labels(format='layout', lang=metric_lang(lang))
+
+    if file.size and file.size > MAX_FILE_SIZE:
+        raise HTTPException(status_code=413, detail="File size exceeds 50MB limit.")
+
+    file_extension = os.path.splitext(file.filename)[1].lower()
+    if file_extension not in IMAGE_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Invalid file type. Please upload an image or PDF.")
+
+    try:
+        content_digest = await validate_file_size(file)
+        text, detected_lang, pages, timing = await recognize_page_results(
+            await upload_source(file), content_digest, lang, stages, layout_page, "layout", layout_single_page)
+        return JSONResponse(
+            content={"text": text, "detected_lang": get_language_name(detected_lang), "pages": pages},
+            headers=timing_headers(timing),
+        )
+
+    except (HTTPException, PoolSaturated, ImageTooLarge):
+        raise
+    except Exception as e:
+        logger.error(f"Layout OCR failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    finally:
+        logger.info(f"Processing time: {time.time() - start_time:.2f}s")
+
+def _sse(event, data):
+    """
+    格式化一条Server-Sent Events消息
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _prepare_single_page(source, preprocess):
+    """
+    打开单页图片、执行预处理并按空白行切分为文本块
+    :return: tuple (处理后的整页图片, 文本块列表)
+    """
+    image = decode_image(source, reduced=True)
+    if preprocess:
+        image, _ = preprocess_image(image, preprocess)
+    return image, split_into_bands(image)
+
+@api_router.post("/ocr/stream", tags=["OCR"], response_model=None)
+async def perform_ocr_stream(
+    file: UploadFile = File(...),
+    lang: str = Form("eng"),
+    preprocess: Optional[str] = Form(None)
+) -> StreamingResponse:
+    """
+    Perform OCR and stream text back as Server-Sent Events while it is recognized.
+    Multi-page documents emit one event per page; single images are split into
+    text blocks at blank rows and emit one event per block.
+    Events: start, text (with index for ordering), done, error.
+    - **file**: Image file to process.
+    - **lang**: Recognition language ('auto' for detection).
+    - **preprocess**: 'none', 'default', or comma-separated preprocessing stages.
+    """
+    if file.size and file.size > MAX_FILE_SIZE:
+        raise HTTPException(status_code=413, detail="File size exceeds 50MB limit.")
+
+    file_extension = os.path.splitext(file.filename)[1].lower()
+    if file_extension not in IMAGE_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Invalid file type. Please upload an image or PDF.")
+
+    stages = parse_preprocess(preprocess)
+    set_request_labels(format='sse', lang=metric_lang(lang))
+    content_digest = await validate_file_size(file)
+    source = await upload_source(file)
+    cache_key = ocr_cache.make_key(content_digest, lang, ",".join(stages))
+    cached = await ocr_cache.aget(cache_key)
+    start_time = time.time()
+
+    # 第一个识别任务在开始响应之前提交，工作池已满时还能返回503
+    pages = prepare_error = None
+    if cached is None:
+        try:
+            page_count = await asyncio.to_thread(count_pages, source)
+            if page_count > 1:
+                pages = iter_pages(source)
+                first_page = await asyncio.to_thread(next, pages, None)
+                doc_lang, _ = await resolve_language(first_page, lang)
+                units = itertools.chain([first_page], pages)
+                unit_name, unit_count, unit_preprocess, separator = 'page', page_count, stages, PAGE_SEPARATOR
+                results = await start_recognized_units(units, unit_count, doc_lang, unit_preprocess)
+            else:
+                # 单页图片先整页预处理，再按文本块识别
+                (image, bands), _ = await run_in_pool(_prepare_single_page, source, stages)
+                doc_lang, _ = await resolve_language(image, lang)
+                units = iter(bands)
+                unit_name, unit_count, unit_preprocess, separator = 'block', len(bands), (), '\n'
+                del image
+                results = iter_recognized_units(units, unit_count, doc_lang, unit_preprocess)
+        except PoolSaturated:
+            if pages is not None:
+                pages.close()
+            raise
+        except Exception as e:
+            # 其他错误仍通过error事件报告
+            prepare_error = e
+
+    async def stream_events():
+        try:
+            if cached is not None:
+                yield _sse("start", {"units": 1, "unit": "page", "lang": cached.get("lang", lang), "cached": True})
+                yield _sse("text", {"index": 0, "text": cached["text"]})
+                yield _sse("done", {"lang": cached.get("lang", lang), "processing_time": round(time.time() - start_time, 3)})
+                return
+            if prepare_error is not None:
+                raise prepare_error
+
+            yield _sse("start", {"units": unit_count, "unit": unit_name, "lang": doc_lang, "cached": False})
+            texts = [''] * unit_count
+            async for index, text, timing in results:
+                texts[index] = text
+                yield _sse("text", {"index": index, "text": text, "elapsed": round(time.time() - start_time, 3)})
+
+            # 分块识别的结果与整页识别可能略有不同，只缓存按页识别的结果
+            full_text = separator.join(texts)
+            if unit_name == 'page' and full_text.strip():
+                await ocr_cache.aset(cache_key, {"text": full_text, "lang": doc_lang})
+            yield _sse("done", {"lang": doc_lang, "processing_time": round(time.time() - start_time, 3)})
+        except Exception as e:
+            logger.error(f"Streaming OCR failed: {e}")
+            yield _sse("error", {"detail": str(e)})
+        finally:
+            if pages is not None:
+                pages.close()
+
+    return StreamingResponse(
+        stream_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def _read_limited(fileobj):
+    """
+    读取文件对象的全部内容，超过MAX_FILE_SIZE时抛出ValueError
+    """
+    data = fileobj.read(MAX_FILE_SIZE + 1)
+    if len(data) > MAX_FILE_SIZE:
+        raise ValueError(f"文件过大。最大允许大小: {MAX_FILE_SIZE // (1024*1024)}MB")
+    return data
+
+def _collect_batch_items(files):
+    """
+    展开批量上传的文件，zip压缩包按其中的图片逐个展开
+    文件内容不在这里读取，处理到该文件时才读入内存
+    :return: tuple (列表[(文件名, 读取函数)], 需要关闭的zip对象列表)
+    """
+    items = []
+    archives = []
+    for file in files:
+        extension = os.path.splitext(file.filename or '')[1].lower()
+        if extension == '.zip':
+            archive = zipfile.ZipFile(file.file)
+            archives.append(archive)
+            for info in archive.infolist():
+                if info.is_dir() or os.path.splitext(info.filename)[1].lower() not in IMAGE_EXTENSIONS:
+                    continue
+                items.append((info.filename, lambda archive=archive, info=info: _read_zip_entry(archive, info)))
+        else:
+            items.append((file.filename, lambda file=file, extension=extension: _read_upload_item(file, extension)))
+    return items, archives
+
+def _read_zip_entry(archive, info):
+    # 先按声明大小拒绝，再限制实际解压的字节数，防止压缩炸弹
+    if info.file_size > MAX_FILE_SIZE:
+        raise ValueError(f"文件过大。最大允许大小: {MAX_FILE_SIZE // (1024*1024)}MB")
+    with archive.open(info) as entry:
+        return _read_limited(entry)
+
+def _read_upload_item(file, extension):
+    if extension not in IMAGE_EXTENSIONS:
+        raise ValueError("Invalid file type. Please upload an image or PDF.")
+    file.file.seek(0)
+    return _read_limited(file.file)
+
+async def _process_batch_item(index, filename, reader, lang, stages, semaphore):
+    """
+    识别批量任务中的单个文件，失败时返回带error字段的结果而不是抛出异常
+    """
+    async with semaphore:
+        start_time = time.time()
+        try:
+            data = await asyncio.to_thread(reader)
+            content_digest = await asyncio.to_thread(lambda: hashlib.sha256(data).hexdigest())
+            # 批量请求的文件都走批量通道，不影响交互请求
+            await schedule_request(data, LANE_BULK)
+            for attempt in range(BATCH_MAX_RETRIES + 1):
+                try:
+                    text, detected_lang, timing = await recognize(data, content_digest, lang, preprocess=stages)
+                    break
+                except PoolSaturated as e:
+                    if attempt == BATCH_MAX_RETRIES:
+                        raise
+                    await asyncio.sleep(e.retry_after)
+            return {
+                "index": index,
+                "filename": filename,
+                "lang": detected_lang,
+                "text": text,
+                "cached": timing is None,
+                "queue_wait": round(timing.queue_wait, 3) if timing else 0.0,
+                "exec_time": round(timing.exec_time, 3) if timing else 0.0,
+                "processing_time": round(time.time() - start_time, 3),
+            }
+        except Exception as e:
+            logger.error(f"Batch OCR failed for {filename}: {e}")
+            return {"index": index, "filename": filename, "error": str(e)}
+
+@api_router.post("/ocr/batch", tags=["OCR"], response_model=None)
+async def perform_ocr_batch(
+    files: List[UploadFile] = File(...),
+    lang: str = Form("eng"),
+    langs: Optional[str] = Form(None),
+    preprocess: Optional[str] = Form(None)
+) -> StreamingResponse:
+    """
+    Perform OCR on many images in one request.
+    Results are streamed back as NDJSON, one line per file in completion order.
+    - **files**: Image files and/or zip archives of images.
+    - **lang**: Default recognition language ('auto' for detection).
+    - **langs**: Optional JSON object mapping filename to language.
+    - **preprocess**: 'none', 'default', or comma-separated preprocessing stages.
+    """
+    stages = parse_preprocess(preprocess)
+    set_request_labels(format='ndjson', lang=metric_lang(lang))
+    try:
+        lang_overrides = json.loads(langs) if langs else {}
+    except ValueError:
+        lang_overrides = None
+    if not isinstance(lang_overrides, dict):
+        raise HTTPException(status_code=400, detail="langs must be a JSON object mapping filename to language.")
+
+    try:
+        items, archives = await asyncio.to_thread(_collect_batch_items, files)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Invalid zip archive.")
+
+    if not items:
+        raise HTTPException(status_code=400, detail="No images found in the request.")
+    if len(items) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=413, detail=f"Too many files in one batch. Maximum: {MAX_BATCH_FILES}")
+
+    logger.info(f"Batch OCR started: {len(items)} files, default lang='{lang}'")
+
+    async def stream_results():
+        start_time = time.time()
+        # 同时处理的文件数与工作者数量一致，避免一个批量请求占满整个队列
+        semaphore = asyncio.Semaphore(ocr_pool.workers)
+        tasks = [
+            asyncio.create_task(_process_batch_item(index, filename, reader, lang_overrides.get(filename, lang), stages, semaphore))
+            for index, (filename, reader) in enumerate(items)
+        ]
+        try:
+            for task in asyncio.as_completed(tasks):
+                result = await task
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+            for archive in archives:
+                archive.close()
+            logger.info(f"Batch OCR finished: {len(items)} files in {time.time() - start_time:.2f}s")
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+async def run_job(job):
+    """
+    后台执行单个OCR任务，工作池繁忙时等待而不是失败
+    """
+    set_request_labels(format='job', lang=metric_lang(job["lang"]))
+    # 后台任务走批量通道，按提交任务的客户端公平排队
+    set_task_context(client=job.get("client", ""))
+    await schedule_request(job["input_path"], LANE_BULK)
+
+    async def report_progress(done, total):
+        # SQLite存储可能等待其他进程的写锁，不能在事件循环中执行
+        await asyncio.to_thread(job_store.update, job["id"], progress=round(done / total, 3))
+
+    while True:
+        try:
+            text, detected_lang, timing = await recognize(
+                job["input_path"], job["content_digest"], job["lang"],
+                progress=report_progress,
+                preprocess=tuple(job["preprocess"]),
+            )
+            break
+        except PoolSaturated as e:
+            await asyncio.sleep(e.retry_after)
+    await asyncio.to_thread(
+        job_store.update,
+        job["id"],
+        status=JOB_DONE,
+        progress=1.0,
+        text=text,
+        detected_lang=detected_lang,
+        exec_time=round(timing.exec_time, 3) if timing else 0.0,
+        finished_at=time.time(),
+    )
+
+job_runner = JobRunner(job_store, run_job, concurrency=ocr_pool.workers)
+
+def job_view(job):
+    """
+    任务记录中可以返回给客户端的字段
+    """
+    view = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "filename": job["filename"],
+        "lang": job["lang"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "status_url": f"/api/jobs/{job['id']}",
+    }
+    if job["status"] == JOB_DONE:
+        view["detected_lang"] = job["detected_lang"]
+        view["result_url"] = f"/api/jobs/{job['id']}/result"
+    if job["status"] == JOB_FAILED:
+        view["error"] = job["error"]
+    return view
+
+async def _get_job_or_404(job_id):
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+async def job_export(job_id, text, writer, name):
+    """
+    导出文件保存在任务目录中，重复获取时直接复用
+    先写入临时文件再改名，同时获取的请求不会读到写了一半的文件
+    :param writer: save_to_word或save_to_pdf
+    :param name: 任务目录中的文件名
+    :return: 文件路径
+    """
+    output_path = os.path.join(job_store.job_dir(job_id), name)
+    if os.path.exists(output_path):
+        return output_path
+    temp_path = os.path.join(job_store.job_dir(job_id), f".{uuid.uuid4().hex}.{name}")
+    try:
+        await asyncio.to_thread(writer, text, temp_path)
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return output_path
+
+@api_router.post("/jobs", tags=["Jobs"], status_code=202)
+async def submit_ocr_job(
+    request: Request,
+    file: UploadFile = File(...),
+    lang: str = Form("eng"),
+    preprocess: Optional[str] = Form(None)
+) -> Dict[str, Any]:
+    """
+    Submit an OCR job and return immediately with a job id.
+    - **file**: Image file to process.
+    - **lang**: Recognition language ('auto' for detection).
+    - **preprocess**: 'none', 'default', or comma-separated preprocessing stages.
+    """
+    stages = parse_preprocess(preprocess)
+    if file.size and file.size > MAX_FILE_SIZE:
+        raise HTTPException(status_code=413, detail="File size exceeds 50MB limit.")
+
+    file_extension = os.path.splitext(file.filename)[1].lower()
+    if file_extension not in IMAGE_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Invalid file type. Please upload an image or PDF.")
+
+    # 过期任务由后台清理任务（run_sweeper）定期删除，提交时不再扫描任务目录
+    if await asyncio.to_thread(job_store.pending_count) >= OCR_MAX_PENDING_JOBS:
+        raise PoolSaturated(ocr_pool.retry_after())
+
+    content_digest = await validate_file_size(file)
+    job_id = await asyncio.to_thread(job_store.new_id)
+    input_path = os.path.join(job_store.job_dir(job_id), f"input{file_extension}")
+
+    def copy_upload():
+        with open(input_path, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+
+    # 输入文件写好后才登记任务，其他进程领取时文件一定存在
+    await asyncio.to_thread(copy_upload)
+    job = await asyncio.to_thread(
+        job_store.create, job_id, filename=file.filename, lang=lang, content_digest=content_digest,
+        preprocess=list(stages), input_path=input_path, client=client_id(request))
+    job_runner.submit(job["id"])
+    logger.info(f"OCR job {job['id']} queued with lang='{lang}'")
+    return job_view(job)
+
+@api_router.get("/jobs/{job_id}", tags=["Jobs"])
+async def get_ocr_job(job_id: str) -> Dict[str, Any]:
+    """
+    Get the status and progress of an OCR job.
+    """
+    return job_view(await _get_job_or_404(job_id))
+
+@api_router.get("/jobs/{job_id}/result", tags=["Jobs"], response_model=None)
+async def get_ocr_job_result(job_id: str, output_format: str = "text") -> FileResponse | JSONResponse:
+    """
+    Fetch the result of a finished OCR job.
+    - **output_format**: 'text', 'word', or 'pdf'.
+    """
+    job = await _get_job_or_404(job_id)
+    if job["status"] != JOB_DONE:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}.")
+
+    if output_format == 'text':
+        return JSONResponse(content={"text": job["text"], "detected_lang": get_language_name(job["detected_lang"])})
+
+    if output_format == 'word':
+        output_path = await job_export(job_id, job["text"], save_to_word, "result.docx")
+        return FileResponse(output_path, media_type=WORD_MEDIA_TYPE, filename=f"{job_id}.docx")
+
+    elif output_format == 'pdf':
+        output_path = await job_export(job_id, job["text"], save_to_pdf, "result.pdf")
+        return FileResponse(output_path, media_type=PDF_MEDIA_TYPE, filename=f"{job_id}.pdf")
+
+    raise HTTPException(status_code=400, detail="Invalid output format specified.")
+
+@api_router.delete("/jobs/{job_id}", tags=["Jobs"])
+async def delete_ocr_job(job_id: str) -> Dict[str, Any]:
+    """
+    Delete an OCR job and its files.
+    """
+    if not await asyncio.to_thread(job_store.delete, job_id):
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return {"deleted": True}
+
+# 请求和资源指标
+HTTP_REQUESTS = metrics.REGISTRY.register(Counter(
+    'ocr_http_requests_total', 'HTTP requests by route and status.', ('method', 'route', 'status')))
+HTTP_REQUEST_SECONDS = metrics.REGISTRY.register(Histogram(
+    'ocr_http_request_duration_seconds', 'Time until the response starts, by route.', ('method', 'route')))
+metrics.REGISTRY.register(CallbackMetric(
+    'ocr_pool_inflight', 'OCR tasks running or waiting in the worker pool.', lambda: ocr_pool.stats()["inflight"]))
+metrics.REGISTRY.register(CallbackMetric(
+    'ocr_pool_queue_depth', 'OCR tasks waiting for a free worker.', lambda: ocr_pool.stats()["queued"]))
+metrics.REGISTRY.register(CallbackMetric(
+    'ocr_pool_lane_queue_depth', 'OCR tasks waiting for a free worker, by scheduling lane.',
+    lambda: {(lane,): count for lane, count in ocr_pool.stats()["queued_by_lane"].items()}, ('lane',)))
+metrics.REGISTRY.register(CallbackMetric(
+    'ocr_pool_workers', 'Number of OCR workers.', lambda: ocr_pool.workers))
+metrics.REGISTRY.register(CallbackMetric(
+    'ocr_pool_rejected_total', 'OCR tasks rejected because the queue was full.',
+    lambda: ocr_pool.stats()["rejected"], kind='counter'))
+metrics.REGISTRY.register(CallbackMetric(
+    'ocr_cache_lookups_total', 'OCR result cache lookups by result.',
+    lambda: {(result,): ocr_cache.stats()[key] for result, key in (('hit', 'hits'), ('miss', 'misses'))},
+    ('result',), kind='counter'))
+metrics.REGISTRY.register(CallbackMetric(
+    'ocr_jobs', 'OCR jobs by status.',
+    lambda: {(status,): count for status, count in job_store.stats().items() if status != 'disk_bytes'},
+    ('status',)))
+metrics.REGISTRY.register(CallbackMetric(
+    'ocr_artifact_bytes', 'Bytes held by exported artifacts and job directories.',
+    lambda: {('outputs',): artifact_store.stats()["bytes"], ('jobs',): job_store.stats()["disk_bytes"]},
+    ('store',)))
+metrics.REGISTRY.register(CallbackMetric(
+    'ocr_artifact_files', 'Exported artifact files on disk.', lambda: artifact_store.stats()["files"]))
+
+@app.middleware("http")
+async def assign_ocr_client(request, call_next):
+    # 请求中提交的OCR任务都记在这个客户端名下
+    set_task_context(client=client_id(request))
+    _request_admission.set({"accepted": False})
+    return await call_next(request)
+
+@app.middleware("http")
+async def record_request_metrics(request, call_next):
+    start_time = time.time()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # 使用路由模板而不是实际路径，避免任务ID等产生大量标签
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        HTTP_REQUESTS.inc(method=request.method, route=route_path, status=status)
+        HTTP_REQUEST_SECONDS.observe(time.time() - start_time, method=request.method, route=route_path)
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    Metrics in Prometheus text exposition format.
+    """
+    # 回调指标会查询SQLite任务存储
+    content = await asyncio.to_thread(metrics.render)
+    return Response(content=content, media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # 将路由器包含到主应用中
 app.include_router(api_router)
@@ -0,0 +1,226 @@
+"""
+运行指标
+
+以Prometheus文本格式导出请求数、队列深度和各处理阶段的耗时直方图。
+工作池中的任务（包括进程池）先把阶段耗时记录在本地，任务结束后随结果带回主进程再汇总，
+所以两种工作池模式下看到的指标一致。
+"""
+import contextvars
+import math
+import threading
+from contextlib import contextmanager
+
+# 耗时直方图的分桶上限（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# 处理阶段名称
+STAGE_UPLOAD = 'upload_read'
+STAGE_DECODE = 'decode'
+STAGE_PREPROCESS = 'preprocess'
+STAGE_LAYOUT = 'layout'
+STAGE_RECOGNITION = 'recognition'
+STAGE_LANGUAGE = 'language_detection'
+STAGE_EXPORT = 'export'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    kind = 'counter'
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """按分桶统计观测值分布的直方图"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = state[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """
+    在导出时调用函数读取当前值的指标，用于已经在别处统计的数值（如工作池、缓存状态）
+    :param callback: 返回数值，或 {标签值元组: 数值} 字典
+    :param kind: 'gauge' 或 'counter'
+    """
+
+    def __init__(self, name, documentation, callback, labelnames=(), kind='gauge'):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self.kind = kind
+
+    def render(self):
+        lines = self.header()
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    """指标集合"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        :return: Prometheus文本格式
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'ocr_stage_duration_seconds',
+    'Time spent in each OCR processing stage.',
+    ('stage', 'lang', 'format'),
+))
+
+# 当前请求的标签（如输出格式），asyncio任务和to_thread会继承
+_request_labels = contextvars.ContextVar('ocr_request_labels', default={})
+# 工作池任务执行期间，阶段耗时先记录到这里
+_collector = threading.local()
+
+
+def set_request_labels(**labels):
+    """
+    设置当前请求的默认标签，之后记录的阶段耗时都会带上
+    """
+    _request_labels.set({**_request_labels.get(), **labels})
+
+
+def observe_stage(stage, seconds, lang=''):
+    """
+    直接记录一次阶段耗时（主进程中调用）
+    """
+    labels = _request_labels.get()
+    STAGE_SECONDS.observe(seconds, stage=stage, lang=lang or labels.get('lang', ''), format=labels.get('format', ''))
+
+
+def record_stage(stage, seconds, lang=''):
+    """
+    记录一次阶段耗时，可以在工作线程或工作进程中调用
+    在工作池任务中时先缓存，由merge_samples在主进程中汇总
+    """
+    samples = getattr(_collector, 'samples', None)
+    if samples is not None:
+        samples.append((stage, seconds, lang))
+    else:
+        observe_stage(stage, seconds, lang)
+
+
+@contextmanager
+def collect_samples():
+    """
+    收集代码块中记录的阶段耗时
+    :return: 样本列表，可以序列化后传回主进程
+    """
+    previous = getattr(_collector, 'samples', None)
+    samples = _collector.samples = []
+    try:
+        yield samples
+    finally:
+        _collector.samples = previous
+
+
+def merge_samples(samples):
+    """
+    汇总工作池任务带回的阶段耗时，使用当前请求的标签
+    """
+    for stage, seconds, lang in samples or ():
+        observe_stage(stage, seconds, lang)
+
+
+def render():
+    return REGISTRY.render()
@@ -0,0 +1,296 @@
+"""
+OCR结果缓存
+
+以图片内容哈希 + 语言 + 引擎配置 + Tesseract版本为键，缓存识别结果。
+内存层为有界LRU；设置 OCR_CACHE_DIR 后启用磁盘层，重启后仍然有效。
+设置 OCR_CACHE_DB 时磁盘层改用SQLite文件，多个服务进程共享同一份缓存。
+在事件循环中使用aget/aset，磁盘层的读写放到线程中执行。
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from sqlite_store import SQLiteDatabase
+
+logger = logging.getLogger(__name__)
+
+# 缓存配置（可通过环境变量覆盖）
+OCR_CACHE_SIZE = int(os.getenv("OCR_CACHE_SIZE", 256))
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", "")  # 留空则不启用磁盘层
+OCR_CACHE_DB = os.getenv("OCR_CACHE_DB", "")  # SQLite文件路径，设置后代替OCR_CACHE_DIR
+OCR_CACHE_DISK_MAX_ENTRIES = int(os.getenv("OCR_CACHE_DISK_MAX_ENTRIES", 10000))
+
+# 每写入多少次磁盘缓存检查一次容量
+_DISK_PRUNE_INTERVAL = 100
+
+_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ocr_cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ocr_cache_accessed_at ON ocr_cache (accessed_at);
+"""
+
+
+class OCRResultCache:
+    """
+    两级OCR结果缓存
+    :param namespace: 引擎、识别参数、Tesseract版本等组成的字符串，任何一项变化都会使旧缓存失效；
+                      也可以是返回该字符串的函数，在第一次使用时才调用（避免导入时查询Tesseract版本）；
+                      函数返回None表示暂时无法确定（例如Tesseract还不可用），此时不缓存，下次使用时重新调用
+    :param max_entries: 内存层最大条目数，0表示不使用内存层
+    :param disk_dir: 磁盘层目录，为空则不启用
+    :param disk_max_entries: 磁盘层最大条目数
+    :param disk_db: SQLite文件路径，设置后磁盘层使用SQLite而不是disk_dir
+    """
+
+    def __init__(self, namespace, max_entries=OCR_CACHE_SIZE, disk_dir=OCR_CACHE_DIR,
+                 disk_max_entries=OCR_CACHE_DISK_MAX_ENTRIES, disk_db=OCR_CACHE_DB):
+        self._namespace = namespace
+        self.max_entries = max(0, max_entries)
+        self.disk_db = SQLiteDatabase(disk_db, _CACHE_SCHEMA) if disk_db else None
+        self.disk_dir = (disk_dir or None) if self.disk_db is None else None
+        self.disk_max_entries = disk_max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_writes = 0
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @property
+    def namespace(self):
+        if not callable(self._namespace):
+            return self._namespace
+        namespace = self._namespace()
+        if namespace is not None:
+            self._namespace = namespace
+        return namespace
+
+    @property
+    def disk_enabled(self):
+        return bool(self.disk_dir or self.disk_db)
+
+    def make_key(self, content_digest, lang, *options):
+        """
+        计算缓存键
+        :param content_digest: 图片原始字节的SHA-256（十六进制）
+        :param lang: 请求的语言（包括'auto'）
+        :param options: 其他影响识别结果的参数（如预处理步骤）
+        :return: 十六进制哈希字符串，命名空间暂时无法确定时返回None（get/set不做任何操作）
+        """
+        namespace = self.namespace
+        if namespace is None:
+            return None
+        parts = [content_digest, lang, *(str(option) for option in options), namespace]
+        return hashlib.sha256("|".join(parts).encode('utf-8')).hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """
+        读取缓存，未命中返回None
+        """
+        if key is None:
+            return None
+        value = self._memory_get(key)
+        if value is not None:
+            return value
+        value = self._disk_get(key)
+        self._record_disk_result(key, value)
+        return value
+
+    def set(self, key, value):
+        """
+        写入缓存，value必须可以序列化为JSON
+        """
+        if key is None:
+            return
+        with self._lock:
+            self._memory_set(key, value)
+        self._disk_set(key, value)
+
+    async def aget(self, key):
+        """
+        get的异步版本，内存层未命中时在线程中读取磁盘层，不阻塞事件循环
+        """
+        if key is None:
+            return None
+        value = self._memory_get(key)
+        if value is not None:
+            return value
+        value = await asyncio.to_thread(self._disk_get, key) if self.disk_enabled else None
+        self._record_disk_result(key, value)
+        return value
+
+    async def aset(self, key, value):
+        """
+        set的异步版本，磁盘层的写入和容量清理在线程中执行
+        """
+        if key is None:
+            return
+        with self._lock:
+            self._memory_set(key, value)
+        if self.disk_enabled:
+            await asyncio.to_thread(self._disk_set, key, value)
+
+    def _memory_get(self, key):
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self._hits += 1
+            return value
+
+    def _record_disk_result(self, key, value):
+        with self._lock:
+            if value is None:
+                self._misses += 1
+                return
+            self._hits += 1
+            self._disk_hits += 1
+            self._memory_set(key, value)
+
+    def _memory_set(self, key, value):
+        if self.max_entries == 0:
+            return
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key):
+        if self.disk_db is not None:
+            return self._db_get(key)
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to read OCR cache entry {key}: {e}")
+            return None
+
+    def _disk_set(self, key, value):
+        if self.disk_db is not None:
+            self._db_set(key, value)
+            return
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再替换，避免其他进程读到写了一半的文件
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write OCR cache entry {key}: {e}")
+            return
+
+        with self._lock:
+            self._disk_writes += 1
+            should_prune = self._disk_writes % _DISK_PRUNE_INTERVAL == 0
+        if should_prune:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """
+        磁盘层超过容量时删除最久未修改的条目
+        """
+        entries = []
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                if name.endswith('.json'):
+                    path = os.path.join(root, name)
+                    try:
+                        entries.append((os.path.getmtime(path), path))
+                    except OSError:
+                        continue
+        excess = len(entries) - self.disk_max_entries
+        if excess <= 0:
+            return
+        entries.sort()
+        for _, path in entries[:excess]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        logger.info(f"Pruned {excess} OCR cache entries from disk")
+
+    def _db_get(self, key):
+        try:
+            row = self.disk_db.execute("SELECT value FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            # 记录访问时间，淘汰时保留常用条目
+            self.disk_db.execute("UPDATE ocr_cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            return json.loads(row["value"])
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"Failed to read OCR cache entry {key}: {e}")
+            return None
+
+    def _db_set(self, key, value):
+        try:
+            self.disk_db.execute(
+                "INSERT OR REPLACE INTO ocr_cache (key, value, accessed_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time()),
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to write OCR cache entry {key}: {e}")
+            return
+
+        with self._lock:
+            self._disk_writes += 1
+            should_prune = self._disk_writes % _DISK_PRUNE_INTERVAL == 0
+        if should_prune:
+            self._prune_db()
+
+    def _prune_db(self):
+        """
+        SQLite层超过容量时删除最久未访问的条目
+        """
+        try:
+            with self.disk_db.transaction() as conn:
+                count = conn.execute("SELECT COUNT(*) FROM ocr_cache").fetchone()[0]
+                excess = count - self.disk_max_entries
+                if excess <= 0:
+                    return
+                conn.execute(
+                    "DELETE FROM ocr_cache WHERE key IN "
+                    "(SELECT key FROM ocr_cache ORDER BY accessed_at LIMIT ?)", (excess,))
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to prune OCR cache: {e}")
+            return
+        logger.info(f"Pruned {excess} OCR cache entries from {self.disk_db.path}")
+
+    def stats(self):
+        """
+        返回缓存命中统计
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "disk_enabled": self.disk_enabled,
+                "disk_backend": "sqlite" if self.disk_db else ("files" if self.disk_dir else None),
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+            }
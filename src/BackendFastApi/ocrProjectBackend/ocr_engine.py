@@ -0,0 +1,339 @@
+"""
+OCR识别引擎
+
+- pytesseract: 每次调用都会写临时图片并启动一次tesseract进程（默认，无需额外依赖）
+- tesserocr:   进程内常驻的Tesseract API句柄，每个线程、每种语言组合初始化一次后复用，
+               省去进程启动和traineddata加载的开销
+通过环境变量 OCR_ENGINE 选择默认引擎。
+"""
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+import pytesseract
+from PIL import Image
+
+try:
+    import tesserocr
+except ImportError:  # 可选依赖
+    tesserocr = None
+
+logger = logging.getLogger(__name__)
+
+OCR_ENGINE = os.getenv("OCR_ENGINE", "pytesseract")
+# 每个线程最多保留的语言句柄数量，超出后关闭最久未使用的
+OCR_ENGINE_MAX_HANDLES = int(os.getenv("OCR_ENGINE_MAX_HANDLES", 4))
+
+# Tesseract识别参数，两个引擎保持一致
+TESSERACT_OEM = 3
+TESSERACT_PSM = 6
+TESSERACT_CONFIG = f"--oem {TESSERACT_OEM} --psm {TESSERACT_PSM}"
+# 仅做方向与文字脚本检测（需要osd.traineddata）
+TESSERACT_PSM_OSD = 0
+
+# image_to_data返回的单词数据字段，按列存储
+WORD_FIELDS = ('text', 'left', 'top', 'width', 'height', 'conf', 'line')
+
+
+# 16/32位整数灰度模式，像素值按16位范围存储
+_WIDE_GRAY_MODES = ('I;16', 'I;16L', 'I;16B', 'I;16N', 'I')
+
+
+def to_gray(image):
+    """
+    转换为8位灰度图。Tesseract在二值化之前本来就会转为灰度，识别结果不变
+    - 16位灰度图缩放到8位，直接convert('L')会把大于255的值截断为白色
+    - 带透明通道的图片先合成到白色背景上，与pytesseract的处理一致
+    """
+    if image.mode == 'L':
+        return image
+    info = dict(image.info)
+    if is_wide_gray(image):
+        pixels = np.clip(np.asarray(image, dtype=np.int64), 0, 65535) >> 8
+        gray = Image.fromarray(pixels.astype(np.uint8))
+    else:
+        gray = _flatten_alpha(image).convert('L')
+    gray.info = info
+    return gray
+
+
+def to_rgb(image):
+    """
+    转换为RGB图，调色板图片保留颜色，透明区域按白色背景处理
+    """
+    if image.mode == 'RGB':
+        return image
+    info = dict(image.info)
+    if is_wide_gray(image):
+        rgb = to_gray(image).convert('RGB')
+    else:
+        rgb = _flatten_alpha(image).convert('RGB')
+    rgb.info = info
+    return rgb
+
+
+def is_wide_gray(image):
+    """
+    是否为16/32位整数灰度图
+    """
+    return image.mode in _WIDE_GRAY_MODES
+
+
+def _flatten_alpha(image):
+    """
+    带透明通道的图片合成到白色背景上，其他图片原样返回
+    """
+    if image.mode in ('RGBA', 'LA', 'PA', 'RGBa', 'La') or (image.mode == 'P' and 'transparency' in image.info):
+        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        background.alpha_composite(image.convert('RGBA'))
+        return background
+    return image
+
+
+def _source_dpi(image):
+    """
+    图片的DPI（取整），没有DPI信息时返回0，由Tesseract自行估计
+    """
+    dpi = image.info.get('dpi', (0, 0))[0]
+    try:
+        return int(round(float(dpi))) if dpi and dpi > 1 else 0
+    except (TypeError, ValueError):
+        return 0
+
+
+def _dpi_option(image):
+    """
+    PGM文件中没有DPI信息，通过命令行参数传给tesseract
+    """
+    dpi = _source_dpi(image)
+    return f" --dpi {dpi}" if dpi else ""
+
+
+def _command_config(image, psm=TESSERACT_PSM):
+    """
+    tesseract命令行参数
+    """
+    return f"--oem {TESSERACT_OEM} --psm {psm}" + _dpi_option(image)
+
+
+@contextmanager
+def _raw_image_file(image):
+    """
+    把图片写成无压缩的8位灰度PGM临时文件，交给tesseract命令行读取
+    pytesseract默认重新编码为PNG，大图的zlib压缩耗时可观；PGM写入只是内存拷贝
+    :return: 临时文件路径
+    """
+    fd, path = tempfile.mkstemp(prefix='ocr_', suffix='.pgm')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            to_gray(image).save(f, format='PPM')
+        yield path
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _empty_words():
+    return {field: [] for field in WORD_FIELDS}
+
+
+def _join_lines(words):
+    """
+    按行号把单词拼成文本，每行一个换行
+    """
+    lines = []
+    current_line = None
+    for text, line in zip(words['text'], words['line']):
+        if line != current_line:
+            lines.append([])
+            current_line = line
+        lines[-1].append(text)
+    return '\n'.join(' '.join(line) for line in lines)
+
+
+class PytesseractEngine:
+    """通过pytesseract调用tesseract命令行"""
+    name = 'pytesseract'
+
+    def image_to_string(self, image, lang, psm=TESSERACT_PSM):
+        """
+        :param psm: 页面分割模式，版面分析后的单行区域使用7
+        """
+        with _raw_image_file(image) as path:
+            return pytesseract.image_to_string(path, lang=lang, config=_command_config(image, psm))
+
+    def detect_script(self, image):
+        """
+        使用Tesseract OSD检测文字脚本
+        :return: tuple (脚本名称如'Latin'/'Han', 置信度)
+        """
+        with _raw_image_file(image) as path:
+            osd = pytesseract.image_to_osd(path, config=_dpi_option(image).strip(), output_type=pytesseract.Output.DICT)
+        return osd.get('script'), float(osd.get('script_conf', 0.0))
+
+    def image_to_data(self, image, lang):
+        """
+        一次识别同时得到文本和每个单词的位置与置信度
+        :return: tuple (文本, 单词数据字典，字段见WORD_FIELDS)
+        """
+        with _raw_image_file(image) as path:
+            data = pytesseract.image_to_data(path, lang=lang, config=_command_config(image),
+                                             output_type=pytesseract.Output.DICT)
+        words = _empty_words()
+        line_keys = {}
+        for i, text in enumerate(data['text']):
+            text = text.strip()
+            if int(data['level'][i]) != 5 or not text:
+                continue
+            key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+            words['text'].append(text)
+            words['left'].append(int(data['left'][i]))
+            words['top'].append(int(data['top'][i]))
+            words['width'].append(int(data['width'][i]))
+            words['height'].append(int(data['height'][i]))
+            words['conf'].append(round(float(data['conf'][i]), 2))
+            words['line'].append(line_keys.setdefault(key, len(line_keys)))
+        return _join_lines(words), words
+
+
+class TesserocrEngine:
+    """
+    常驻的Tesseract API句柄
+    句柄不是线程安全的，所以每个线程各自持有一组，按语言组合缓存
+    """
+    name = 'tesserocr'
+
+    def __init__(self, max_handles=OCR_ENGINE_MAX_HANDLES):
+        if tesserocr is None:
+            raise RuntimeError("tesserocr is not installed")
+        self.max_handles = max(1, max_handles)
+        self._local = threading.local()
+
+    def _get_api(self, lang, psm=TESSERACT_PSM):
+        apis = getattr(self._local, 'apis', None)
+        if apis is None:
+            apis = self._local.apis = OrderedDict()
+
+        key = (lang, psm)
+        api = apis.get(key)
+        if api is not None:
+            apis.move_to_end(key)
+            return api
+
+        api = tesserocr.PyTessBaseAPI(
+            lang=lang,
+            oem=TESSERACT_OEM,
+            psm=psm,
+        )
+        apis[key] = api
+        logger.info(f"Initialized tesserocr handle for '{lang}' (psm {psm}) in {threading.current_thread().name}")
+
+        while len(apis) > self.max_handles:
+            _, old_api = apis.popitem(last=False)
+            old_api.End()
+        return api
+
+    @staticmethod
+    def _set_image(api, image):
+        """
+        直接传入灰度像素缓冲区，SetImage会先把PIL图片编码为BMP再解码
+        像素缓冲区不带DPI信息，单独设置
+        """
+        gray = to_gray(image)
+        api.SetImageBytes(gray.tobytes(), gray.width, gray.height, 1, gray.width)
+        dpi = _source_dpi(image)
+        if dpi:
+            api.SetSourceResolution(dpi)
+
+    def image_to_string(self, image, lang, psm=TESSERACT_PSM):
+        api = self._get_api(lang, psm)
+        try:
+            self._set_image(api, image)
+            return api.GetUTF8Text()
+        finally:
+            api.Clear()
+
+    def detect_script(self, image):
+        api = self._get_api('osd', psm=TESSERACT_PSM_OSD)
+        try:
+            self._set_image(api, image)
+            osd = api.DetectOrientationScript() or {}
+            return osd.get('script_name'), float(osd.get('script_conf', 0.0))
+        finally:
+            api.Clear()
+
+    def image_to_data(self, image, lang):
+        api = self._get_api(lang)
+        try:
+            self._set_image(api, image)
+            api.Recognize()
+            words = _empty_words()
+            line = -1
+            # Recognize之后遍历结果不会再次识别
+            iterator = api.GetIterator()
+            for word in tesserocr.iterate_level(iterator, tesserocr.RIL.WORD):
+                if word.IsAtBeginningOf(tesserocr.RIL.TEXTLINE):
+                    line += 1
+                text = (word.GetUTF8Text(tesserocr.RIL.WORD) or '').strip()
+                box = word.BoundingBox(tesserocr.RIL.WORD)
+                if not text or box is None:
+                    continue
+                left, top, right, bottom = box
+                words['text'].append(text)
+                words['left'].append(left)
+                words['top'].append(top)
+                words['width'].append(right - left)
+                words['height'].append(bottom - top)
+                words['conf'].append(round(float(word.Confidence(tesserocr.RIL.WORD)), 2))
+                words['line'].append(max(line, 0))
+            return api.GetUTF8Text(), words
+        finally:
+            api.Clear()
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(name=None):
+    """
+    获取识别引擎实例（同名引擎只创建一次）
+    :param name: 'pytesseract' 或 'tesserocr'，为None时使用OCR_ENGINE
+    :return: 引擎实例
+    """
+    name = name or OCR_ENGINE
+    with _engines_lock:
+        engine = _engines.get(name)
+        if engine is not None:
+            return engine
+
+        if name == 'tesserocr':
+            try:
+                engine = TesserocrEngine()
+            except RuntimeError as e:
+                logger.warning(f"{e}, falling back to pytesseract")
+                engine = _engines.get('pytesseract') or PytesseractEngine()
+        elif name == 'pytesseract':
+            engine = PytesseractEngine()
+        else:
+            raise ValueError(f"Unknown OCR engine: {name}")
+
+        _engines[name] = engine
+        _engines[engine.name] = engine
+        return engine
+
+
+def available_engines():
+    """
+    返回当前环境可用的引擎名称
+    """
+    engines = ['pytesseract']
+    if tesserocr is not None:
+        engines.append('tesserocr')
+    return engines
@@ -0,0 +1,357 @@
+"""
+OCR工作池
+
+将阻塞的OCR调用从事件循环中移到线程池/进程池执行，并对排队任务数量做准入控制。
+队列满时直接拒绝（由调用方转换为503 + Retry-After），避免请求无限堆积导致延迟失控。
+
+排队的任务由工作池自己调度，有空闲工作者时才交给执行器：
+- 任务分为交互（小图片）和批量（大文档、批量接口、后台任务）两条通道，按权重分配工作者，
+  交互请求不会排在大批量任务后面，批量任务在没有交互请求时仍占满所有工作者
+- 同一通道内按客户端（IP或API Key）公平排队，按估算的识别开销（像素数）轮流执行，
+  一个客户端提交大量任务不会让其他客户端一直等待
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from dataclasses import dataclass
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# 工作池配置（可通过环境变量覆盖）
+OCR_POOL_KIND = os.getenv("OCR_POOL_KIND", "thread")  # thread 或 process
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", os.cpu_count() or 1))
+OCR_MAX_QUEUE = int(os.getenv("OCR_MAX_QUEUE", OCR_WORKERS * 4))
+OCR_RETRY_AFTER = int(os.getenv("OCR_RETRY_AFTER", 5))
+OCR_INTERACTIVE_MAX_COST = float(os.getenv("OCR_INTERACTIVE_MAX_COST", 12))  # 交互通道请求的最大开销（百万像素）
+OCR_INTERACTIVE_WEIGHT = float(os.getenv("OCR_INTERACTIVE_WEIGHT", 4))  # 两条通道都有任务时交互通道的份额是批量通道的几倍
+OCR_BULK_QUEUE_SHARE = float(os.getenv("OCR_BULK_QUEUE_SHARE", 0.75))  # 批量任务最多占用的排队位置比例，其余留给交互请求
+
+# 调度通道
+LANE_INTERACTIVE = 'interactive'
+LANE_BULK = 'bulk'
+LANES = (LANE_INTERACTIVE, LANE_BULK)
+
+# 没有尺寸信息的任务的开销（百万像素），约为一页A4纸300DPI
+DEFAULT_TASK_COST = 8.0
+
+# 当前请求的调度信息：客户端、通道、整个请求的估算开销
+_task_context = contextvars.ContextVar('ocr_task_context', default={})
+
+
+class PoolSaturated(Exception):
+    """OCR任务队列已满"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"OCR queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+@dataclass
+class TaskTiming:
+    """单个任务的耗时（秒）"""
+    queue_wait: float
+    exec_time: float
+
+    def server_timing(self):
+        """
+        转换为Server-Timing响应头的值
+        """
+        return f"queue;dur={self.queue_wait * 1000:.1f}, ocr;dur={self.exec_time * 1000:.1f}"
+
+
+def set_task_context(**fields):
+    """
+    设置当前请求之后提交的OCR任务的调度信息
+    :param fields: client（客户端标识）、lane（通道）、cost（请求的估算开销，百万像素）
+    """
+    _task_context.set({**_task_context.get(), **fields})
+
+
+def lane_for_cost(cost):
+    """
+    按请求的估算开销选择通道
+    """
+    return LANE_INTERACTIVE if cost <= OCR_INTERACTIVE_MAX_COST else LANE_BULK
+
+
+def _task_cost(args, context):
+    """
+    估算单个任务的开销：以图片为参数的任务（多页文档中的一页、文本块）按像素数计算，
+    其余使用请求的估算值
+    """
+    if args and hasattr(args[0], 'width') and hasattr(args[0], 'height'):
+        return max(args[0].width * args[0].height / 1e6, 0.01)
+    return context.get('cost') or DEFAULT_TASK_COST
+
+
+class FairScheduler:
+    """
+    等待工作者的任务队列
+    通道之间按权重做步长调度（stride scheduling），每执行一个任务，通道的进度增加 开销/权重，
+    总是选择进度最小的通道；通道内按客户端做开始时间公平排队（start-time fair queuing），
+    同一客户端的任务按提交顺序执行，不同客户端按累计开销轮流执行
+    """
+
+    def __init__(self, weights=None):
+        self.weights = weights or {LANE_INTERACTIVE: OCR_INTERACTIVE_WEIGHT, LANE_BULK: 1.0}
+        # 通道 -> [(虚拟开始时间, 序号, 开销, 等待者)]
+        self._queues = {lane: [] for lane in LANES}
+        # 通道的虚拟时间（最近执行任务的开始时间）和各客户端最后一个任务的虚拟结束时间
+        self._virtual_time = {lane: 0.0 for lane in LANES}
+        self._client_finish = {lane: {} for lane in LANES}
+        self._lane_pass = {lane: 0.0 for lane in LANES}
+        # 最近执行任务的通道进度
+        self._global_pass = 0.0
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def queued(self, lane):
+        return len(self._queues[lane])
+
+    def clients(self):
+        return len({client for finish in self._client_finish.values() for client in finish})
+
+    def push(self, lane, client, cost, waiter):
+        queue = self._queues[lane]
+        if not queue:
+            # 空闲过的通道不能积累份额，从当前进度开始
+            self._lane_pass[lane] = max(self._lane_pass[lane], self._global_pass)
+        finish = self._client_finish[lane]
+        start = max(self._virtual_time[lane], finish.get(client, 0.0))
+        finish[client] = start + cost
+        heapq.heappush(queue, (start, next(self._seq), cost, waiter))
+
+    def pop(self):
+        """
+        取出下一个执行的等待者
+        :return: 等待者，队列为空时返回None
+        """
+        candidates = [lane for lane in LANES if self._queues[lane]]
+        if not candidates:
+            return None
+        lane = min(candidates, key=lambda name: self._lane_pass[name])
+        queue = self._queues[lane]
+        start, _, cost, waiter = heapq.heappop(queue)
+        self._virtual_time[lane] = start
+        self._global_pass = self._lane_pass[lane]
+        self._lane_pass[lane] += cost / self.weights[lane]
+        if not queue:
+            # 通道清空后重新开始计算，不保留已离开的客户端
+            self._client_finish[lane].clear()
+        return waiter
+
+    def discard(self, waiter):
+        """
+        移除取消的等待者
+        """
+        for queue in self._queues.values():
+            for index, item in enumerate(queue):
+                if item[3] is waiter:
+                    queue[index] = queue[-1]
+                    queue.pop()
+                    heapq.heapify(queue)
+                    return
+
+
+def _timed_call(fn, args, kwargs):
+    """
+    在工作线程/进程中执行任务并记录开始、结束时间，同时收集任务中记录的阶段耗时
+    必须是模块级函数，才能被进程池序列化
+    """
+    started_at = time.time()
+    with metrics.collect_samples() as samples:
+        result = fn(*args, **kwargs)
+    return result, started_at, time.time(), samples
+
+
+class OCRWorkerPool:
+    """
+    带有界队列的OCR工作池
+    :param kind: 'thread' 或 'process'
+    :param workers: 并发执行的工作者数量
+    :param max_queue: 允许排队等待的最大任务数
+    """
+
+    def __init__(self, kind=OCR_POOL_KIND, workers=OCR_WORKERS, max_queue=OCR_MAX_QUEUE):
+        if kind not in ('thread', 'process'):
+            raise ValueError(f"Unknown OCR pool kind: {kind}")
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._lane_inflight = {lane: 0 for lane in LANES}
+        # 正在执行的任务数，不超过workers，其余任务在调度器中等待
+        self._running = 0
+        self._scheduler = FairScheduler()
+        self._rejected = 0
+        self._completed = 0
+        self._avg_exec_time = 0.0
+
+    def start(self):
+        """
+        创建底层执行器
+        """
+        if self._executor is not None:
+            return
+        if self.kind == 'process':
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ocr")
+        logger.info(f"OCR pool started: kind={self.kind}, workers={self.workers}, max_queue={self.max_queue}")
+
+    def shutdown(self, wait=True):
+        """
+        关闭执行器，wait为True时等待已提交的任务完成
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=not wait)
+            self._executor = None
+
+    @property
+    def capacity(self):
+        return self.workers + self.max_queue
+
+    def retry_after(self):
+        """
+        根据平均执行时间估算排队任务清空所需的秒数
+        """
+        if self._avg_exec_time <= 0:
+            return OCR_RETRY_AFTER
+        backlog = self._inflight / self.workers
+        return max(1, math.ceil(self._avg_exec_time * backlog))
+
+    def _admit(self, lane):
+        # 批量任务不能占满队列，交互请求总有排队位置
+        limit = self.capacity
+        if lane == LANE_BULK:
+            limit = self.workers + math.floor(self.max_queue * OCR_BULK_QUEUE_SHARE)
+        with self._lock:
+            if self._inflight >= self.capacity or self._lane_inflight[lane] >= limit:
+                self._rejected += 1
+                raise PoolSaturated(self.retry_after())
+            self._inflight += 1
+            self._lane_inflight[lane] += 1
+
+    def _release(self, lane, exec_time=None):
+        with self._lock:
+            self._inflight -= 1
+            self._lane_inflight[lane] -= 1
+            if exec_time is not None:
+                self._completed += 1
+                # 指数移动平均，用于估算Retry-After
+                if self._avg_exec_time == 0:
+                    self._avg_exec_time = exec_time
+                else:
+                    self._avg_exec_time = 0.8 * self._avg_exec_time + 0.2 * exec_time
+
+    async def _acquire_worker(self, lane, client, cost):
+        """
+        等待调度器分配工作者
+        """
+        with self._lock:
+            if self._running < self.workers and not len(self._scheduler):
+                self._running += 1
+                return
+            waiter = asyncio.get_running_loop().create_future()
+            self._scheduler.push(lane, client, cost, waiter)
+        try:
+            # 分配到工作者时，_release_worker直接把名额转交给这个等待者
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = waiter.done() and not waiter.cancelled()
+                if not granted:
+                    self._scheduler.discard(waiter)
+            if granted:
+                self._release_worker()
+            raise
+
+    def _release_worker(self):
+        with self._lock:
+            while True:
+                waiter = self._scheduler.pop()
+                if waiter is None:
+                    self._running -= 1
+                    return
+                if not waiter.done():
+                    waiter.set_result(None)
+                    return
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        在工作池中执行fn，队列满时抛出PoolSaturated
+        任务的客户端、通道和开销来自set_task_context设置的当前请求的调度信息
+        :return: tuple (fn的返回值, TaskTiming)
+        """
+        if self._executor is None:
+            self.start()
+        context = _task_context.get()
+        cost = _task_cost(args, context)
+        lane = context.get('lane') or lane_for_cost(context.get('cost') or cost)
+        self._admit(lane)
+        submitted_at = time.time()
+        try:
+            await self._acquire_worker(lane, context.get('client', ''), cost)
+        except BaseException:
+            self._release(lane)
+            raise
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._executor.submit(_timed_call, fn, args, kwargs)
+        except BaseException:
+            self._release_worker()
+            self._release(lane)
+            raise
+        # 名额在执行器中的任务结束时才归还：等待的协程被取消（如客户端断开）后任务仍在运行，
+        # 在finally中归还会让下一个任务叠加上来，同时执行的任务数超过workers
+        future.add_done_callback(lambda done: self._task_done(loop, lane, done))
+        result, started_at, finished_at, samples = await asyncio.wrap_future(future, loop=loop)
+        metrics.merge_samples(samples)
+        return result, TaskTiming(queue_wait=max(0.0, started_at - submitted_at), exec_time=finished_at - started_at)
+
+    def _task_done(self, loop, lane, future):
+        """
+        执行器中的任务结束后的回调（在执行器的线程中调用），归还排队和工作者名额
+        """
+        exec_time = None
+        if not future.cancelled() and future.exception() is None:
+            _, started_at, finished_at, _ = future.result()
+            exec_time = finished_at - started_at
+        self._release(lane, exec_time)
+        try:
+            # 等待者的future只能在事件循环线程中设置
+            loop.call_soon_threadsafe(self._release_worker)
+        except RuntimeError:
+            # 事件循环已经关闭，没有需要唤醒的等待者
+            pass
+
+    def stats(self):
+        """
+        返回工作池当前状态
+        """
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "inflight": self._inflight,
+                "queued": len(self._scheduler),
+                "queued_by_lane": {lane: self._scheduler.queued(lane) for lane in LANES},
+                "queued_clients": self._scheduler.clients(),
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_exec_time": round(self._avg_exec_time, 3),
+            }
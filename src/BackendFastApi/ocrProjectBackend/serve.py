@@ -0,0 +1,340 @@
+"""
+多进程生产部署
+
+主进程监听端口并管理N个uvicorn工作进程（默认等于CPU核数），所有工作进程共享同一个监听socket。
+- OCR结果缓存和任务记录保存在SQLite文件中，所有工作进程共享
+- 导出文件的容量上限（OCR_ARTIFACT_MAX_MB/OCR_ARTIFACT_MAX_FILES）由各工作进程分别统计，
+  启动时按进程数平分，所有进程合计不超过配置的值
+- 工作进程处理一定数量的请求或内存（RSS）超过上限后由主进程替换：先启动新进程，
+  等它开始接收连接后再让旧进程处理完当前请求退出，控制Tesseract/Pillow长时间运行造成的内存增长。
+  请求数由工作进程写入共享内存，不使用uvicorn的limit_max_requests，否则旧进程会先自行退出
+- 收到SIGTERM/SIGINT时各工作进程停止接收新连接，等待执行中的识别完成后退出；
+  SIGHUP依次替换所有工作进程
+
+用法:
+    python serve.py --workers 4 --port 8000
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import threading
+import time
+
+from artifact_store import OCR_ARTIFACT_MAX_MB, OCR_ARTIFACT_MAX_FILES
+from job_store import OCR_DRAIN_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# 部署配置（可通过环境变量覆盖）
+OCR_SERVER_HOST = os.getenv("OCR_SERVER_HOST", "0.0.0.0")
+OCR_SERVER_PORT = int(os.getenv("OCR_SERVER_PORT", 8000))
+OCR_SERVER_WORKERS = int(os.getenv("OCR_SERVER_WORKERS", os.cpu_count() or 1))
+OCR_WORKER_MAX_REQUESTS = int(os.getenv("OCR_WORKER_MAX_REQUESTS", 1000))  # 0表示不按请求数替换
+OCR_WORKER_MAX_RSS_MB = int(os.getenv("OCR_WORKER_MAX_RSS_MB", 1024))  # 0表示不按内存替换
+OCR_SUPERVISOR_INTERVAL = float(os.getenv("OCR_SUPERVISOR_INTERVAL", 1))  # 检查工作进程的间隔（秒）
+OCR_WORKER_START_TIMEOUT = float(os.getenv("OCR_WORKER_START_TIMEOUT", 60))  # 替换时等待新进程就绪的最长秒数
+
+# 共享状态的默认位置，与main.py的TEMP_DIR一致
+SHARED_STATE_DEFAULTS = {
+    "OCR_CACHE_DB": os.path.join("temp_files", "ocr_cache.sqlite3"),
+    "OCR_JOB_DB": os.path.join("temp_files", "jobs.sqlite3"),
+}
+# 每个工作进程只用一个OCR线程，总并发由进程数决定，避免N个进程各自按核数开线程
+WORKER_ENV_DEFAULTS = {
+    "OCR_WORKERS": "1",
+    "OMP_THREAD_LIMIT": "1",
+}
+
+
+def _run_worker(sock, requests, ready, drain_timeout, log_level):
+    """
+    工作进程入口，必须是模块级函数才能在spawn模式下启动
+    :param requests: 共享内存中的计数，定期写入已处理的请求数
+    :param ready: 开始接收连接后设置的事件
+    """
+    import uvicorn
+
+    class WorkerServer(uvicorn.Server):
+        async def startup(self, sockets=None):
+            await super().startup(sockets=sockets)
+            if not self.should_exit:
+                ready.set()
+
+        async def on_tick(self, counter):
+            requests.value = self.server_state.total_requests
+            return await super().on_tick(counter)
+
+    config = uvicorn.Config(
+        "main:app",
+        timeout_graceful_shutdown=drain_timeout,
+        log_level=log_level,
+    )
+    WorkerServer(config).run(sockets=[sock])
+
+
+class Worker:
+    """
+    工作进程及其与主进程共享的状态
+    """
+
+    def __init__(self, process, requests, ready, max_requests):
+        self.process = process
+        self.requests = requests
+        self.ready = ready
+        self.max_requests = max_requests
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+
+def _read_proc_stats():
+    """
+    读取/proc中所有进程的父进程ID和RSS
+    :return: {pid: (ppid, rss字节数)}，不支持/proc的系统返回None
+    """
+    if not os.path.isdir('/proc'):
+        return None
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    stats = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat', 'rb') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # 进程名可能包含空格和括号，从最后一个')'之后开始解析
+        fields = stat[stat.rfind(b')') + 2:].split()
+        stats[int(name)] = (int(fields[1]), int(fields[21]) * page_size)
+    return stats
+
+
+def process_tree_rss(pid, proc_stats):
+    """
+    计算进程及其所有子进程（如OCR进程池）的RSS总和
+    :return: 字节数
+    """
+    children = {}
+    for child, (ppid, _) in proc_stats.items():
+        children.setdefault(ppid, []).append(child)
+    total = 0
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        total += proc_stats.get(current, (0, 0))[1]
+        stack.extend(children.get(current, ()))
+    return total
+
+
+class Supervisor:
+    """
+    管理工作进程：启动、按请求数/内存替换、退出时等待处理完成
+    :param host: 监听地址
+    :param port: 监听端口
+    :param workers: 工作进程数
+    :param max_requests: 每个工作进程处理的最大请求数，实际值增加最多10%的随机量，错开各进程的替换时间
+    :param max_rss_mb: 工作进程（包括子进程）的最大内存，超过后替换
+    :param drain_timeout: 退出时等待执行中请求和任务的最长秒数
+    """
+
+    def __init__(self, host=OCR_SERVER_HOST, port=OCR_SERVER_PORT, workers=OCR_SERVER_WORKERS,
+                 max_requests=OCR_WORKER_MAX_REQUESTS, max_rss_mb=OCR_WORKER_MAX_RSS_MB,
+                 drain_timeout=OCR_DRAIN_TIMEOUT, log_level='info'):
+        self.host = host
+        self.port = port
+        self.workers = max(1, workers)
+        self.max_requests = max(0, max_requests)
+        self.max_rss = max(0, max_rss_mb) * 1024 * 1024
+        self.drain_timeout = drain_timeout
+        self.log_level = log_level
+        self._context = multiprocessing.get_context('spawn')
+        self._socket = None
+        self._active = []
+        # (被替换的工作进程, 替换进程在_active中的位置, 原因, 不再等待替换进程就绪的时间)
+        self._replacing = []
+        # (进程, 强制结束的时间)
+        self._retiring = []
+        self._should_exit = threading.Event()
+        self._reload = threading.Event()
+
+    def _bind(self):
+        family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+        sock = socket.socket(family=family)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.set_inheritable(True)
+        return sock
+
+    def _spawn(self):
+        max_requests = self.max_requests
+        if max_requests:
+            max_requests += random.randint(0, max_requests // 10)
+        requests = self._context.Value('Q', 0, lock=False)
+        ready = self._context.Event()
+        process = self._context.Process(
+            target=_run_worker,
+            args=(self._socket, requests, ready, self.drain_timeout, self.log_level),
+            name="ocr-worker",
+        )
+        process.start()
+        logger.info(f"Started worker {process.pid} (max_requests={max_requests or 'unlimited'})")
+        return Worker(process, requests, ready, max_requests)
+
+    def _retire(self, process, reason):
+        """
+        让工作进程处理完当前请求后退出，超时后强制结束
+        """
+        logger.info(f"Recycling worker {process.pid}: {reason}")
+        process.terminate()
+        # 先等待连接关闭，再等待后台任务
+        self._retiring.append((process, time.time() + self.drain_timeout * 2 + 10))
+
+    def _replace(self, index, reason):
+        """
+        先启动替换的进程，等它开始接收连接后再让旧进程退出，保持处理能力
+        """
+        worker = self._active[index]
+        self._active[index] = self._spawn()
+        self._replacing.append((worker, index, reason, time.time() + OCR_WORKER_START_TIMEOUT))
+
+    def _check_workers(self):
+        proc_stats = _read_proc_stats() if self.max_rss else None
+        reload_all = self._reload.is_set()
+        self._reload.clear()
+        for index, worker in enumerate(self._active):
+            if not worker.process.is_alive():
+                worker.process.join()
+                logger.warning(f"Worker {worker.pid} exited with code {worker.process.exitcode}")
+                self._active[index] = self._spawn()
+                continue
+            reason = None
+            if reload_all:
+                reason = "reload requested"
+            elif worker.max_requests and worker.requests.value >= worker.max_requests:
+                reason = f"served {worker.requests.value} requests"
+            elif proc_stats is not None:
+                rss = process_tree_rss(worker.pid, proc_stats)
+                if rss > self.max_rss:
+                    reason = f"RSS {rss / 1024 / 1024:.0f}MB exceeds {self.max_rss // 1024 // 1024}MB"
+            if reason:
+                self._replace(index, reason)
+
+        now = time.time()
+        still_replacing = []
+        for worker, index, reason, give_up_at in self._replacing:
+            if self._active[index].ready.is_set():
+                self._retire(worker.process, reason)
+            elif now >= give_up_at:
+                self._retire(worker.process, f"{reason}, replacement not ready after {OCR_WORKER_START_TIMEOUT:.0f}s")
+            else:
+                still_replacing.append((worker, index, reason, give_up_at))
+        self._replacing = still_replacing
+
+        still_retiring = []
+        for process, kill_at in self._retiring:
+            if not process.is_alive():
+                process.join()
+            elif now >= kill_at:
+                logger.warning(f"Worker {process.pid} did not exit in time, killing it")
+                process.kill()
+                process.join()
+            else:
+                still_retiring.append((process, kill_at))
+        self._retiring = still_retiring
+
+    def _shutdown(self):
+        processes = ([worker.process for worker in self._active]
+                     + [worker.process for worker, *_ in self._replacing]
+                     + [process for process, _ in self._retiring])
+        logger.info(f"Shutting down {len(processes)} workers, waiting up to {self.drain_timeout * 2}s for in-flight work")
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        deadline = time.time() + self.drain_timeout * 2 + 10
+        for process in processes:
+            process.join(max(0.0, deadline - time.time()))
+            if process.is_alive():
+                logger.warning(f"Worker {process.pid} did not exit in time, killing it")
+                process.kill()
+                process.join()
+        self._active = []
+        self._replacing = []
+        self._retiring = []
+
+    def _handle_exit(self, signum, frame):
+        self._should_exit.set()
+
+    def _handle_reload(self, signum, frame):
+        self._reload.set()
+
+    def run(self):
+        self._socket = self._bind()
+        logger.info(f"Listening on http://{self.host}:{self.port} with {self.workers} workers")
+        signal.signal(signal.SIGINT, self._handle_exit)
+        signal.signal(signal.SIGTERM, self._handle_exit)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self._handle_reload)
+        try:
+            self._active = [self._spawn() for _ in range(self.workers)]
+            while not self._should_exit.wait(OCR_SUPERVISOR_INTERVAL):
+                self._check_workers()
+        finally:
+            self._shutdown()
+            self._socket.close()
+
+
+def configure_environment(workers=1):
+    """
+    设置工作进程继承的默认配置（已经设置的环境变量不覆盖）
+    :param workers: 工作进程数，导出文件的容量上限按进程数平分
+    """
+    for name, value in {**SHARED_STATE_DEFAULTS, **WORKER_ENV_DEFAULTS}.items():
+        os.environ.setdefault(name, value)
+    # 每个工作进程只统计自己写入的导出文件，平分上限后总占用才不超过配置的值
+    workers = max(1, workers)
+    os.environ["OCR_ARTIFACT_MAX_MB"] = str(max(1, OCR_ARTIFACT_MAX_MB // workers))
+    os.environ["OCR_ARTIFACT_MAX_FILES"] = str(max(1, OCR_ARTIFACT_MAX_FILES // workers))
+    for name in SHARED_STATE_DEFAULTS:
+        directory = os.path.dirname(os.environ[name])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the OCR service with multiple worker processes")
+    parser.add_argument("--host", default=OCR_SERVER_HOST)
+    parser.add_argument("--port", type=int, default=OCR_SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=OCR_SERVER_WORKERS, help="number of worker processes")
+    parser.add_argument("--max-requests", type=int, default=OCR_WORKER_MAX_REQUESTS,
+                        help="recycle a worker after this many requests (0 disables)")
+    parser.add_argument("--max-rss-mb", type=int, default=OCR_WORKER_MAX_RSS_MB,
+                        help="recycle a worker whose RSS, including child processes, exceeds this (0 disables)")
+    parser.add_argument("--drain-timeout", type=int, default=OCR_DRAIN_TIMEOUT,
+                        help="seconds to wait for in-flight requests and jobs when a worker stops")
+    parser.add_argument("--log-level", default="info")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper())
+    configure_environment(args.workers)
+    Supervisor(
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        max_requests=args.max_requests,
+        max_rss_mb=args.max_rss_mb,
+        drain_timeout=args.drain_timeout,
+        log_level=args.log_level,
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+本地SQLite数据库
+
+多进程部署时，OCR结果缓存和任务记录保存在同一台机器上的SQLite文件中，所有工作进程共享。
+使用WAL模式，读写互不阻塞；每个线程使用自己的连接。
+"""
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# 数据库被其他进程锁定时的最长等待秒数
+SQLITE_BUSY_TIMEOUT = float(os.getenv("OCR_SQLITE_BUSY_TIMEOUT", 30))
+
+
+class SQLiteDatabase:
+    """
+    线程安全的SQLite数据库文件
+    :param path: 数据库文件路径
+    :param schema: 建表语句，第一次连接时执行
+    """
+
+    def __init__(self, path, schema=''):
+        self.path = path
+        self.schema = schema
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def connection(self):
+        """
+        获取当前线程的连接，不存在时创建
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            return conn
+        # isolation_level=None：由transaction()显式控制事务
+        conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None,
+                               check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with self._init_lock:
+            if not self._initialized:
+                if self.schema:
+                    conn.executescript(self.schema)
+                self._initialized = True
+                logger.info(f"Opened SQLite database {self.path}")
+        self._local.conn = conn
+        return conn
+
+    def execute(self, sql, params=()):
+        return self.connection().execute(sql, params)
+
+    @contextmanager
+    def transaction(self):
+        """
+        写事务，开始时即获取写锁，避免读后写时与其他进程冲突
+        """
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
@@ -42,9 +42,8 @@ fi
 
 echo -e "${GREEN}✅ Tesseract版本: $(tesseract --version | head -1)${NC}"
 
-# 清理临时文件
-echo -e "${YELLOW}🧹 清理临时文件...${NC}"
-rm -f temp_*
+# 临时文件（导出结果和任务目录）由服务按保留时间和容量自动清理
+# 可通过 OCR_ARTIFACT_TTL / OCR_ARTIFACT_MAX_MB / OCR_JOB_TTL 调整
 
 # 启动服务
 echo -e "${GREEN}🚀 启动FastAPI服务...${NC}"
@@ -53,4 +52,9 @@ echo "API文档: http://localhost:8000/docs"
 echo "按 Ctrl+C 停止服务"
 echo ""
 
-uvicorn main:app --host 0.0.0.0 --port 8000 --reload 
\ No newline at end of file
+# --prod：多进程生产模式（进程数可通过 OCR_SERVER_WORKERS 调整，默认等于CPU核数）
+if [[ "$1" == "--prod" ]]; then
+    python serve.py --host 0.0.0.0 --port 8000
+else
+    uvicorn main:app --host 0.0.0.0 --port 8000 --reload
+fi 
\ No newline at end of file
@@ -0,0 +1,61 @@
+"""
+测试公用的fixture：不依赖Tesseract的识别引擎和在临时目录中运行的Web服务
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeEngine:
+    """每次识别都返回固定文本的引擎"""
+    name = 'fake'
+
+    def __init__(self, text='hello'):
+        self.text = text
+
+    def image_to_string(self, image, lang, psm=None):
+        return self.text
+
+    def detect_script(self, image):
+        return 'Latin', 5.0
+
+    def image_to_data(self, image, lang):
+        words = {'text': [self.text], 'left': [1], 'top': [1], 'width': [10], 'height': [10], 'conf': [90.0], 'line': [0]}
+        return self.text, words
+
+
+@pytest.fixture
+def fake_engine(monkeypatch):
+    import transform
+
+    engine = FakeEngine()
+    monkeypatch.setattr(transform, 'get_engine', lambda *args, **kwargs: engine)
+    monkeypatch.setattr(transform, 'ensure_tesseract', lambda *args, **kwargs: 'tesseract')
+    monkeypatch.setitem(transform._tesseract_info, 'version', '5.0.0')
+    return engine
+
+
+@pytest.fixture(scope='session')
+def main_module(tmp_path_factory):
+    # main在导入时创建temp_files等目录，切换到临时目录后再导入
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('server'))
+    try:
+        import main
+        yield main
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def client(main_module, fake_engine, monkeypatch):
+    from fastapi.testclient import TestClient
+    from ocr_cache import OCRResultCache
+
+    # 每个测试使用空的结果缓存
+    monkeypatch.setattr(main_module, 'ocr_cache', OCRResultCache('test', max_entries=16, disk_dir='', disk_db=''))
+    with TestClient(main_module.app) as test_client:
+        yield test_client
@@ -0,0 +1,19 @@
+import pytest
+
+
+@pytest.mark.parametrize('path, form', [
+    ('/api/ocr', {}),
+    ('/api/ocr', {'lang': 'auto'}),
+    ('/api/ocr', {'output_format': 'structured'}),
+    ('/api/ocr', {'output_format': 'word'}),
+    ('/api/ocr/auto', {}),
+], ids=['text', 'auto', 'structured', 'word', 'auto-endpoint'])
+def test_undecodable_upload_is_an_error_for_every_format(client, path, form):
+    response = client.post(path, files={'file': ('broken.png', b'not an image')}, data=form)
+    assert response.status_code == 500
+
+
+def test_undecodable_upload_is_an_error_event_when_streaming(client):
+    response = client.post('/api/ocr/stream', files={'file': ('broken.png', b'not an image')})
+    assert 'event: error' in response.text
+    assert 'event: done' not in response.text
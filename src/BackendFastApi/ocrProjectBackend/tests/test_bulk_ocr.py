@@ -0,0 +1,138 @@
+import json
+import os
+
+import pytest
+from PIL import Image
+
+import bulk_ocr
+from bulk_ocr import Manifest, is_output_file, iter_inputs, output_paths, process_file
+
+
+def _image(path):
+    Image.new('L', (200, 100), 255).save(path)
+    return str(path)
+
+
+def _done_entry(path, outputs):
+    stat = os.stat(path)
+    return {"path": path, "size": stat.st_size, "mtime": stat.st_mtime, "status": bulk_ocr.STATUS_DONE,
+            "outputs": outputs}
+
+
+@pytest.mark.parametrize('path, expected', [
+    ('scan.png', False),
+    ('scan.png.txt', True),
+    ('scan.PDF.docx', True),
+    ('scan.tif.pdf', True),
+    ('scan.png.txt.part', True),
+    ('report.pdf', False),
+    ('notes.txt', False),
+])
+def test_is_output_file(path, expected):
+    assert is_output_file(path) is expected
+
+
+def test_iter_inputs_skips_outputs_and_manifest(tmp_path):
+    scan = _image(tmp_path / 'scan.png')
+    nested = tmp_path / 'b'
+    nested.mkdir()
+    page = _image(nested / 'page.png')
+    for name in ('scan.png.txt', 'scan.png.pdf', 'scan.png.docx.part', 'notes.txt'):
+        (tmp_path / name).write_bytes(b'x')
+    manifest = str(tmp_path / 'list.pdf')
+    (tmp_path / 'list.pdf').write_bytes(b'x')
+
+    found = list(iter_inputs([str(tmp_path)], exclude={manifest}))
+    assert found == [(scan, str(tmp_path)), (page, str(tmp_path))]
+    # 直接列出的输出文件同样跳过
+    assert list(iter_inputs([str(tmp_path / 'scan.png.pdf'), scan])) == [(scan, str(tmp_path))]
+
+
+def test_iter_inputs_reads_file_list(tmp_path):
+    scan = _image(tmp_path / 'scan.png')
+    file_list = tmp_path / 'files.txt'
+    file_list.write_text(f"{scan}\n\n{tmp_path / 'missing.png'}\n", encoding='utf-8')
+    assert list(iter_inputs([], str(file_list))) == [(scan, str(tmp_path))]
+
+
+def test_output_paths_mirror_the_input_tree(tmp_path):
+    path = str(tmp_path / 'in' / 'a' / 'scan.png')
+    root = str(tmp_path / 'in')
+    assert output_paths(path, root, None, ['text']) == {'text': f"{path}.txt"}
+    assert output_paths(path, root, str(tmp_path / 'out'), ['text', 'pdf']) == {
+        'text': str(tmp_path / 'out' / 'a' / 'scan.png.txt'),
+        'pdf': str(tmp_path / 'out' / 'a' / 'scan.png.pdf'),
+    }
+
+
+def test_manifest_resume_checks_input_and_outputs(tmp_path):
+    scan = _image(tmp_path / 'scan.png')
+    outputs = {'text': f"{scan}.txt"}
+    open(outputs['text'], 'w').close()
+    manifest = Manifest(str(tmp_path / 'manifest.jsonl'))
+    manifest.record(_done_entry(scan, outputs))
+    manifest.close()
+
+    manifest = Manifest(str(tmp_path / 'manifest.jsonl'))
+    try:
+        assert manifest.is_done(scan, outputs)
+        # 新增输出格式或改变输出位置
+        assert not manifest.is_done(scan, {**outputs, 'pdf': f"{scan}.pdf"})
+        assert not manifest.is_done(scan, {'text': str(tmp_path / 'out' / 'scan.png.txt')})
+        # 输出文件被删除
+        os.remove(outputs['text'])
+        assert not manifest.is_done(scan, outputs)
+        open(outputs['text'], 'w').close()
+        # 输入文件被修改
+        os.utime(scan, (0, 0))
+        assert not manifest.is_done(scan, outputs)
+    finally:
+        manifest.close()
+
+
+def test_manifest_uses_last_entry_and_survives_a_torn_line(tmp_path):
+    scan = _image(tmp_path / 'scan.png')
+    path = tmp_path / 'manifest.jsonl'
+    done = _done_entry(scan, {})
+    failed = {**done, "status": bulk_ocr.STATUS_FAILED}
+    path.write_text(json.dumps(done) + "\n" + json.dumps(failed) + "\n" + '{"path": "tor', encoding='utf-8')
+
+    manifest = Manifest(str(path))
+    assert not manifest.is_done(scan, {})
+    manifest.record(done)
+    manifest.close()
+
+    manifest = Manifest(str(path))
+    try:
+        assert manifest.is_done(scan, {})
+    finally:
+        manifest.close()
+    assert path.read_text(encoding='utf-8').splitlines()[-1] == json.dumps(done)
+
+
+def test_process_file_writes_outputs(tmp_path, fake_engine):
+    scan = _image(tmp_path / 'scan.png')
+    outputs = output_paths(scan, str(tmp_path), str(tmp_path / 'out'), ['text', 'pdf'])
+    entry = process_file(scan, outputs, 'eng', ())
+    assert entry['status'] == bulk_ocr.STATUS_DONE
+    assert entry['outputs'] == outputs
+    with open(outputs['text'], encoding='utf-8') as f:
+        assert f.read() == 'hello'
+    assert sorted(os.listdir(tmp_path / 'out')) == ['scan.png.pdf', 'scan.png.txt']
+
+
+def test_blank_page_is_recorded_as_done(tmp_path, fake_engine):
+    fake_engine.text = ''
+    scan = _image(tmp_path / 'scan.png')
+    entry = process_file(scan, {'text': f"{scan}.txt"}, 'eng', ())
+    assert entry['status'] == bulk_ocr.STATUS_DONE
+    assert entry['chars'] == 0
+    assert os.path.exists(f"{scan}.txt")
+
+
+def test_failed_file_leaves_no_output(tmp_path, fake_engine):
+    broken = tmp_path / 'broken.png'
+    broken.write_bytes(b'not an image')
+    entry = process_file(str(broken), {'text': f"{broken}.txt"}, 'eng', ())
+    assert entry['status'] == bulk_ocr.STATUS_FAILED
+    assert os.listdir(tmp_path) == ['broken.png']
@@ -0,0 +1,127 @@
+import asyncio
+import io
+
+import pytest
+from PIL import Image
+
+import ocr_cache
+from ocr_cache import OCRResultCache
+
+
+def _png(color=255):
+    buf = io.BytesIO()
+    Image.new('L', (200, 100), color).save(buf, 'PNG')
+    return buf.getvalue()
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = OCRResultCache('ns', max_entries=2, disk_dir='', disk_db='')
+    cache.set('a', {'text': 'a'})
+    cache.set('b', {'text': 'b'})
+    assert cache.get('a') == {'text': 'a'}
+    cache.set('c', {'text': 'c'})
+    assert cache.get('b') is None
+    assert cache.get('a') == {'text': 'a'}
+    assert cache.get('c') == {'text': 'c'}
+
+
+def test_key_depends_on_language_options_and_namespace():
+    cache = OCRResultCache('ns', disk_dir='', disk_db='')
+    key = cache.make_key('digest', 'eng', 'deskew')
+    assert key == cache.make_key('digest', 'eng', 'deskew')
+    assert key != cache.make_key('digest', 'chi_sim', 'deskew')
+    assert key != cache.make_key('digest', 'eng', '')
+    assert key != OCRResultCache('other', disk_dir='', disk_db='').make_key('digest', 'eng', 'deskew')
+
+
+def test_unknown_namespace_disables_caching_until_it_is_known():
+    versions = [None, '5.0.0']
+    calls = []
+
+    def namespace():
+        calls.append(1)
+        return versions[min(len(calls) - 1, 1)]
+
+    cache = OCRResultCache(namespace, disk_dir='', disk_db='')
+    assert cache.make_key('digest', 'eng') is None
+    cache.set(None, {'text': 'lost'})
+    assert cache.get(None) is None
+    # 命名空间确定后固定下来，不再调用
+    key = cache.make_key('digest', 'eng')
+    assert key is not None
+    assert cache.make_key('digest', 'eng') == key
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize('tier', ['files', 'sqlite'])
+def test_disk_tier_survives_a_new_instance(tmp_path, tier):
+    options = {'disk_dir': str(tmp_path / 'cache'), 'disk_db': ''} if tier == 'files' \
+        else {'disk_dir': '', 'disk_db': str(tmp_path / 'cache.sqlite3')}
+    first = OCRResultCache('ns', **options)
+    key = first.make_key('digest', 'eng')
+    first.set(key, {'text': '你好'})
+
+    second = OCRResultCache('ns', **options)
+    assert second.stats()['disk_backend'] == tier
+    assert second.get(key) == {'text': '你好'}
+    assert second.get('missing') is None
+    stats = second.stats()
+    assert (stats['hits'], stats['disk_hits'], stats['misses']) == (1, 1, 1)
+    # 磁盘层命中后放入内存层
+    assert stats['entries'] == 1
+
+
+@pytest.mark.parametrize('tier', ['files', 'sqlite'])
+def test_disk_tier_is_pruned_to_capacity(tmp_path, monkeypatch, tier):
+    monkeypatch.setattr(ocr_cache, '_DISK_PRUNE_INTERVAL', 1)
+    options = {'disk_dir': str(tmp_path / 'cache'), 'disk_db': ''} if tier == 'files' \
+        else {'disk_dir': '', 'disk_db': str(tmp_path / 'cache.sqlite3')}
+    cache = OCRResultCache('ns', max_entries=0, disk_max_entries=3, **options)
+    for i in range(6):
+        cache.set(f'{i:02d}key', {'text': str(i)})
+    remaining = [i for i in range(6) if cache.get(f'{i:02d}key') is not None]
+    assert len(remaining) == 3
+    assert 5 in remaining
+
+
+def test_async_access_uses_both_tiers(tmp_path):
+    async def scenario():
+        cache = OCRResultCache('ns', disk_dir='', disk_db=str(tmp_path / 'cache.sqlite3'))
+        await cache.aset('key', {'text': 'hello'})
+        assert await cache.aget('key') == {'text': 'hello'}
+        assert await cache.aget(None) is None
+        await cache.aset(None, {'text': 'lost'})
+
+        fresh = OCRResultCache('ns', disk_dir='', disk_db=str(tmp_path / 'cache.sqlite3'))
+        assert await fresh.aget('key') == {'text': 'hello'}
+        assert fresh.stats()['disk_hits'] == 1
+
+    asyncio.run(scenario())
+
+
+def test_repeated_upload_is_served_from_cache(client, fake_engine, monkeypatch):
+    calls = []
+    recognize = fake_engine.image_to_string
+
+    def counting(image, lang, psm=None):
+        calls.append(lang)
+        return recognize(image, lang, psm)
+
+    monkeypatch.setattr(fake_engine, 'image_to_string', counting)
+    first = client.post('/api/ocr', files={'file': ('a.png', _png())})
+    second = client.post('/api/ocr', files={'file': ('b.png', _png())})
+    assert (first.headers['X-Cache'], second.headers['X-Cache']) == ('MISS', 'HIT')
+    assert first.json()['text'] == second.json()['text'] == 'hello'
+    assert len(calls) == 1
+
+    # 语言或图片内容不同时重新识别
+    assert client.post('/api/ocr', files={'file': ('a.png', _png())}, data={'lang': 'deu'}).headers['X-Cache'] == 'MISS'
+    assert client.post('/api/ocr', files={'file': ('c.png', _png(200))}).headers['X-Cache'] == 'MISS'
+    assert len(calls) == 3
+
+
+def test_empty_result_is_not_cached(client, fake_engine):
+    fake_engine.text = ''
+    for _ in range(2):
+        response = client.post('/api/ocr', files={'file': ('a.png', _png())})
+        assert response.headers['X-Cache'] == 'MISS'
@@ -0,0 +1,77 @@
+import io
+import os
+import time
+
+import pytest
+from PIL import Image
+
+
+def _png():
+    buf = io.BytesIO()
+    Image.new('L', (200, 100), 255).save(buf, 'PNG')
+    return buf.getvalue()
+
+
+def _wait_for_job(client, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while True:
+        job = client.get(f'/api/jobs/{job_id}').json()
+        if job['status'] not in ('queued', 'running') or time.time() > deadline:
+            return job
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def finished_job(client):
+    response = client.post('/api/jobs', files={'file': ('a.png', _png())}, data={'lang': 'eng'})
+    assert response.status_code == 202
+    job = _wait_for_job(client, response.json()['job_id'])
+    assert job['status'] == 'done'
+    return job
+
+
+def test_job_lifecycle(client, finished_job):
+    job_id = finished_job['job_id']
+    assert finished_job['progress'] == 1.0
+    assert finished_job['result_url'] == f'/api/jobs/{job_id}/result'
+
+    response = client.get(f'/api/jobs/{job_id}/result')
+    assert response.json()['text'] == 'hello'
+
+    assert client.delete(f'/api/jobs/{job_id}').json() == {'deleted': True}
+    assert client.get(f'/api/jobs/{job_id}').status_code == 404
+    assert client.delete(f'/api/jobs/{job_id}').status_code == 404
+
+
+def test_unknown_job_is_not_found(client):
+    assert client.get('/api/jobs/missing').status_code == 404
+    assert client.get('/api/jobs/missing/result').status_code == 404
+
+
+@pytest.mark.parametrize('output_format, signature', [('word', b'PK'), ('pdf', b'%PDF')])
+def test_job_export_is_reused(client, main_module, finished_job, output_format, signature):
+    job_id = finished_job['job_id']
+    first = client.get(f'/api/jobs/{job_id}/result', params={'output_format': output_format})
+    assert first.content.startswith(signature)
+
+    job_dir = main_module.job_store.job_dir(job_id)
+    exports = [name for name in os.listdir(job_dir) if name.startswith('result')]
+    mtime = os.path.getmtime(os.path.join(job_dir, exports[0]))
+    second = client.get(f'/api/jobs/{job_id}/result', params={'output_format': output_format})
+    assert second.content == first.content
+    assert os.path.getmtime(os.path.join(job_dir, exports[0])) == mtime
+    # 临时文件改名后不会留在任务目录中
+    assert not [name for name in os.listdir(job_dir) if name.startswith('.')]
+
+
+def test_failed_job_export_leaves_no_partial_file(client, main_module, finished_job, monkeypatch):
+    def broken_writer(text, output_path):
+        with open(output_path, 'wb') as f:
+            f.write(b'%PDF-partial')
+        raise RuntimeError('生成PDF文档失败')
+
+    monkeypatch.setattr(main_module, 'save_to_pdf', broken_writer)
+    job_id = finished_job['job_id']
+    with pytest.raises(RuntimeError):
+        client.get(f'/api/jobs/{job_id}/result', params={'output_format': 'pdf'})
+    assert os.listdir(main_module.job_store.job_dir(job_id)) == ['input.png']
@@ -0,0 +1,48 @@
+import io
+
+from PIL import Image, ImageDraw
+
+import transform
+
+
+def _sparse_page():
+    # 相互分开的文字块：左上、右上、底部
+    image = Image.new('L', (1240, 1754), 255)
+    draw = ImageDraw.Draw(image)
+    for left, top in ((100, 100), (800, 100), (100, 1500)):
+        for line in range(3):
+            draw.rectangle((left, top + line * 40, left + 300, top + line * 40 + 16), fill=0)
+    return image
+
+
+class SizeEngine:
+    """返回区域尺寸的引擎，用于检查区域与文本的对应关系"""
+    name = 'size'
+
+    def image_to_string(self, image, lang, psm=None):
+        return f"{image.width}x{image.height} psm={psm}"
+
+
+def test_single_page_layout_recognizes_regions_as_separate_pool_tasks(client, main_module, monkeypatch):
+    engine = SizeEngine()
+    monkeypatch.setattr(transform, 'get_engine', lambda *args, **kwargs: engine)
+    page = _sparse_page()
+    expected_text, expected_regions = transform.ocr_layout(page)
+    assert len(expected_regions) > 1
+
+    tasks = []
+    run = main_module.ocr_pool.run
+
+    async def counting_run(fn, *args, **kwargs):
+        tasks.append(fn.__name__)
+        return await run(fn, *args, **kwargs)
+
+    monkeypatch.setattr(main_module.ocr_pool, 'run', counting_run)
+    buf = io.BytesIO()
+    page.save(buf, 'PNG')
+    response = client.post('/api/ocr/layout', files={'file': ('page.png', buf.getvalue())})
+    assert response.status_code == 200
+    result = response.json()
+    assert result['text'] == expected_text
+    assert result['pages'][0]['regions'] == expected_regions
+    assert tasks == ['prepare_layout'] + ['recognize_region'] * len(expected_regions)
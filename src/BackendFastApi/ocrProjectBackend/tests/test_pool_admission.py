@@ -0,0 +1,73 @@
+import io
+
+import pytest
+from PIL import Image
+
+from ocr_pool import PoolSaturated
+
+
+def _png():
+    buf = io.BytesIO()
+    Image.new('L', (200, 100), 255).save(buf, 'PNG')
+    return buf.getvalue()
+
+
+def _tiff(pages=3):
+    buf = io.BytesIO()
+    frames = [Image.new('L', (200, 100), 255) for _ in range(pages)]
+    frames[0].save(buf, 'TIFF', save_all=True, append_images=frames[1:])
+    return buf.getvalue()
+
+
+def _reject_admissions(monkeypatch, pool, rejected, retry_after=1):
+    """
+    让工作池拒绝指定序号（从0开始）的任务，返回已发生的准入检查次数
+    """
+    admit = pool._admit
+    calls = []
+
+    def fake_admit(lane):
+        calls.append(lane)
+        if len(calls) - 1 in rejected:
+            raise PoolSaturated(retry_after)
+        admit(lane)
+
+    monkeypatch.setattr(pool, '_admit', fake_admit)
+    return calls
+
+
+@pytest.mark.parametrize('path, filename, data, form', [
+    ('/api/ocr', 'a.png', _png(), {}),
+    ('/api/ocr', 'a.tif', _tiff(), {}),
+    ('/api/ocr', 'a.png', _png(), {'output_format': 'structured'}),
+    ('/api/ocr', 'a.tif', _tiff(), {'output_format': 'searchable_pdf'}),
+    ('/api/ocr/layout', 'a.png', _png(), {}),
+    ('/api/ocr/stream', 'a.tif', _tiff(), {}),
+    ('/api/ocr/stream', 'a.png', _png(), {}),
+], ids=['text', 'pages', 'structured', 'searchable-pdf', 'layout', 'stream-pages', 'stream-blocks'])
+def test_saturated_pool_rejects_interactive_requests(client, main_module, monkeypatch, path, filename, data, form):
+    # 前几次都拒绝：如果请求进入了重试等待，会在拒绝结束后返回200
+    _reject_admissions(monkeypatch, main_module.ocr_pool, rejected=range(3))
+    response = client.post(path, files={'file': (filename, data)}, data=form)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_accepted_document_waits_for_later_pages(client, main_module, monkeypatch):
+    calls = _reject_admissions(monkeypatch, main_module.ocr_pool, rejected={1}, retry_after=0.01)
+    response = client.post('/api/ocr', files={'file': ('a.tif', _tiff())})
+    assert response.status_code == 200
+    assert response.json()['text'].count('hello') == 3
+    assert len(calls) == 4
+
+
+def test_streaming_responses_complete_when_admitted(client):
+    response = client.post('/api/ocr/stream', files={'file': ('a.tif', _tiff())})
+    assert response.status_code == 200
+    assert response.text.count('event: text') == 3
+    assert 'event: done' in response.text
+
+    response = client.post('/api/ocr', files={'file': ('a.tif', _tiff())}, data={'output_format': 'searchable_pdf'})
+    assert response.status_code == 200
+    assert response.content.startswith(b'%PDF')
+    assert response.content.count(b'/Type /Page ') == 3
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import preprocess  # noqa: E402
+
+
+def _text_page():
+    image = Image.new('L', (1200, 1600), 255)
+    draw = ImageDraw.Draw(image)
+    for y in range(100, 1500, 40):
+        draw.rectangle((100, y, 1100, y + 14), fill=0)
+    return image
+
+
+@pytest.mark.parametrize('angle', [3.0, -2.0, 1.5])
+def test_deskew_round_trip(angle):
+    skewed = _text_page().rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    assert preprocess.estimate_skew(skewed) == pytest.approx(angle, abs=preprocess.DESKEW_STEP)
+    assert abs(preprocess.estimate_skew(preprocess.deskew(skewed))) < preprocess.DESKEW_STEP
+
+
+def test_to_grayscale_scales_16_bit():
+    pixels = np.arange(0, 65536, 16, dtype=np.uint16).reshape(64, 64)
+    gray = np.asarray(preprocess.to_grayscale(Image.fromarray(pixels)))
+    assert gray.min() == 0
+    assert gray.max() == 255
+    assert 100 < gray.mean() < 155
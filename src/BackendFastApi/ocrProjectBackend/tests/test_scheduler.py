@@ -0,0 +1,134 @@
+import asyncio
+import threading
+
+import pytest
+
+import ocr_pool
+from ocr_pool import FairScheduler, OCRWorkerPool, PoolSaturated, LANE_BULK, LANE_INTERACTIVE
+
+
+def _drain(scheduler, count=None):
+    order = []
+    while count is None or len(order) < count:
+        waiter = scheduler.pop()
+        if waiter is None:
+            break
+        order.append(waiter)
+    return order
+
+
+def test_lanes_share_workers_by_weight():
+    scheduler = FairScheduler({LANE_INTERACTIVE: 4.0, LANE_BULK: 1.0})
+    for i in range(20):
+        scheduler.push(LANE_BULK, 'batch', 1.0, ('bulk', i))
+        scheduler.push(LANE_INTERACTIVE, 'user', 1.0, ('interactive', i))
+    lanes = [lane for lane, _ in _drain(scheduler, 10)]
+    assert lanes.count('interactive') == 8
+    assert lanes.count('bulk') == 2
+
+
+def test_bulk_lane_uses_every_worker_when_alone():
+    scheduler = FairScheduler()
+    for i in range(5):
+        scheduler.push(LANE_BULK, 'batch', 1.0, i)
+    assert _drain(scheduler) == [0, 1, 2, 3, 4]
+
+
+def test_idle_lane_does_not_accumulate_share():
+    scheduler = FairScheduler({LANE_INTERACTIVE: 4.0, LANE_BULK: 1.0})
+    for i in range(40):
+        scheduler.push(LANE_BULK, 'batch', 1.0, ('bulk', i))
+    _drain(scheduler, 40)
+    # 批量通道单独运行了很久，交互请求到达后不能被批量通道的欠账压住
+    for i in range(8):
+        scheduler.push(LANE_INTERACTIVE, 'user', 1.0, ('interactive', i))
+        scheduler.push(LANE_BULK, 'batch', 1.0, ('bulk', i))
+    lanes = [lane for lane, _ in _drain(scheduler, 6)]
+    assert lanes.count('interactive') >= 4
+    assert 'bulk' in lanes
+    # 反过来，交互通道单独运行后批量通道也不能独占工作者
+    scheduler = FairScheduler({LANE_INTERACTIVE: 4.0, LANE_BULK: 1.0})
+    for i in range(40):
+        scheduler.push(LANE_INTERACTIVE, 'user', 1.0, ('interactive', i))
+    _drain(scheduler, 40)
+    for i in range(8):
+        scheduler.push(LANE_BULK, 'batch', 1.0, ('bulk', i))
+        scheduler.push(LANE_INTERACTIVE, 'user', 1.0, ('interactive', i))
+    lanes = [lane for lane, _ in _drain(scheduler, 5)]
+    assert lanes.count('bulk') <= 2
+
+
+def test_clients_take_turns_within_a_lane():
+    scheduler = FairScheduler()
+    for i in range(6):
+        scheduler.push(LANE_INTERACTIVE, 'heavy', 1.0, ('heavy', i))
+    for i in range(2):
+        scheduler.push(LANE_INTERACTIVE, 'light', 1.0, ('light', i))
+    order = _drain(scheduler)
+    assert [client for client, _ in order[:4]] == ['heavy', 'light', 'heavy', 'light']
+    # 同一客户端的任务保持提交顺序
+    assert [i for client, i in order if client == 'heavy'] == list(range(6))
+
+
+def test_clients_are_weighted_by_task_cost():
+    scheduler = FairScheduler()
+    scheduler.push(LANE_INTERACTIVE, 'large', 4.0, 'large-0')
+    scheduler.push(LANE_INTERACTIVE, 'large', 4.0, 'large-1')
+    for i in range(4):
+        scheduler.push(LANE_INTERACTIVE, 'small', 1.0, f'small-{i}')
+    order = _drain(scheduler)
+    assert order.index('large-1') > order.index('small-3')
+
+
+def test_discard_removes_waiter():
+    scheduler = FairScheduler()
+    for i in range(3):
+        scheduler.push(LANE_INTERACTIVE, 'user', 1.0, i)
+    scheduler.discard(1)
+    assert len(scheduler) == 2
+    assert _drain(scheduler) == [0, 2]
+
+
+def test_bulk_tasks_leave_queue_room_for_interactive(monkeypatch):
+    monkeypatch.setattr(ocr_pool, 'OCR_BULK_QUEUE_SHARE', 0.5)
+    pool = OCRWorkerPool(workers=1, max_queue=4)
+    for _ in range(3):
+        pool._admit(LANE_BULK)
+    with pytest.raises(PoolSaturated):
+        pool._admit(LANE_BULK)
+    for _ in range(2):
+        pool._admit(LANE_INTERACTIVE)
+    with pytest.raises(PoolSaturated):
+        pool._admit(LANE_INTERACTIVE)
+
+
+def test_pool_runs_interactive_task_before_queued_bulk_tasks():
+    pool = OCRWorkerPool(workers=1, max_queue=8)
+    started = threading.Event()
+    release = threading.Event()
+    order = []
+
+    def blocker():
+        started.set()
+        release.wait(5)
+
+    async def submit(lane, name):
+        ocr_pool.set_task_context(lane=lane, client=name)
+        await pool.run(order.append, name)
+
+    async def scenario():
+        ocr_pool.set_task_context(lane=LANE_BULK, client='batch')
+        running = asyncio.create_task(pool.run(blocker))
+        await asyncio.to_thread(started.wait, 5)
+        bulk = [asyncio.create_task(submit(LANE_BULK, f'bulk-{i}')) for i in range(3)]
+        await asyncio.sleep(0.01)
+        interactive = asyncio.create_task(submit(LANE_INTERACTIVE, 'user'))
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(running, *bulk, interactive)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+    assert order == ['user', 'bulk-0', 'bulk-1', 'bulk-2']
@@ -0,0 +1,78 @@
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture
+def limited_app(main_module):
+    app = FastAPI()
+    calls = []
+
+    @app.post('/upload')
+    async def upload(file: UploadFile = File(...)):
+        calls.append(file.filename)
+        return {'size': len(await file.read())}
+
+    @app.post('/batch')
+    async def batch(file: UploadFile = File(...)):
+        calls.append(file.filename)
+        return {'size': len(await file.read())}
+
+    app.add_middleware(main_module.RequestSizeLimit, limit=1000, path_limits={'/batch': 5000})
+    return TestClient(app), calls
+
+
+def _chunks(size, chunk=256):
+    boundary = b'limit-test'
+    yield b'--' + boundary + b'\r\nContent-Disposition: form-data; name="file"; filename="a.png"\r\n\r\n'
+    for offset in range(0, size, chunk):
+        yield b'x' * min(chunk, size - offset)
+    yield b'\r\n--' + boundary + b'--\r\n'
+
+
+def _chunked_headers():
+    return {'content-type': 'multipart/form-data; boundary=limit-test'}
+
+
+def test_upload_within_limit_is_accepted(limited_app):
+    client, calls = limited_app
+    response = client.post('/upload', files={'file': ('a.png', b'x' * 500)})
+    assert response.status_code == 200
+    assert response.json() == {'size': 500}
+
+
+def test_content_length_over_limit_is_rejected_before_the_endpoint(limited_app):
+    client, calls = limited_app
+    response = client.post('/upload', files={'file': ('a.png', b'x' * 2000)})
+    assert response.status_code == 413
+    assert calls == []
+
+
+def test_chunked_upload_over_limit_is_rejected(limited_app):
+    client, calls = limited_app
+    response = client.post('/upload', content=_chunks(4000), headers=_chunked_headers())
+    assert response.status_code == 413
+    assert calls == []
+
+
+def test_chunked_upload_within_limit_is_accepted(limited_app):
+    client, calls = limited_app
+    response = client.post('/upload', content=_chunks(500), headers=_chunked_headers())
+    assert response.status_code == 200
+    assert response.json() == {'size': 500}
+
+
+def test_batch_path_has_its_own_limit(limited_app):
+    client, calls = limited_app
+    assert client.post('/batch', files={'file': ('a.png', b'x' * 2000)}).status_code == 200
+    assert client.post('/batch', content=_chunks(3000), headers=_chunked_headers()).status_code == 200
+    assert client.post('/batch', files={'file': ('a.png', b'x' * 6000)}).status_code == 413
+    assert client.post('/batch', content=_chunks(6000), headers=_chunked_headers()).status_code == 413
+
+
+def test_service_rejects_oversized_upload(client, main_module):
+    response = client.post('/api/ocr', content=b'', headers={
+        'content-type': 'multipart/form-data; boundary=x',
+        'content-length': str(main_module.MAX_REQUEST_SIZE + 1),
+    })
+    assert response.status_code == 413
@@ -1,19 +1,26 @@
 from PIL import Image
-from langdetect import detect, DetectorFactory
-from langdetect.lang_detect_exception import LangDetectException
-from docx import Document
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-import random
 import os
 import time
 import logging
 import pytesseract #This is the package we use to convert image to text
 import platform
-import subprocess
 import shutil
+import io
+import math
+import threading
+import warnings
+import numpy as np
+from ocr_engine import get_engine, TESSERACT_PSM
+from preprocess import preprocess_image, OCR_TARGET_DPI, OCR_MAX_SIDE
+from layout import find_text_regions
+from exporters import render_docx, render_pdf, render_searchable_page
+from lang_detect import LanguageDetector
+from metrics import record_stage, STAGE_DECODE, STAGE_RECOGNITION, STAGE_LANGUAGE, STAGE_EXPORT
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # 可选依赖，缺少时不支持PDF输入
+    pdfium = None
 
 # 配置tesseract路径
 def configure_tesseract():
@@ -57,23 +64,7 @@ def configure_tesseract():
             logger.info(f"Found tesseract at: {path}")
             return path
     
-    # 方法3: 尝试使用系统命令查找
-    try:
-        if system == 'linux' or system == 'darwin':
-            result = subprocess.run(['which', 'tesseract'], capture_output=True, text=True)
-            if result.returncode == 0:
-                path = result.stdout.strip()
-                logger.info(f"Found tesseract using 'which': {path}")
-                return path
-        elif system == 'windows':
-            result = subprocess.run(['where', 'tesseract'], capture_output=True, text=True)
-            if result.returncode == 0:
-                path = result.stdout.strip().split('\n')[0]
-                logger.info(f"Found tesseract using 'where': {path}")
-                return path
-    except Exception as e:
-        logger.warning(f"Could not find tesseract using system command: {e}")
-    
+    # shutil.which与which/where命令查找的是同一个PATH，不再额外启动子进程
     # 如果都找不到，返回None
     logger.warning("Could not find tesseract executable. Please install tesseract-ocr package.")
     return None
@@ -82,37 +73,60 @@ def configure_tesseract():
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# 设置tesseract路径
-tesseract_path = configure_tesseract()
-#This is crucial for the tesseract to work
-#if you find the tesseract not working, please check the tesseract_path
-#using the following command in the terminal: which tesseract
-#after you find the tesseract_path, you can set the tesseract_path
-#using the following code:
-#pytesseract.pytesseract.tesseract_cmd = r'<full_path_to_your_tesseract_executable>'
-#and then you can use the tesseract to work
-if tesseract_path:
-    pytesseract.pytesseract.tesseract_cmd = tesseract_path
-    logger.info(f"Tesseract configured at: {tesseract_path}")
-else:
-    logger.error("Tesseract not found! Please install tesseract-ocr package.")
-    logger.error("Ubuntu/Debian: sudo apt install tesseract-ocr")
-    logger.error("macOS: brew install tesseract")
-    logger.error("Windows: Download from https://github.com/UB-Mannheim/tesseract/wiki")
-
-# 验证tesseract是否正常工作
-try:
-    # 测试tesseract是否可用
-    available_langs = pytesseract.get_languages(config='')
-    logger.info(f"Available tesseract languages: {available_langs}")
-except Exception as e:
-    logger.error(f"Tesseract verification failed: {e}")
-
-# 设置随机种子
-current_time = int(time.time() * 1000000)  
-DetectorFactory.seed = current_time
-random.seed(current_time)  
-logger.info(f"Language detection seed set to: {current_time}")
+# tesseract路径、版本和语言包在第一次使用时查找并缓存，导入模块时不启动任何子进程
+# 如果自动查找失败，可以手动指定：get_tesseract_path(r'<full_path_to_your_tesseract_executable>')
+tesseract_path = None
+_tesseract_configured = False
+_tesseract_info = {}
+_tesseract_lock = threading.Lock()
+
+def ensure_tesseract(refresh=False):
+    """
+    查找并配置tesseract可执行文件，只在第一次调用或refresh=True时执行
+    :return: tesseract路径，找不到时返回None
+    """
+    global tesseract_path, _tesseract_configured
+    if _tesseract_configured and not refresh:
+        return tesseract_path
+    with _tesseract_lock:
+        if _tesseract_configured and not refresh:
+            return tesseract_path
+        path = configure_tesseract()
+        if path:
+            pytesseract.pytesseract.tesseract_cmd = path
+            logger.info(f"Tesseract configured at: {path}")
+        else:
+            logger.error("Tesseract not found! Please install tesseract-ocr package.")
+            logger.error("Ubuntu/Debian: sudo apt install tesseract-ocr")
+            logger.error("macOS: brew install tesseract")
+            logger.error("Windows: Download from https://github.com/UB-Mannheim/tesseract/wiki")
+        tesseract_path = path
+        _tesseract_info.clear()
+        _tesseract_configured = True
+        return tesseract_path
+
+def refresh_tesseract_info():
+    """
+    重新查找tesseract并清除缓存的版本和语言包信息（例如安装了新的语言包之后）
+    """
+    return ensure_tesseract(refresh=True)
+
+def _cached_tesseract_info(key, loader, refresh=False):
+    """
+    读取缓存的tesseract信息，不存在时调用loader获取
+    """
+    ensure_tesseract()
+    if not refresh and key in _tesseract_info:
+        return _tesseract_info[key]
+    value = loader()
+    # 查询失败（返回None）时不缓存，下次重新查询
+    if value is not None:
+        _tesseract_info[key] = value
+    return value
+
+def _get_engine(engine=None):
+    ensure_tesseract()
+    return get_engine(engine)
 
 LANG_MAP = {
     'zh-cn': 'chi_sim',     
@@ -131,6 +145,9 @@ LANG_MAP = {
     'vi': 'vie',            
 }
 
+# 文本语言检测器，只加载LANG_MAP中语言的模型，第一次使用时加载
+language_detector = LanguageDetector(LANG_MAP)
+
 # 语言名称映射表
 LANG_NAMES = {
     'chi_sim': '简体中文',
@@ -164,84 +181,528 @@ def get_tesseract_lang(lang_code):
     # 默认返回英语
     return 'eng'
 
-def extract_text_with_tesseract(image_path, lang='eng'):
+# 解码配置（可通过环境变量覆盖）
+OCR_MAX_IMAGE_PIXELS = int(os.getenv("OCR_MAX_IMAGE_PIXELS", 100_000_000))  # 超过该像素数的图片在解码前拒绝
+OCR_REDUCED_DECODE = os.getenv("OCR_REDUCED_DECODE", "1") == "1"  # 只需要文本时按识别所需的分辨率解码
+# Pillow自身的解压炸弹检查使用同一上限；超限的图片由check_image_size拒绝，不需要Pillow再发警告
+Image.MAX_IMAGE_PIXELS = OCR_MAX_IMAGE_PIXELS
+warnings.filterwarnings('ignore', category=Image.DecompressionBombWarning)
+# Image.reduce支持的模式
+_REDUCIBLE_MODES = ('L', 'LA', 'RGB', 'RGBA', 'I', 'F')
+
+class ImageTooLarge(ValueError):
+    """图片像素数超过OCR_MAX_IMAGE_PIXELS"""
+
+class OCRFailed(RuntimeError):
+    """识别过程出错（如无法解码的文件、Tesseract不可用），具体原因已记录在日志中"""
+
+def check_image_size(width, height):
+    """
+    检查图片尺寸，只需要文件头中的宽高，在分配像素内存之前拒绝解压炸弹
+    :raises ImageTooLarge: 超过OCR_MAX_IMAGE_PIXELS时
+    """
+    if width * height > OCR_MAX_IMAGE_PIXELS:
+        raise ImageTooLarge(f"Image is {width}x{height} pixels, the limit is {OCR_MAX_IMAGE_PIXELS} pixels.")
+
+def open_image(source):
+    """
+    打开图片，支持文件路径、内存中的字节数据、文件对象或已打开的PIL图片
+    内存数据直接解码，不经过磁盘；只读取文件头，尺寸超限时立即拒绝
+    :param source: 图片来源
+    :return: PIL图片
+    :raises ImageTooLarge: 图片像素数超过OCR_MAX_IMAGE_PIXELS时
+    """
+    if isinstance(source, Image.Image):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    elif hasattr(source, 'read'):
+        source.seek(0)
+    try:
+        image = Image.open(source)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e)) from e
+    check_image_size(image.width, image.height)
+    return image
+
+def decode_scale(size, dpi):
+    """
+    识别需要的缩放比例（不放大）：有DPI信息时缩小到OCR_TARGET_DPI，最长边不超过OCR_MAX_SIDE
+    """
+    scale = 1.0
+    if dpi and dpi > 1:
+        scale = min(1.0, OCR_TARGET_DPI / float(dpi))
+    return min(scale, OCR_MAX_SIDE / max(size))
+
+def _load_reduced(image):
+    """
+    按识别需要的分辨率解码：JPEG用draft在解码时直接按1/2~1/8缩小并输出灰度图，
+    其他格式解码后按整数倍缩小；精确缩放仍由预处理的resize步骤完成
+    """
+    original_width = image.width
+    dpi = image.info.get('dpi', (0, 0))[0]
+    scale = decode_scale(image.size, dpi)
+    if image.format == 'JPEG':
+        # draft选择不小于请求尺寸的最大缩小比例
+        image.draft('L', (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+    image.load()
+
+    # DPI按每米点数存储时有舍入误差，留一点余量
+    factor = int(image.width / (original_width * scale) + 0.01)
+    if factor >= 2 and image.mode in _REDUCIBLE_MODES:
+        image = image.reduce(factor)
+    if image.width != original_width and dpi and dpi > 1:
+        reduced_dpi = dpi * image.width / original_width
+        image.info['dpi'] = (reduced_dpi, reduced_dpi)
+    return image
+
+def decode_image(source, reduced=False):
+    """
+    打开并完整解码图片，记录解码耗时；已经打开的PIL图片直接返回
+    :param reduced: 只需要识别文本时为True，按识别所需的分辨率解码为较小的图片，
+                    需要原图坐标或原图像素（单词位置、可搜索PDF）时为False
+    :return: PIL图片
+    """
+    if isinstance(source, Image.Image):
+        return source
+    start_time = time.time()
+    image = open_image(source)
+    if reduced and OCR_REDUCED_DECODE:
+        image = _load_reduced(image)
+    else:
+        image.load()
+    record_stage(STAGE_DECODE, time.time() - start_time)
+    return image
+
+# PDF页面渲染分辨率
+PDF_RENDER_DPI = int(os.getenv("PDF_RENDER_DPI", 300))
+# 多页文档各页文本之间的分隔符
+PAGE_SEPARATOR = '\n\n'
+
+# 流式识别时单页按空白行切分的目标块高度（像素）
+STREAM_BAND_HEIGHT = int(os.getenv("OCR_STREAM_BAND_HEIGHT", 400))
+
+# pdfium不是线程安全的，所有调用都需要串行
+_pdfium_lock = threading.Lock()
+
+def is_pdf(source):
+    """
+    根据文件头判断来源是否为PDF
+    """
+    if isinstance(source, Image.Image):
+        return False
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source[:5]) == b'%PDF-'
+    if hasattr(source, 'read'):
+        source.seek(0)
+        head = source.read(5)
+        source.seek(0)
+        return head == b'%PDF-'
+    with open(source, 'rb') as f:
+        return f.read(5) == b'%PDF-'
+
+def _open_pdf(source):
+    if pdfium is None:
+        raise RuntimeError("PDF input requires the pypdfium2 package")
+    if isinstance(source, (bytearray, memoryview)):
+        source = bytes(source)
+    elif hasattr(source, 'read'):
+        source.seek(0)
+    return pdfium.PdfDocument(source)
+
+def count_pages(source):
+    """
+    获取文档页数（多页TIFF的帧数或PDF页数），只读取文件头信息
+    """
+    if is_pdf(source):
+        with _pdfium_lock:
+            pdf = _open_pdf(source)
+            try:
+                return len(pdf)
+            finally:
+                pdf.close()
+    return getattr(open_image(source), 'n_frames', 1)
+
+def estimate_cost(source):
+    """
+    根据文件头中的尺寸估算识别开销，不解码像素，用于调度
+    识别时间大致与像素数成正比，按识别时的分辨率计算（PDF按渲染DPI，图片按缩小解码后的尺寸）
+    :return: 各页像素数之和（百万像素）
+    """
+    if is_pdf(source):
+        with _pdfium_lock:
+            pdf = _open_pdf(source)
+            try:
+                sizes = [pdf.get_page_size(index) for index in range(len(pdf))]
+            finally:
+                pdf.close()
+        scale = PDF_RENDER_DPI / 72
+        return sum(width * height for width, height in sizes) * scale * scale / 1e6
+
+    image = open_image(source)
+    scale = 1.0
+    if OCR_REDUCED_DECODE:
+        scale = decode_scale(image.size, image.info.get('dpi', (0, 0))[0])
+    # 多页TIFF按第一帧的尺寸估算
+    return image.width * image.height * scale * scale * getattr(image, 'n_frames', 1) / 1e6
+
+def iter_pages(source):
+    """
+    逐页解码文档，每次只生成一页，调用方处理完一页后即可释放
+    :param source: 图片路径、字节数据、文件对象或PIL图片
+    :return: 生成PIL图片的迭代器
+    """
+    if is_pdf(source):
+        with _pdfium_lock:
+            pdf = _open_pdf(source)
+            page_count = len(pdf)
+        try:
+            for index in range(page_count):
+                start_time = time.time()
+                with _pdfium_lock:
+                    page = pdf[index]
+                    try:
+                        width, height = page.get_size()
+                        check_image_size(round(width * PDF_RENDER_DPI / 72), round(height * PDF_RENDER_DPI / 72))
+                        image = page.render(scale=PDF_RENDER_DPI / 72).to_pil()
+                    finally:
+                        page.close()
+                record_stage(STAGE_DECODE, time.time() - start_time)
+                yield image
+        finally:
+            with _pdfium_lock:
+                pdf.close()
+        return
+
+    image = open_image(source)
+    frame_count = getattr(image, 'n_frames', 1)
+    for index in range(frame_count):
+        start_time = time.time()
+        if frame_count > 1:
+            image.seek(index)
+            # 各帧尺寸可以不同，seek只读取帧头，解码前逐帧检查
+            check_image_size(image.width, image.height)
+            frame = image.copy()
+        else:
+            image.load()
+            frame = image
+        record_stage(STAGE_DECODE, time.time() - start_time)
+        yield frame
+
+def split_into_bands(image, band_height=STREAM_BAND_HEIGHT):
+    """
+    在空白行处把单页切成若干横向文本块，用于流式识别
+    只在没有墨迹的行切分，不会切断文字；找不到空白行时剩余部分作为一个块
+    :param image: PIL图片
+    :param band_height: 每个块的目标高度
+    :return: 从上到下排列的PIL图片列表
+    """
+    gray = np.asarray(image if image.mode == 'L' else image.convert('L'), dtype=np.uint8)
+    blank = (gray < 128).mean(axis=1) < 0.002
+    height = image.height
+    bands = []
+    start = 0
+    while height - start > band_height * 1.5:
+        candidates = np.nonzero(blank[start + band_height:])[0]
+        if len(candidates) == 0:
+            break
+        cut = start + band_height + int(candidates[0])
+        if height - cut < band_height // 2:
+            break
+        bands.append(image.crop((0, start, image.width, cut)))
+        start = cut
+    bands.append(image.crop((0, start, image.width, height)) if start else image)
+    return bands
+
+def extract_text_with_tesseract(image_source, lang='eng', engine=None, preprocess=()):
     """
     使用Tesseract OCR提取文本
+    :param image_source: 图片路径、字节数据、文件对象或PIL图片
+    :param lang: 语言代码
+    :param engine: 识别引擎名称（'pytesseract' 或 'tesserocr'），为None时使用OCR_ENGINE
+    :param preprocess: 预处理步骤（preprocess.parse_stages的返回值）
     """
     try:
         start_time = time.time()
         
         # 打开图像
-        image = Image.open(image_path)
+        image = decode_image(image_source, reduced=True)
+        if preprocess:
+            image, _ = preprocess_image(image, preprocess)
         
         # 转换语言代码
         tesseract_lang = get_tesseract_lang(lang)
         
         # 执行OCR识别
-        custom_config = r'--oem 3 --psm 6'
-        text = pytesseract.image_to_string(image, lang=tesseract_lang, config=custom_config)
+        ocr_engine = _get_engine(engine)
+        recognition_start = time.time()
+        text = ocr_engine.image_to_string(image, tesseract_lang)
+        record_stage(STAGE_RECOGNITION, time.time() - recognition_start, tesseract_lang)
         
         processing_time = time.time() - start_time
         
-        logger.info(f"Tesseract processing time: {processing_time:.2f}s, language: {tesseract_lang}")
+        logger.info(f"Tesseract processing time: {processing_time:.2f}s, language: {tesseract_lang}, engine: {ocr_engine.name}")
         return text.strip(), processing_time
         
     except Exception as e:
         logger.error(f"Tesseract extraction failed: {e}")
         return None, 0.0
 
+# 会改变页面几何形状的预处理步骤，生成可搜索PDF时跳过，保证文字框与原图对齐
+GEOMETRY_STAGES = ('deskew', 'crop')
+
+def recognize_words(image, lang='eng', engine=None, preprocess=()):
+    """
+    一次识别同时得到文本和每个单词的位置，坐标对应传入的原始图片
+    :param image: PIL图片
+    :param preprocess: 预处理步骤，其中的纠偏和裁边会被忽略
+    :return: tuple (文本, 单词数据字典（字段见ocr_engine.WORD_FIELDS）)
+    """
+    start_time = time.time()
+    stages = tuple(stage for stage in preprocess if stage not in GEOMETRY_STAGES)
+    ocr_input = preprocess_image(image, stages)[0] if stages else image
+    tesseract_lang = get_tesseract_lang(lang)
+    ocr_engine = _get_engine(engine)
+    recognition_start = time.time()
+    text, words = ocr_engine.image_to_data(ocr_input, tesseract_lang)
+    record_stage(STAGE_RECOGNITION, time.time() - recognition_start, tesseract_lang)
+
+    # 缩放过的图片把坐标换算回原图
+    if ocr_input.size != image.size:
+        scale_x = image.width / ocr_input.width
+        scale_y = image.height / ocr_input.height
+        for field, scale in (('left', scale_x), ('width', scale_x), ('top', scale_y), ('height', scale_y)):
+            words[field] = [round(value * scale) for value in words[field]]
+
+    logger.info(f"Tesseract word recognition time: {time.time() - start_time:.2f}s, language: {tesseract_lang}, words: {len(words['text'])}")
+    return text.strip(), words
+
+def image_dpi(image, default=PDF_RENDER_DPI):
+    """
+    读取图片的DPI，没有记录时使用默认值
+    """
+    dpi = image.info.get('dpi', (0, 0))[0]
+    return float(dpi) if dpi and dpi > 1 else float(default)
+
+def searchable_pdf_page(image, page_number, lang='eng', preprocess=(), engine=None):
+    """
+    识别一页并生成该页的可搜索PDF对象
+    :return: tuple (识别的文本, exporters.render_searchable_page的返回值)
+    """
+    image = decode_image(image)
+    text, words = recognize_words(image, lang, engine, preprocess)
+    export_start = time.time()
+    objects = render_searchable_page(page_number, image, words, image_dpi(image))
+    record_stage(STAGE_EXPORT, time.time() - export_start, get_tesseract_lang(lang))
+    return text, objects
+
+def prepare_layout(image_source, preprocess=()):
+    """
+    版面分析：解码、预处理并找出有文字的区域，各区域可以作为单独的任务并行识别
+    空白页没有区域；区域覆盖页面大部分时只有一个整页区域
+    :param image_source: 图片路径、字节数据、文件对象或PIL图片
+    :param preprocess: 预处理步骤，其中的纠偏和裁边会被忽略，保证坐标对应原图
+    :return: tuple (原图尺寸, 识别用图片的尺寸, 区域列表, 各区域的裁剪图片（info['psm']为该区域的页面分割模式）)
+    """
+    image = decode_image(image_source)
+    stages = tuple(stage for stage in preprocess if stage not in GEOMETRY_STAGES)
+    ocr_input = preprocess_image(image, stages)[0] if stages else image
+    regions = find_text_regions(ocr_input)
+    crops = []
+    for region in regions:
+        crop = ocr_input.copy() if region.box == (0, 0, ocr_input.width, ocr_input.height) else ocr_input.crop(region.box)
+        crop.info = {**ocr_input.info, 'psm': region.psm}
+        crops.append(crop)
+    return image.size, ocr_input.size, regions, crops
+
+def recognize_region(crop, index=0, lang='eng', preprocess=(), engine=None):
+    """
+    识别prepare_layout得到的一个区域，参数顺序与其他单页识别函数一致，可以直接交给工作池
+    :param crop: 区域的裁剪图片
+    :param preprocess: 版面分析时已经执行过，这里忽略
+    :return: 识别的文本
+    """
+    tesseract_lang = get_tesseract_lang(lang)
+    ocr_engine = _get_engine(engine)
+    recognition_start = time.time()
+    text = ocr_engine.image_to_string(crop, tesseract_lang, psm=crop.info.get('psm', TESSERACT_PSM)).strip()
+    record_stage(STAGE_RECOGNITION, time.time() - recognition_start, tesseract_lang)
+    return text
+
+def assemble_layout(image_size, ocr_size, regions, texts):
+    """
+    按阅读顺序拼接各区域的识别结果，预处理缩放过的坐标换算回原图
+    :return: tuple (拼接的文本, 区域列表（包含识别的text，没有文字的区域被去掉）)
+    """
+    scale_x = image_size[0] / ocr_size[0]
+    scale_y = image_size[1] / ocr_size[1]
+    results = []
+    for region, text in zip(regions, texts):
+        if not text:
+            continue
+        item = region.to_dict()
+        for field, scale in (('left', scale_x), ('width', scale_x), ('top', scale_y), ('height', scale_y)):
+            item[field] = round(item[field] * scale)
+        item["text"] = text
+        results.append(item)
+    return '\n\n'.join(item["text"] for item in results), results
+
+def ocr_layout(image_source, lang='eng', engine=None, preprocess=()):
+    """
+    先做版面分析，只识别有文字的区域，各区域在当前线程中依次识别
+    （Web服务识别单页图片时把各区域作为单独的任务交给工作池并行识别）
+    :param image_source: 图片路径、字节数据、文件对象或PIL图片
+    :param preprocess: 预处理步骤，其中的纠偏和裁边会被忽略，保证坐标对应原图
+    :return: tuple (按阅读顺序拼接的文本, 区域列表（坐标对应原图，包含识别的text）)
+    """
+    start_time = time.time()
+    image_size, ocr_size, regions, crops = prepare_layout(image_source, preprocess)
+    texts = [recognize_region(crop, index, lang, engine=engine) for index, crop in enumerate(crops)]
+    text, results = assemble_layout(image_size, ocr_size, regions, texts)
+    logger.info(f"Layout OCR time: {time.time() - start_time:.2f}s, language: {get_tesseract_lang(lang)}, regions: {len(results)}/{len(regions)}")
+    return text, results
+
+def layout_page(image, page_number, lang='eng', preprocess=(), engine=None):
+    """
+    版面分析模式识别一页
+    :return: 页面结果字典 {page, width, height, text, regions}
+    """
+    image = decode_image(image)
+    text, regions = ocr_layout(image, lang, engine, preprocess)
+    return {"page": page_number + 1, "width": image.width, "height": image.height, "text": text, "regions": regions}
+
+def structured_page(image, page_number, lang='eng', preprocess=(), engine=None):
+    """
+    识别一页，一次识别同时得到文本、单词位置和置信度
+    :return: 页面结果字典 {page, width, height, text, words}，words按列存储（字段见ocr_engine.WORD_FIELDS）
+    """
+    image = decode_image(image)
+    text, words = recognize_words(image, lang, engine, preprocess)
+    return {"page": page_number + 1, "width": image.width, "height": image.height, "text": text, "words": words}
+
 def detect_language(text):
     """
     检测文本的语言
+    先按文字范围判断，拉丁字母等再做统计检测；结果可复现
     :param text: 要检测的文本
     :return: 检测到的语言代码（Tesseract格式）
     """
     if not text or len(text.strip()) < 3:
         return 'eng'  # 默认返回英语
 
-    try:
-        # 使用langdetect检测语言
-        detected_lang = detect(text)
-        print(f"检测到的语言: {detected_lang}")
+    tesseract_lang = language_detector.detect(text)
+    logger.info(f"检测到的语言: {tesseract_lang}")
+    return tesseract_lang
 
-        # 转换为Tesseract语言代码
-        tesseract_lang = LANG_MAP.get(detected_lang, 'eng')
-        print(f"转换为Tesseract语言代码: {tesseract_lang}")
+# OSD脚本名称到Tesseract语言的映射，拉丁字母需要进一步做统计检测
+SCRIPT_MAP = {
+    'Han': 'chi_sim',
+    'Japanese': 'jpn',
+    'Katakana': 'jpn',
+    'Hiragana': 'jpn',
+    'Hangul': 'kor',
+    'Cyrillic': 'rus',
+    'Arabic': 'ara',
+    'Thai': 'tha',
+}
 
-        return tesseract_lang
-    except LangDetectException:
-        print("语言检测失败，使用默认语言: eng")
-        return 'eng'
+# OSD检测使用的缩略图最长边
+OSD_MAX_SIDE = 1600
+# 像素数不超过该值的图片直接整张作为语言检测样本，样本结果可复用为最终结果
+SAMPLE_FULL_PAGE_PIXELS = 1_500_000
+# OSD脚本置信度低于该值时不采信
+OSD_MIN_CONFIDENCE = 1.0
 
-def auto_detect_and_ocr(image_path):
+def _downscale(image, max_side):
     """
-    自动检测图片中的语言并进行OCR识别
-    :param image_path: 图片路径
-    :return: tuple (识别的文本, 检测到的语言代码)
+    等比缩小图片，使最长边不超过max_side
+    """
+    if max(image.size) <= max_side:
+        return image
+    scale = max_side / max(image.size)
+    return image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))), Image.BILINEAR)
+
+def _sample_region(image):
+    """
+    截取用于语言检测的样本区域
+    :return: tuple (样本图片, 是否为整张图片)
+    """
+    if image.width * image.height <= SAMPLE_FULL_PAGE_PIXELS:
+        return image, True
+    # 取页面中部1/4高度的横条，正文通常集中在这里
+    top = image.height * 3 // 8
+    bottom = image.height * 5 // 8
+    return image.crop((0, top, image.width, bottom)), False
+
+def detect_image_language(image, engine=None):
+    """
+    在完整识别之前确定图片的语言，并记录检测耗时
+    :return: tuple (Tesseract语言代码, 样本识别文本, 样本是否覆盖整张图片)
+    """
+    start_time = time.time()
+    result = _detect_image_language(image, engine)
+    record_stage(STAGE_LANGUAGE, time.time() - start_time, result[0])
+    return result
+
+def _detect_image_language(image, engine=None):
+    """
+    在完整识别之前确定图片的语言
+    先用OSD检测文字脚本，拉丁字母再对样本区域做一次低成本识别并统计检测
+    :param image: PIL图片
+    :param engine: 识别引擎名称
+    :return: tuple (Tesseract语言代码, 样本识别文本, 样本是否覆盖整张图片)
     """
+    ocr_engine = _get_engine(engine)
+
     try:
-        # 首先用英语进行初步OCR识别，获取文本样本用于语言检测
-        initial_text, _ = extract_text_with_tesseract(image_path, 'eng')
+        script, confidence = ocr_engine.detect_script(_downscale(image, OSD_MAX_SIDE))
+        logger.info(f"OSD script: {script}, confidence: {confidence:.2f}")
+        if script in SCRIPT_MAP and confidence >= OSD_MIN_CONFIDENCE:
+            return SCRIPT_MAP[script], None, False
+    except Exception as e:
+        logger.warning(f"OSD script detection failed: {e}")
 
-        if not initial_text or not initial_text.strip():
-            # 如果英语识别不出内容，尝试中文
-            initial_text, _ = extract_text_with_tesseract(image_path, 'chi_sim')
+    sample, is_full_page = _sample_region(image)
+    sample_lang = 'eng'
+    sample_text = ocr_engine.image_to_string(sample, sample_lang).strip()
+    if not sample_text:
+        # 如果英语识别不出内容，尝试中文
+        sample_lang = 'chi_sim'
+        sample_text = ocr_engine.image_to_string(sample, sample_lang).strip()
+        if sample_text:
+            return sample_lang, sample_text, is_full_page
 
-        if not initial_text or not initial_text.strip():
-            logger.warning("No text detected in initial OCR")
-            return None, None
+    detected_lang = detect_language(sample_text)
+    if detected_lang != sample_lang:
+        return detected_lang, None, False
+    return sample_lang, sample_text, is_full_page
 
-        print(f"初步OCR结果: {initial_text[:100]}...")
+def auto_detect_and_ocr(image_source, engine=None, preprocess=()):
+    """
+    自动检测图片中的语言并进行OCR识别
+    语言在完整识别之前确定，整页只识别一次；样本已覆盖整页且语言一致时直接复用样本结果
+    :param image_source: 图片路径、字节数据、文件对象或PIL图片
+    :param engine: 识别引擎名称
+    :param preprocess: 预处理步骤，检测和识别都使用处理后的图片
+    :return: tuple (识别的文本, 检测到的语言代码)；没有文字时文本为空字符串，识别失败时返回 (None, None)
+    """
+    try:
+        image = decode_image(image_source, reduced=True)
+        if preprocess:
+            image, _ = preprocess_image(image, preprocess)
 
-        # 检测语言
-        detected_lang = detect_language(initial_text)
+        detected_lang, sample_text, is_full_page = detect_image_language(image, engine)
+        logger.info(f"Auto-detected language: {detected_lang}, reuse sample: {sample_text is not None and is_full_page}")
 
-        # 如果检测到的语言与初始使用的不同，重新进行OCR
-        if detected_lang not in ['eng', 'chi_sim']:
-            print(f"重新使用检测到的语言进行OCR: {detected_lang}")
-            final_text, _ = extract_text_with_tesseract(image_path, detected_lang)
+        if sample_text is not None and is_full_page:
+            final_text = sample_text
         else:
-            final_text = initial_text
+            final_text, _ = extract_text_with_tesseract(image, detected_lang, engine)
+
+        if final_text is None:
+            return None, None
+        if not final_text:
+            logger.warning("No text detected in auto-detect OCR")
 
         return final_text, detected_lang
 
@@ -249,23 +710,52 @@ def auto_detect_and_ocr(image_path):
         print(f"自动语言检测OCR失败: {str(e)}")
         return None, None
 
-def image_to_text(image_path, lang=None):
+def ocr_document(image_source, lang=None, engine=None, preprocess=()):
+    """
+    逐页识别多页文档（多页TIFF或PDF），语言在第一页确定后用于所有页面
+    :param image_source: 图片路径、字节数据、文件对象或PIL图片
+    :param lang: 指定语言代码，如果为None或'auto'则自动检测
+    :param engine: 识别引擎名称
+    :param preprocess: 预处理步骤，逐页执行
+    :return: tuple (各页文本按顺序拼接的结果, 使用的语言代码)
+    """
+    texts = []
+    doc_lang = None
+    for page in iter_pages(image_source):
+        if preprocess:
+            page, _ = preprocess_image(page, preprocess)
+        if doc_lang is None:
+            if lang is None or lang == 'auto':
+                doc_lang = detect_image_language(page, engine)[0]
+            else:
+                doc_lang = get_tesseract_lang(lang)
+        text, _ = extract_text_with_tesseract(page, doc_lang, engine)
+        texts.append(text or '')
+    return PAGE_SEPARATOR.join(texts), doc_lang
+
+def image_to_text(image_source, lang=None, preprocess=()):
     """
     将图片转换为文本，支持自动语言检测
-    :param image_path: 图片路径
+    :param image_source: 图片路径、字节数据、文件对象或PIL图片
     :param lang: 指定语言代码，如果为None则自动检测
+    :param preprocess: 预处理步骤（preprocess.parse_stages的返回值）
     :return: 识别的文本
     """
     try:
-        if lang is None or lang == 'auto':
+        if count_pages(image_source) > 1:
+            # 多页文档逐页识别
+            text, doc_lang = ocr_document(image_source, lang, preprocess=preprocess)
+            logger.info(f"Multi-page OCR result - lang: {doc_lang}, text length: {len(text)}")
+            return text
+        elif lang is None or lang == 'auto':
             # 自动检测语言
-            text, detected_lang = auto_detect_and_ocr(image_path)
+            text, detected_lang = auto_detect_and_ocr(image_source, preprocess=preprocess)
             print(f"自动检测结果 - 语言: {detected_lang}, 文本长度: {len(text) if text else 0}")
             return text
         else:
             # 使用指定语言
             tesseract_lang = get_tesseract_lang(lang)
-            text, processing_time = extract_text_with_tesseract(image_path, tesseract_lang)
+            text, processing_time = extract_text_with_tesseract(image_source, tesseract_lang, preprocess=preprocess)
             print(f"指定语言OCR结果 - 语言: {tesseract_lang}, 文本长度: {len(text) if text else 0}")
             return text
 
@@ -277,14 +767,11 @@ def text_to_word(text, output_path):
     """
     将文本保存为Word文档
     :param text: 要保存的文本
-    :param output_path: 输出文件路径
+    :param output_path: 输出文件路径或可写的文件对象
     :return: 是否成功
     """
     try:
-        doc = Document()
-        doc.add_heading('OCR识别结果', 0)
-        doc.add_paragraph(text)
-        doc.save(output_path)
+        render_docx(text, output_path)
         return True
     except Exception as e:
         print(f"生成Word文档失败: {str(e)}")
@@ -294,69 +781,116 @@ def text_to_pdf(text, output_path):
     """
     将文本保存为PDF文档
     :param text: 要保存的文本
-    :param output_path: 输出文件路径
+    :param output_path: 输出文件路径或可写的文件对象
     :return: 是否成功
     """
     try:
-        c = canvas.Canvas(output_path, pagesize=A4)
-        width, height = A4
-        
-        # 设置字体（支持中文）
-        try:
-            # 尝试注册中文字体
-            font_path = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
-            if os.path.exists(font_path):
-                pdfmetrics.registerFont(TTFont('DejaVu', font_path))
-                c.setFont('DejaVu', 12)
-            else:
-                c.setFont('Helvetica', 12)
-        except:
-            c.setFont('Helvetica', 12)
-
-        # 添加标题
-        c.setFont('Helvetica-Bold', 16)
-        c.drawString(50, height - 50, 'OCR Recognition Result')
-
-        # 添加文本内容
-        c.setFont('DejaVu' if os.path.exists("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf") else 'Helvetica', 12)
-
-        # 处理文本换行
-        lines = text.split('\n')
-        y_position = height - 100
-        line_height = 20
-
-        for line in lines:
-            if y_position < 50:  # 如果页面空间不够，创建新页面
-                c.showPage()
-                y_position = height - 50
-            
-            # 处理长行的换行
-            if len(line) > 80:
-                words = line.split(' ')
-                current_line = ''
-                for word in words:
-                    if len(current_line + word) < 80:
-                        current_line += word + ' '
-                    else:
-                        c.drawString(50, y_position, current_line.strip())
-                        y_position -= line_height
-                        current_line = word + ' '
-                        if y_position < 50:
-                            c.showPage()
-                            y_position = height - 50
-                if current_line:
-                    c.drawString(50, y_position, current_line.strip())
-                    y_position -= line_height
-            else:
-                c.drawString(50, y_position, line)
-                y_position -= line_height
-        
-        c.save()
+        render_pdf(text, output_path)
         return True
     except Exception as e:
         print(f"生成PDF文档失败: {str(e)}")
         return False
 
+def find_tesseract_path():
+    """
+    查找tesseract可执行文件路径
+    :return: tesseract路径，找不到时返回None
+    """
+    return configure_tesseract()
+
+def get_tesseract_path(path=None):
+    """
+    设置或获取当前使用的tesseract路径
+    :param path: 新的tesseract路径，为None时只返回当前路径（第一次调用时自动查找）
+    :return: 当前配置的tesseract路径
+    """
+    global tesseract_path, _tesseract_configured
+    if path:
+        with _tesseract_lock:
+            pytesseract.pytesseract.tesseract_cmd = path
+            tesseract_path = path
+            _tesseract_info.clear()
+            _tesseract_configured = True
+        return tesseract_path
+    return ensure_tesseract()
+
+def _load_tesseract_version():
+    try:
+        return str(pytesseract.get_tesseract_version())
+    except Exception as e:
+        logger.error(f"Failed to get tesseract version: {e}")
+        return None
+
+def get_tesseract_version(refresh=False):
+    """
+    获取Tesseract版本号，结果会被缓存
+    :param refresh: 为True时重新查询
+    :return: 版本字符串，tesseract不可用时返回None
+    """
+    return _cached_tesseract_info('version', _load_tesseract_version, refresh)
+
+def _load_installed_languages():
+    try:
+        return [lang for lang in pytesseract.get_languages(config='') if lang != 'osd']
+    except Exception as e:
+        logger.error(f"Failed to list tesseract languages: {e}")
+        return []
+
+def get_installed_languages(refresh=False):
+    """
+    获取已安装的Tesseract语言包，结果会被缓存
+    :param refresh: 为True时重新查询
+    :return: 语言代码列表
+    """
+    return list(_cached_tesseract_info('languages', _load_installed_languages, refresh))
+
+def ocr_image(image_source, lang='eng', preprocess=()):
+    """
+    对图片进行OCR识别，供Web服务调用
+    :param image_source: 图片路径、字节数据、文件对象或PIL图片
+    :param lang: 语言代码，'auto'表示自动检测
+    :param preprocess: 预处理步骤（preprocess.parse_stages的返回值）
+    :return: 识别的文本，没有文字时为空字符串
+    :raises OCRFailed: 识别出错时
+    """
+    text = image_to_text(image_source, lang, preprocess)
+    if text is None:
+        raise OCRFailed("OCR failed")
+    return text
+
+def save_to_text(text, output_path):
+    """
+    将文本保存为txt文件
+    :param text: 要保存的文本
+    :param output_path: 输出文件路径
+    :return: 输出文件路径
+    """
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(text or '')
+    return output_path
+
+def save_to_word(text, output_path):
+    """
+    将文本保存为Word文档
+    :param text: 要保存的文本
+    :param output_path: 输出文件路径
+    :return: 输出文件路径
+    """
+    if not text_to_word(text or '', output_path):
+        raise RuntimeError("生成Word文档失败")
+    return output_path
+
+def save_to_pdf(text, output_path):
+    """
+    将文本保存为PDF文档
+    :param text: 要保存的文本
+    :param output_path: 输出文件路径
+    :return: 输出文件路径
+    """
+    if not text_to_pdf(text or '', output_path):
+        raise RuntimeError("生成PDF文档失败")
+    return output_path
+
 def get_language_name(lang_code):
     """
     获取语言代码对应的中文名称